@@ -0,0 +1,44 @@
+"""
+Store dross, antimony and yield totals on existing refining entries.
+
+Refining entries written before these figures were stored lack them, and the
+summary and dross views read the stored values. This checks every refining
+entry against its batches and writes the totals where they are missing or
+disagree. Safe to run more than once; `--check` only reports.
+
+    python backfill_refining_totals.py [--check]
+"""
+import argparse
+import asyncio
+import os
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+load_dotenv()
+
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+DB_NAME = os.environ.get("DB_NAME", "leadtrack_db")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--check", action="store_true", help="report inconsistent entries without changing them")
+    args = parser.parse_args()
+
+    import server
+
+    client = AsyncIOMotorClient(MONGO_URL)
+    server.set_database(client[DB_NAME], client)
+    try:
+        result = await server.check_refining_totals(repair=not args.check)
+        print(f"Checked {result['checked']} refining entries: {result['mismatched']} inconsistent, "
+              f"{result['repaired']} repaired")
+        for entry_id in result['sample_entry_ids']:
+            print(f"  {entry_id}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,39 @@
+"""
+Store source_kind and sku_id on existing refining batches.
+
+Refining batches written before these fields existed only carry the
+input_source string. This registers any missing SKUs, then classifies every
+batch the way create_refining_entry does, so the summary and the indexed
+consumption queries see the old entries too. Safe to run more than once.
+
+    python backfill_source_kinds.py
+"""
+import asyncio
+import os
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+load_dotenv()
+
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+DB_NAME = os.environ.get("DB_NAME", "leadtrack_db")
+
+
+async def main():
+    import server
+
+    client = AsyncIOMotorClient(MONGO_URL)
+    server.set_database(client[DB_NAME], client)
+    try:
+        await server.ensure_indexes()
+        skus = await server.backfill_skus()
+        print(f"Registered {skus['skus']} SKUs; linked {skus['entries']} entries and {skus['sales']} sales")
+        updated = await server.backfill_source_kinds()
+        print(f"Classified the batches of {updated} refining entries")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,377 @@
+"""
+Benchmark the hot API paths in-process.
+
+The FastAPI app is driven through httpx's ASGI transport (no network, no
+uvicorn) against a local mongod (--mongo-url) or, by default, an in-memory
+Motor stand-in (mongomock-motor). For each dataset size the database is
+seeded with generate_dataset and every scenario is measured for sequential
+latency (p50/p95/p99), throughput at --concurrency and peak Python memory
+(tracemalloc, one request). Cached read routes are measured cold (cache
+cleared before every request) and warm. The large list payloads are also
+encoded with FastAPI's default JSON path and with the orjson response class
+to compare serialization cost alone.
+
+    python benchmark.py --sizes 500,5000 --output benchmark_results.json
+    python benchmark.py --sizes 500,5000 --compare benchmark_results.json
+
+With --compare the run exits with status 1 when any p50 regressed by more
+than --threshold percent. The in-memory stand-in is much slower than mongod
+for large collections, so only compare results taken with the same backend.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import server
+from responses import dumps as orjson_dumps
+from generate_dataset import DatasetGenerator, build_parser as dataset_parser, write_dataset
+
+ADMIN_NAME = "TT"
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 16
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="200,2000", help="comma-separated refining entry counts; other collections scale with it")
+    parser.add_argument("--mongo-url", default=None, help="benchmark against this MongoDB instead of the in-memory stand-in")
+    parser.add_argument("--db-name", default="leadtrack_benchmark")
+    parser.add_argument("--iterations", type=int, default=20, help="timed requests per scenario")
+    parser.add_argument("--warmup", type=int, default=2, help="untimed requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel requests in the throughput pass")
+    parser.add_argument("--image-bytes", type=int, default=50_000, help="size of each seeded and uploaded photo")
+    parser.add_argument("--scenarios", default=None, help="comma-separated scenario names (default: all)")
+    parser.add_argument("--skip-serialization", action="store_true", help="skip the JSON encoder comparison")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", default=None, help="previous results file to compare against")
+    parser.add_argument("--threshold", type=float, default=20.0, help="p50 regression in percent that fails --compare")
+    return parser.parse_args()
+
+
+def photos(count: int, size: int):
+    body = JPEG + b"\x00" * max(0, size - len(JPEG))
+    return [("files", (f"photo{i}.jpg", body, "image/jpeg")) for i in range(count)]
+
+
+def refining_request(args):
+    batches = [{
+        "input_source": "manual", "sb_percentage": 2.0,
+        "lead_ingot_kg": 500, "lead_ingot_pieces": 20,
+        "initial_dross_kg": 12, "cu_dross_kg": 4, "sn_dross_kg": 2, "sb_dross_kg": 3,
+        "pure_lead_kg": 470, "pure_lead_pieces": 19,
+    }] * 2
+    return {"data": {"batches_data": json.dumps(batches)}, "files": photos(12, args.image_bytes)}
+
+
+def recycling_request(args):
+    batches = [
+        {"battery_type": "PP", "battery_kg": 1000, "quantity_received": 250},
+        {"battery_type": "MC/SMF", "battery_kg": 800, "quantity_received": 0},
+    ]
+    return {"data": {"batches_data": json.dumps(batches)}, "files": photos(2, args.image_bytes)}
+
+
+def sale_request(args):
+    return {"json": {"party_name": "Benchmark Party", "sku_type": "Pure Lead", "quantity_kg": 1}}
+
+
+# name -> (method, path, cached route, request builder). Reads come first so
+# the write scenarios do not change what they see.
+SCENARIOS = {
+    "summary": ("GET", "/api/summary", True, None),
+    "summary_as_of": ("GET", "/api/summary?as_of=2025-06-30", True, None),
+    "available_skus": ("GET", "/api/sales/available-skus", True, None),
+    "rml_skus": ("GET", "/api/rml-purchases/skus", True, None),
+    "santosh_skus": ("GET", "/api/rml-received-santosh/skus", True, None),
+    "dross": ("GET", "/api/dross", True, None),
+    "sales_analytics": ("GET", "/api/sales/analytics", True, None),
+    "list_entries": ("GET", "/api/entries", False, None),
+    "list_sales": ("GET", "/api/sales", False, None),
+    "list_rml_purchases": ("GET", "/api/rml-purchases", False, None),
+    "list_dross_recycling": ("GET", "/api/dross-recycling/entries", False, None),
+    "history_refining": ("GET", "/api/history/search?type=refining&page_size=50", False, None),
+    "history_sales": ("GET", "/api/history/search?type=sale&party=a&page_size=50", False, None),
+    "export_entries": ("GET", "/api/entries/export/excel", False, None),
+    "export_dross": ("GET", "/api/dross/export/excel", False, None),
+    "create_refining": ("POST", "/api/refining/entries", False, refining_request),
+    "create_recycling": ("POST", "/api/recycling/entries", False, recycling_request),
+    "create_sale": ("POST", "/api/sales", False, sale_request),
+}
+
+
+# Payloads whose JSON encoding is compared between FastAPI's default encoder
+# and the orjson response class
+SERIALIZATION_PAYLOADS = {
+    "entries": "/api/entries",
+    "sales": "/api/sales",
+    "dross": "/api/dross",
+    "available_skus": "/api/sales/available-skus",
+}
+
+
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def dataset_options(size: int, args):
+    """generate_dataset options for `size` refining entries"""
+    options = dataset_parser().parse_args([])
+    options.seed = args.seed
+    options.refining = size
+    options.recycling = max(1, size // 2)
+    options.rml_purchases = max(5, size // 5)
+    options.santosh = max(2, size // 10)
+    options.dross_recycling = max(2, size // 5)
+    options.sales = max(1, size * 4 // 5)
+    options.image_bytes = args.image_bytes
+    return options
+
+
+async def open_database(args):
+    if args.mongo_url:
+        mongo_client = AsyncIOMotorClient(args.mongo_url)
+        return mongo_client, mongo_client[args.db_name]
+    try:
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        sys.exit("mongomock-motor is not installed; pass --mongo-url to benchmark against MongoDB")
+    mongo_client = AsyncMongoMockClient()
+    return mongo_client, mongo_client[args.db_name]
+
+
+async def seed_database(database, size: int, args) -> str:
+    """Load a fresh dataset and the admin user; returns the admin's token"""
+    for name in await database.list_collection_names():
+        await database[name].drop()
+    dataset = DatasetGenerator(dataset_options(size, args)).generate()
+    await write_dataset(database, dataset, chunk_size=1000, drop=False)
+    await server.ensure_indexes()
+    await server.rebuild_derived_data()
+    admin_id = "benchmark-admin"
+    await database.users.insert_one({
+        "id": admin_id, "name": ADMIN_NAME, "email": "benchmark@leadtrack.local",
+        "hashed_password": server.hash_password("benchmark"),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    })
+    return server.create_access_token({"sub": admin_id})
+
+
+async def send(http, method: str, path: str, builder, args):
+    kwargs = builder(args) if builder else {}
+    response = await http.request(method, path, **kwargs)
+    return response.status_code, len(response.content)
+
+
+async def measure(http, name: str, cold: bool, args) -> dict:
+    method, path, _cached, builder = SCENARIOS[name]
+
+    async def one():
+        if cold:
+            server.query_cache.clear()
+        start = time.perf_counter()
+        status, size = await send(http, method, path, builder, args)
+        return time.perf_counter() - start, status, size
+
+    for _ in range(args.warmup):
+        await one()
+
+    latencies, errors, response_bytes = [], 0, 0
+    for _ in range(args.iterations):
+        elapsed, status, size = await one()
+        latencies.append(elapsed)
+        errors += status >= 400
+        response_bytes = size
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited():
+        async with semaphore:
+            return await one()
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(limited() for _ in range(args.iterations)))
+    wall = time.perf_counter() - start
+    errors += sum(status >= 400 for _, status, _ in results)
+
+    tracemalloc.start()
+    try:
+        await one()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "iterations": args.iterations,
+        "errors": errors,
+        "response_bytes": response_bytes,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+        "throughput_rps": round(args.iterations / wall, 2) if wall else 0.0,
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
+
+
+def revive_timestamps(value):
+    """Turn timestamp strings back into the datetimes the routes hand to the encoder"""
+    if isinstance(value, list):
+        return [revive_timestamps(item) for item in value]
+    if isinstance(value, dict):
+        return {
+            key: datetime.fromisoformat(item) if key == "timestamp" and isinstance(item, str) else revive_timestamps(item)
+            for key, item in value.items()
+        }
+    return value
+
+
+def default_json(content) -> bytes:
+    """FastAPI's default path: jsonable_encoder followed by JSONResponse's json.dumps"""
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+async def measure_serialization(http, path: str, args) -> dict:
+    payload = revive_timestamps((await http.get(path)).json())
+    results = {}
+    for encoder_name, encode in (("default", default_json), ("orjson", orjson_dumps)):
+        timings = []
+        for _ in range(args.iterations):
+            start = time.perf_counter()
+            body = encode(payload)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        results[encoder_name] = {
+            "iterations": args.iterations,
+            "response_bytes": len(body),
+            "mean_ms": round(statistics.fmean(timings) * 1000, 3),
+            "p50_ms": round(percentile(timings, 0.5) * 1000, 3),
+            "p95_ms": round(percentile(timings, 0.95) * 1000, 3),
+            "max_ms": round(timings[-1] * 1000, 3),
+        }
+    return results
+
+
+async def run(args) -> dict:
+    selected = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    unknown = [name for name in selected if name not in SCENARIOS]
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+
+    mongo_client, database = await open_database(args)
+    server.set_database(database, mongo_client)
+    results = {}
+    try:
+        for size in [int(s) for s in args.sizes.split(",")]:
+            server.reset_caches()
+            token = await seed_database(database, size, args)
+            transport = httpx.ASGITransport(app=server.app)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://benchmark",
+                headers={"Authorization": f"Bearer {token}"}, timeout=None,
+            ) as http:
+                size_results = results[str(size)] = {}
+                for name in selected:
+                    variants = [(f"{name}_cold", True), (f"{name}_warm", False)] if SCENARIOS[name][2] else [(name, False)]
+                    for label, cold in variants:
+                        stats = await measure(http, name, cold, args)
+                        size_results[label] = stats
+                        print(f"[{size:>7}] {label:<26} p50 {stats['p50_ms']:>9.2f} ms  p95 {stats['p95_ms']:>9.2f} ms  "
+                              f"{stats['throughput_rps']:>8.1f} req/s  peak {stats['peak_memory_kb']:>9.1f} KiB"
+                              + (f"  errors {stats['errors']}" if stats['errors'] else ""))
+
+                if args.skip_serialization:
+                    continue
+                for name, path in SERIALIZATION_PAYLOADS.items():
+                    encoders = await measure_serialization(http, path, args)
+                    for encoder_name, stats in encoders.items():
+                        size_results[f"serialize_{name}_{encoder_name}"] = stats
+                    speedup = encoders["default"]["p50_ms"] / max(encoders["orjson"]["p50_ms"], 0.001)
+                    print(f"[{size:>7}] serialize_{name:<16} default p50 {encoders['default']['p50_ms']:>9.2f} ms  "
+                          f"orjson p50 {encoders['orjson']['p50_ms']:>9.2f} ms  {speedup:>6.1f}x  "
+                          f"{encoders['orjson']['response_bytes']:>10} bytes")
+    finally:
+        mongo_client.close()
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(previous: dict, current: dict, threshold: float) -> bool:
+    """Print p50 changes against a previous run; True when something regressed"""
+    regressed = False
+    print(f"\nComparison with {previous['meta'].get('revision') or 'previous run'} ({previous['meta']['backend']})")
+    for size, scenarios in current["results"].items():
+        for label, stats in scenarios.items():
+            before = previous["results"].get(size, {}).get(label)
+            if not before or not before["p50_ms"]:
+                continue
+            change = (stats["p50_ms"] - before["p50_ms"]) / before["p50_ms"] * 100
+            flag = ""
+            if change > threshold:
+                flag = "  REGRESSION"
+                regressed = True
+            print(f"[{size:>7}] {label:<26} {before['p50_ms']:>9.2f} -> {stats['p50_ms']:>9.2f} ms  {change:+7.1f}%{flag}")
+    return regressed
+
+
+def main():
+    args = parse_args()
+    results = asyncio.run(run(args))
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "revision": git_revision(),
+            "backend": "mongodb" if args.mongo_url else "mongomock",
+            "python": platform.python_version(),
+            "iterations": args.iterations,
+            "concurrency": args.concurrency,
+            "image_bytes": args.image_bytes,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if previous is not None:
+        if previous["meta"].get("backend") != report["meta"]["backend"]:
+            print("Warning: comparing results from different database backends")
+        if compare(previous, report, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Negotiated response compression (brotli or gzip).
+
+The encoding is picked from the request's Accept-Encoding, with brotli
+preferred at equal weight. Only textual content types (JSON, text, XML, JS)
+at or above COMPRESSION_MIN_BYTES (default 1024) are compressed. xlsx
+workbooks, JPEG photos and other already-compressed or binary types, and
+server-sent event streams, go out unchanged. A route opts out by being listed
+in `exclude_routes` or by setting its own Content-Encoding header.
+
+Compression of large chunks runs in a worker thread so a multi-megabyte
+history page does not stall the event loop. Ratios, byte counts and CPU
+time are exported through metrics.
+
+COMPRESSION_GZIP_LEVEL (default 6) and COMPRESSION_BROTLI_QUALITY (default 4)
+trade CPU for size.
+"""
+import asyncio
+import os
+import time
+import zlib
+
+import brotli
+
+from metrics import COMPRESSION_BYTES, COMPRESSION_CPU_SECONDS, COMPRESSION_RATIO, route_template
+
+MINIMUM_SIZE = int(os.environ.get('COMPRESSION_MIN_BYTES', 1024))
+GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 4))
+# Chunks at least this large are compressed off the event loop
+OFFLOAD_BYTES = 256 * 1024
+
+SUPPORTED_ENCODINGS = ("br", "gzip")  # in order of preference
+COMPRESSIBLE_TYPES = ("application/json", "application/javascript", "application/xml", "image/svg+xml")
+
+
+def negotiate_encoding(accept_encoding: str):
+    """Best supported encoding the client accepts, or None"""
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+    wildcard = weights.get("*", 0.0)
+    best, best_q = None, 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        q = weights.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def is_compressible(content_type: str) -> bool:
+    content_type = content_type.split(";", 1)[0].strip().lower()
+    if content_type == "text/event-stream":
+        return False
+    return (
+        content_type.startswith("text/")
+        or content_type in COMPRESSIBLE_TYPES
+        or content_type.endswith("+json")
+        or content_type.endswith("+xml")
+    )
+
+
+def vary_on_encoding(headers) -> list:
+    """`headers` with Accept-Encoding added to Vary"""
+    vary = [value for name, value in headers if name == b"vary"]
+    return [(name, value) for name, value in headers if name != b"vary"] + [(b"vary", b", ".join(vary + [b"Accept-Encoding"]))]
+
+
+def varies_on_encoding(headers: dict) -> bool:
+    """Whether the body of a response with these headers is compressed when the client accepts it"""
+    return b"content-encoding" not in headers and is_compressible(headers.get(b"content-type", b"").decode("latin-1"))
+
+
+class Compressor:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._process, self._finish = compressor.process, compressor.finish
+        else:
+            compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+            self._process, self._finish = compressor.compress, compressor.flush
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.cpu_seconds = 0.0
+
+    def _timed(self, func, *args) -> bytes:
+        start = time.thread_time()
+        output = func(*args)
+        self.cpu_seconds += time.thread_time() - start
+        return output
+
+    async def compress(self, data: bytes, final: bool) -> bytes:
+        self.input_bytes += len(data)
+        if len(data) >= OFFLOAD_BYTES:
+            output = await asyncio.to_thread(self._timed, self._process, data)
+        else:
+            output = self._timed(self._process, data)
+        if final:
+            output += self._timed(self._finish)
+        self.output_bytes += len(output)
+        return output
+
+
+class CompressionMiddleware:
+    """Pure ASGI so streamed JSON can be compressed chunk by chunk"""
+
+    def __init__(self, app, fastapi_app, exclude_routes=(), minimum_size: int = MINIMUM_SIZE):
+        self.app = app
+        self.fastapi_app = fastapi_app
+        self.exclude_routes = set(exclude_routes)
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        route = route_template(self.fastapi_app, scope)
+        if route in self.exclude_routes:
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(accept_encoding) if accept_encoding else None
+        if encoding is None:
+            # Not compressed for this client, but a shared cache must not serve it to one that accepts compression
+            async def vary_send(message):
+                if message["type"] == "http.response.start" and varies_on_encoding(dict(message.get("headers", []))):
+                    message = {**message, "headers": vary_on_encoding(message.get("headers", []))}
+                await send(message)
+
+            await self.app(scope, receive, vary_send)
+            return
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def compressing_send(message):
+            nonlocal start_message, compressor, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                if not varies_on_encoding(dict(message.get("headers", []))):
+                    passthrough = True
+                    await send(message)
+                else:
+                    start_message = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send({**start_message, "headers": vary_on_encoding(start_message.get("headers", []))})
+                    await send(message)
+                    return
+                compressor = Compressor(encoding)
+                headers = [
+                    (name, value) for name, value in vary_on_encoding(start_message.get("headers", []))
+                    if name != b"content-length"
+                ]
+                headers.append((b"content-encoding", encoding.encode()))
+                if not more_body:
+                    compressed = await compressor.compress(body, final=True)
+                    headers.append((b"content-length", str(len(compressed)).encode()))
+                    await send({**start_message, "headers": headers})
+                    await send({"type": "http.response.body", "body": compressed})
+                    self.record(route, compressor)
+                    return
+                await send({**start_message, "headers": headers})
+
+            compressed = await compressor.compress(body, final=not more_body)
+            await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+            if not more_body:
+                self.record(route, compressor)
+
+        await self.app(scope, receive, compressing_send)
+
+    @staticmethod
+    def record(route: str, compressor: Compressor):
+        encoding = compressor.encoding
+        COMPRESSION_BYTES.labels(encoding, "in").inc(compressor.input_bytes)
+        COMPRESSION_BYTES.labels(encoding, "out").inc(compressor.output_bytes)
+        COMPRESSION_CPU_SECONDS.labels(encoding, route).observe(compressor.cpu_seconds)
+        if compressor.input_bytes:
+            COMPRESSION_RATIO.labels(encoding, route).observe(compressor.output_bytes / compressor.input_bytes)
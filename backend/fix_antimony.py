@@ -3,6 +3,7 @@ Script to fix existing refining entries that used RML SKUs but didn't have SB pe
 This will look up the SB percentage from the RML purchase and update the refining entry.
 """
 import asyncio
+import sys
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from dotenv import load_dotenv
@@ -13,6 +14,8 @@ MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
 DB_NAME = os.environ.get("DB_NAME", "leadtrack_db")
 
 async def fix_refining_entries():
+    from server import calculate_refining_batch_totals, calculate_refining_entry_totals
+
     client = AsyncIOMotorClient(MONGO_URL)
     db = client[DB_NAME]
     
@@ -30,31 +33,54 @@ async def fix_refining_entries():
     for sku, sb in sku_to_sb.items():
         print(f"  {sku}: {sb}%")
     
-    # Get all refining entries
-    refining_entries = await db.entries.find({"entry_type": "refining"}, {"_id": 0}).to_list(10000)
+    # Refining entries with an RML purchase batch (source_kind is set by backfill_source_kinds.py).
+    # Without the backfill the filter below matches nothing, so refuse to run.
+    unclassified = await db.entries.count_documents(
+        {"entry_type": "refining", "batches": {"$elemMatch": {"source_kind": {"$exists": False}}}}
+    )
+    if unclassified:
+        client.close()
+        sys.exit(f"{unclassified} refining entries have batches without source_kind; "
+                 "run backfill_source_kinds.py first")
+
+    refining_entries = await db.entries.find(
+        {"entry_type": "refining", "batches.source_kind": "rml_purchase"}, {"_id": 0}
+    ).to_list(10000)
     
     updated_count = 0
     for entry in refining_entries:
         needs_update = False
-        for batch in entry.get('batches', []):
+        for index, batch in enumerate(entry.get('batches', [])):
             input_source = batch.get('input_source', 'manual')
             sb_percentage = batch.get('sb_percentage')
             
-            # If it's an RML SKU (not manual, not SANTOSH) and no SB%, try to fill it
-            if input_source not in ['manual', 'SANTOSH'] and sb_percentage is None:
+            # If it's an RML SKU and no SB%, try to fill it
+            if batch.get('source_kind') == 'rml_purchase' and sb_percentage is None:
                 if input_source in sku_to_sb:
                     batch['sb_percentage'] = sku_to_sb[input_source]
                     needs_update = True
+                    # Antimony is stored per batch; keep it and the flattened batch row in step
+                    batch.update(calculate_refining_batch_totals(batch))
+                    await db.batches.update_one(
+                        {"id": f"{entry['id']}:{index}"},
+                        {"$set": {"sb_percentage": batch['sb_percentage'], "antimony_kg": batch['antimony_kg']}}
+                    )
                     print(f"Updating entry {entry['id']}: Setting SB% to {sku_to_sb[input_source]} for {input_source}")
         
         if needs_update:
             await db.entries.update_one(
                 {"id": entry['id']},
-                {"$set": {"batches": entry['batches']}}
+                {"$set": {"batches": entry['batches'], "totals": calculate_refining_entry_totals(entry['batches'])}}
             )
             updated_count += 1
     
     print(f"\nUpdated {updated_count} refining entries")
+    if updated_count:
+        # The changed antimony figures go into the inventory event log as adjustments
+        import server
+        server.set_database(db, client)
+        result = await server.reconcile_inventory_events()
+        print(f"Appended {result['events']} inventory events")
     
     # Verify by checking summary calculation
     total_antimony = 0
@@ -0,0 +1,369 @@
+"""
+Generate a realistic synthetic dataset for scale testing.
+
+Writes refining batches (with plausible dross ratios and SB%), recycling
+batches by battery type, RML purchase and Santosh lots with the same SKU
+strings the API generates, dross recycling entries and sales. Lots are
+consumed in date order, so stock never goes negative. The output is fully
+determined by --seed and the counts.
+
+    python generate_dataset.py --seed 7 --refining 50000 --recycling 20000 --drop
+"""
+import argparse
+import asyncio
+import base64
+import os
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+load_dotenv()
+
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+DB_NAME = os.environ.get("DB_NAME", "leadtrack_db")
+
+DATA_COLLECTIONS = ["entries", "dross_recycling_entries", "rml_purchases", "rml_received_santosh", "sales"]
+# Rebuilt from the data collections after loading
+DERIVED_COLLECTIONS = ["skus", "lots", "batches", "inventory_events", "inventory_snapshots", "inventory_dated_snapshots"]
+
+OPERATORS = ["Ramesh", "Suresh", "Vikram", "Anil", "Deepak", "Manoj", "Rakesh", "Sunil", "Ajay", "Pradeep"]
+SELLERS = ["Gupta Metals", "Shree Traders", "Balaji Alloys", "Jain Scrap", "Krishna Lead", "Om Industries"]
+SANTOSH_REMARKS = ["SANTOSH", "Santosh Kanpur", "Santosh Unit 2"]
+PARTIES = [
+    "Exide Dealer", "Amara Batteries", "Luminous Works", "Okaya Power", "Tata Green",
+    "Southern Cables", "Bharat Alloys", "Metro Solder", "Prakash Traders", "Sai Industries",
+]
+BATTERY_TYPES = [("PP", 0.5), ("MC/SMF", 0.35), ("HR", 0.15)]
+# Default RecoverySettings percentages
+RECOVERY_PERCENT = {"PP": 60.5, "MC/SMF": 57.5, "HR": 50.0}
+DROSS_TYPES = ["initial", "2nd", "3rd"]
+# Lots with less than this left are treated as used up
+MIN_LOT_KG = 50
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--refining", type=int, default=1000, help="refining entries")
+    parser.add_argument("--recycling", type=int, default=500, help="recycling entries")
+    parser.add_argument("--rml-purchases", type=int, default=200, help="RML purchase entries")
+    parser.add_argument("--santosh", type=int, default=100, help="RML received from Santosh entries")
+    parser.add_argument("--dross-recycling", type=int, default=200, help="dross recycling entries")
+    parser.add_argument("--sales", type=int, default=800, help="sales")
+    parser.add_argument("--max-batches", type=int, default=3, help="maximum batches per entry")
+    parser.add_argument("--days", type=int, default=365, help="days of history")
+    parser.add_argument("--end-date", default="2025-12-31", help="last day of history (YYYY-MM-DD)")
+    parser.add_argument("--image-bytes", type=int, default=2048, help="size of each stored photo before base64")
+    parser.add_argument("--image-pool", type=int, default=16, help="distinct photos to reuse")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="documents per insert_many")
+    parser.add_argument("--drop", action="store_true", help="delete existing data entries first")
+    parser.add_argument("--db-name", default=DB_NAME)
+    return parser
+
+
+class LotPool:
+    """RML and Santosh lots that are open for consumption at the current replay time"""
+
+    def __init__(self, lots):
+        self.pending = sorted(lots, key=lambda lot: lot["when"])
+        self.next = 0
+        self.open = {False: [], True: []}
+
+    def advance(self, when: datetime):
+        while self.next < len(self.pending) and self.pending[self.next]["when"] <= when:
+            lot = self.pending[self.next]
+            self.open[lot["santosh"]].append(lot)
+            self.next += 1
+
+    def pick(self, rng: random.Random, santosh: bool):
+        lots = self.open[santosh]
+        while lots:
+            idx = rng.randrange(len(lots))
+            lot = lots[idx]
+            if lot["remaining"] >= MIN_LOT_KG:
+                return lot
+            lots[idx] = lots[-1]
+            lots.pop()
+        return None
+
+
+class DatasetGenerator:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        end = datetime.fromisoformat(args.end_date).replace(tzinfo=timezone.utc)
+        self.start = end - timedelta(days=args.days - 1)
+        self.images = [
+            base64.b64encode(self.rng.randbytes(args.image_bytes)).decode("utf-8")
+            for _ in range(max(1, args.image_pool))
+        ]
+        self.users = [{"id": self.uuid(), "name": name} for name in OPERATORS]
+
+    def uuid(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def image(self) -> str:
+        return self.rng.choice(self.images)
+
+    def moment(self) -> datetime:
+        day = self.rng.randrange(self.args.days)
+        seconds = self.rng.randrange(8 * 3600, 20 * 3600)
+        return self.start + timedelta(days=day, seconds=seconds)
+
+    def batch_count(self) -> int:
+        return self.rng.randint(1, max(1, self.args.max_batches))
+
+    def entry(self, when: datetime, batches, **fields) -> dict:
+        user = self.rng.choice(self.users)
+        doc = {
+            "id": self.uuid(),
+            "user_id": user["id"],
+            "user_name": user["name"],
+            **fields,
+            "batches": batches,
+            "timestamp": when.isoformat(),
+        }
+        for batch in batches:
+            batch["timestamp"] = when.isoformat()
+        return doc
+
+    def rml_purchases(self):
+        from server import sku_label
+
+        entries, lots = [], []
+        for _ in range(self.args.rml_purchases):
+            when = self.moment()
+            batches = []
+            for _ in range(self.batch_count()):
+                seller = self.rng.choice(SELLERS)
+                sb = round(self.rng.uniform(0.5, 4.0), 1)
+                quantity = round(self.rng.uniform(500, 5000), 1)
+                sku = sku_label("rml_purchase", seller, sb, when.strftime('%Y-%m-%d'))
+                batches.append({
+                    "quantity_kg": quantity,
+                    "pieces": max(1, int(quantity / 25)),
+                    "sb_percentage": sb,
+                    "remarks": seller,
+                    "image": self.image(),
+                    "sku": sku,
+                })
+                lots.append({"sku": sku, "sb": sb, "when": when, "remaining": quantity, "santosh": False})
+            entries.append(self.entry(when, batches, entry_type="rml_purchase"))
+        return entries, lots
+
+    def santosh_receipts(self):
+        from server import sku_label
+
+        entries, lots = [], []
+        for _ in range(self.args.santosh):
+            when = self.moment()
+            batches = []
+            for _ in range(self.batch_count()):
+                remarks = self.rng.choice(SANTOSH_REMARKS)
+                sb = round(self.rng.uniform(0.5, 3.0), 1)
+                quantity = round(self.rng.uniform(200, 2000), 1)
+                sku = sku_label("rml_received_santosh", remarks, sb, when.strftime('%Y-%m-%d'))
+                batches.append({
+                    "quantity_kg": quantity,
+                    "pieces": max(1, int(quantity / 25)),
+                    "sb_percentage": sb,
+                    "remarks": remarks,
+                    "image": self.image(),
+                    "sku": sku,
+                })
+                lots.append({"sku": sku, "sb": sb, "when": when, "remaining": quantity, "santosh": True})
+            entries.append(self.entry(when, batches))
+        return entries, lots
+
+    def recycling(self):
+        entries = []
+        types = [t for t, _ in BATTERY_TYPES]
+        weights = [w for _, w in BATTERY_TYPES]
+        for _ in range(self.args.recycling):
+            when = self.moment()
+            batches = []
+            for _ in range(self.batch_count()):
+                battery_type = self.rng.choices(types, weights)[0]
+                battery_kg = round(self.rng.uniform(500, 5000), 1)
+                remelted = battery_kg * RECOVERY_PERCENT[battery_type] / 100
+                received = round(remelted * self.rng.uniform(0.3, 1.0), 1) if self.rng.random() < 0.6 else 0
+                batches.append({
+                    "battery_type": battery_type,
+                    "battery_kg": battery_kg,
+                    "battery_image": self.image(),
+                    "quantity_received": received,
+                    "remelted_lead_kg": round(remelted, 2),
+                    "receivable_kg": round(remelted - received, 2),
+                    "recovery_percent": round(received / battery_kg * 100, 2),
+                    "remelted_lead_image": self.image() if received else "",
+                })
+            entries.append(self.entry(when, batches, entry_type="recycling"))
+        return entries
+
+    def dross_recycling(self):
+        entries = []
+        for _ in range(self.args.dross_recycling):
+            when = self.moment()
+            batches = []
+            for _ in range(self.batch_count()):
+                sent = round(self.rng.uniform(100, 1000), 1)
+                batches.append({
+                    "dross_type": self.rng.choice(DROSS_TYPES),
+                    "quantity_sent": sent,
+                    "high_lead_recovered": round(sent * self.rng.uniform(0.5, 0.8), 1),
+                    "spectro_image": self.image(),
+                })
+            entries.append(self.entry(when, batches))
+        return entries
+
+    def refining_batch(self, pool: LotPool) -> dict:
+        roll = self.rng.random()
+        lot = None
+        if roll < 0.6:
+            lot = pool.pick(self.rng, santosh=False)
+        elif roll < 0.8:
+            lot = pool.pick(self.rng, santosh=True)
+
+        lead = round(self.rng.uniform(300, 2000), 1)
+        if lot:
+            lead = min(lead, round(lot["remaining"], 1))
+            lot["remaining"] -= lead
+            input_source, sb = lot["sku"], lot["sb"]
+        else:
+            input_source, sb = "manual", None
+
+        initial = round(lead * self.rng.uniform(0.02, 0.05), 1)
+        cu = round(lead * self.rng.uniform(0.005, 0.02), 1)
+        sn = round(lead * self.rng.uniform(0.002, 0.01), 1)
+        # Antimony dross follows the SB% of the input lead
+        sb_ratio = (sb / 100 * self.rng.uniform(1.5, 3.0)) if sb else self.rng.uniform(0.005, 0.02)
+        sb_dross = round(lead * sb_ratio, 1)
+        loss = lead * self.rng.uniform(0.005, 0.015)
+        pure = round(max(0.0, lead - initial - cu - sn - sb_dross - loss), 1)
+        return {
+            "input_source": input_source,
+            "sb_percentage": sb,
+            "lead_ingot_kg": lead,
+            "lead_ingot_pieces": max(1, int(lead / 25)),
+            "lead_ingot_image": self.image(),
+            "initial_dross_kg": initial,
+            "initial_dross_image": self.image(),
+            "cu_dross_kg": cu,
+            "cu_dross_image": self.image(),
+            "sn_dross_kg": sn,
+            "sn_dross_image": self.image(),
+            "sb_dross_kg": sb_dross,
+            "sb_dross_image": self.image(),
+            "dross_remarks": "",
+            "pure_lead_kg": pure,
+            "pure_lead_pieces": max(1, int(pure / 25)),
+            "pure_lead_image": self.image(),
+        }
+
+    def refining_and_sales(self, lots, dross_entries):
+        """Replay refining and sales in date order so sales only draw on stock that exists"""
+        events = [(self.moment(), "refining") for _ in range(self.args.refining)]
+        events += [(self.moment(), "sale") for _ in range(self.args.sales)]
+        events.sort(key=lambda event: event[0])
+
+        high_lead_events = sorted(
+            (datetime.fromisoformat(entry["timestamp"]), sum(b["high_lead_recovered"] for b in entry["batches"]))
+            for entry in dross_entries
+        )
+        high_lead_idx = 0
+        pool = LotPool(lots)
+        pure_lead_stock = 0.0
+        high_lead_stock = 0.0
+
+        refining_entries, sales = [], []
+        for when, kind in events:
+            pool.advance(when)
+            while high_lead_idx < len(high_lead_events) and high_lead_events[high_lead_idx][0] <= when:
+                high_lead_stock += high_lead_events[high_lead_idx][1]
+                high_lead_idx += 1
+
+            if kind == "refining":
+                batches = [self.refining_batch(pool) for _ in range(self.batch_count())]
+                pure_lead_stock += sum(batch["pure_lead_kg"] for batch in batches)
+                refining_entries.append(self.entry(when, batches, entry_type="refining"))
+                continue
+
+            quantity = round(self.rng.uniform(100, 2000), 1)
+            roll = self.rng.random()
+            lot = pool.pick(self.rng, santosh=False) if roll >= 0.75 else None
+            if lot:
+                quantity = min(quantity, round(lot["remaining"], 1))
+                lot["remaining"] -= quantity
+                sku_type = lot["sku"]
+            elif 0.6 <= roll < 0.75 and high_lead_stock >= MIN_LOT_KG:
+                quantity = min(quantity, high_lead_stock)
+                high_lead_stock -= quantity
+                sku_type = "High Lead"
+            elif pure_lead_stock >= MIN_LOT_KG:
+                quantity = min(quantity, pure_lead_stock)
+                pure_lead_stock -= quantity
+                sku_type = "Pure Lead"
+            else:
+                continue
+
+            user = self.rng.choice(self.users)
+            sales.append({
+                "id": self.uuid(),
+                "user_id": user["id"],
+                "user_name": user["name"],
+                "party_name": self.rng.choice(PARTIES),
+                "sku_type": sku_type,
+                "quantity_kg": round(quantity, 1),
+                "entry_date": when.strftime("%Y-%m-%d"),
+                "timestamp": when.isoformat(),
+            })
+        return refining_entries, sales
+
+    def generate(self) -> dict:
+        rml_entries, rml_lots = self.rml_purchases()
+        santosh_entries, santosh_lots = self.santosh_receipts()
+        recycling_entries = self.recycling()
+        dross_entries = self.dross_recycling()
+        refining_entries, sales = self.refining_and_sales(rml_lots + santosh_lots, dross_entries)
+        return {
+            "entries": refining_entries + recycling_entries,
+            "dross_recycling_entries": dross_entries,
+            "rml_purchases": rml_entries,
+            "rml_received_santosh": santosh_entries,
+            "sales": sales,
+        }
+
+
+async def write_dataset(db, dataset: dict, chunk_size: int, drop: bool):
+    if drop:
+        for name in DATA_COLLECTIONS + DERIVED_COLLECTIONS:
+            result = await db[name].delete_many({})
+            print(f"Deleted {result.deleted_count} documents from {name}")
+    for name, docs in dataset.items():
+        for start in range(0, len(docs), chunk_size):
+            await db[name].insert_many(docs[start:start + chunk_size], ordered=False)
+        print(f"Inserted {len(docs)} documents into {name}")
+
+
+async def main():
+    args = build_parser().parse_args()
+    dataset = DatasetGenerator(args).generate()
+    client = AsyncIOMotorClient(MONGO_URL)
+    try:
+        await write_dataset(client[args.db_name], dataset, args.chunk_size, args.drop)
+        # The SKU registry, lots, batch rows and inventory events are derived from the entries
+        import server
+        server.set_database(client[args.db_name], client)
+        await server.ensure_indexes()
+        result = await server.rebuild_derived_data()
+        print(f"Built {result['skus']} SKUs, {result['lots']} lots, {result['batch_rows']} batch rows "
+              f"and {result['inventory_events']} inventory events")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
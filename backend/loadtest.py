@@ -0,0 +1,331 @@
+"""
+Load-test a running backend with simulated operators at shift change.
+
+Every virtual operator logs in with its own account and HTTP connection, then
+loops over a weighted mix of dashboard summary polls, history pages, SKU
+look-ups, multi-photo refining and recycling submissions and exports, with
+exponential think time between actions. The number of active operators follows
+--stages, a list of duration:target steps ramped linearly (k6 style), so
+"1m:40,5m:40,30s:0" ramps to 40 operators over a minute, holds for five and
+drains over thirty seconds.
+
+Start MongoDB and the server locally first, optionally seeding data:
+
+    python generate_dataset.py --refining 5000 --drop
+    uvicorn server:app --port 8001
+    python loadtest.py --base-url http://localhost:8001 --stages 1m:40,5m:40,30s:0
+
+The admin account (TT) creates the load-test operator accounts if they are
+missing. Latency percentiles (p50/p95/p99), throughput and error rate are
+reported per route, and --output writes them as JSON.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import httpx
+
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 16
+OPERATOR_EMAIL = "loadtest-operator-{}@leadtrack.com"
+REPORT_EVERY_SECONDS = 10
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--stages", default="30s:10,2m:10,30s:0", help="comma-separated duration:operators ramp steps")
+    parser.add_argument("--admin-email", default="tt@leadtrack.com")
+    parser.add_argument("--admin-password", default=os.environ.get("LOADTEST_ADMIN_PASSWORD"),
+                        help="defaults to $LOADTEST_ADMIN_PASSWORD")
+    parser.add_argument("--operator-password", default="loadtest123")
+    parser.add_argument("--think-time", type=float, default=2.0, help="mean seconds between an operator's actions")
+    parser.add_argument("--photo-bytes", type=int, default=300_000, help="size of each uploaded photo")
+    parser.add_argument("--timeout", type=float, default=60.0, help="request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default=None, help="write the per-route report as JSON")
+    return parser.parse_args()
+
+
+def parse_duration(text: str) -> float:
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    for suffix in ("ms", "s", "m", "h"):
+        if text.endswith(suffix):
+            return float(text[:-len(suffix)]) * units[suffix]
+    return float(text)
+
+
+def parse_stages(text: str):
+    stages = []
+    for step in text.split(","):
+        duration, target = step.split(":")
+        stages.append((parse_duration(duration.strip()), int(target)))
+    return stages
+
+
+def target_at(stages, elapsed: float):
+    """Operators wanted `elapsed` seconds into the run, or None when the run is over"""
+    previous = 0
+    for duration, target in stages:
+        if elapsed < duration:
+            return round(previous + (target - previous) * elapsed / duration) if duration else target
+        elapsed -= duration
+        previous = target
+    return None
+
+
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_samples = {}
+        self.started = time.monotonic()
+
+    def record(self, route: str, elapsed: float, error: str = None):
+        self.latencies[route].append(elapsed)
+        if error:
+            self.errors[route] += 1
+            self.error_samples.setdefault(route, error)
+
+    def report(self) -> dict:
+        duration = time.monotonic() - self.started
+        routes = {}
+        for route, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            routes[route] = {
+                "requests": len(values),
+                "errors": self.errors[route],
+                "error_rate": round(self.errors[route] / len(values), 4),
+                "rps": round(len(values) / duration, 2) if duration else 0.0,
+                "mean_ms": round(statistics.fmean(values) * 1000, 1),
+                "p50_ms": round(percentile(values, 0.5) * 1000, 1),
+                "p95_ms": round(percentile(values, 0.95) * 1000, 1),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 1),
+                "max_ms": round(values[-1] * 1000, 1),
+                "first_error": self.error_samples.get(route),
+            }
+        return {"duration_seconds": round(duration, 1), "routes": routes}
+
+
+class Operator:
+    def __init__(self, index: int, args, stats: Stats, rng: random.Random):
+        self.index = index
+        self.args = args
+        self.stats = stats
+        self.rng = rng
+        self.http = httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout)
+        self.photo = JPEG + b"\x00" * max(0, args.photo_bytes - len(JPEG))
+        self.rml_skus = []
+        # (weight, action) - dashboards are polled far more often than forms are submitted
+        self.actions = [
+            (30, self.poll_summary),
+            (10, self.available_skus),
+            (20, self.history_page),
+            (8, self.refining_form),
+            (12, self.submit_refining),
+            (12, self.submit_recycling),
+            (5, self.dross_report),
+            (3, self.export),
+        ]
+
+    async def request(self, route: str, method: str, path: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.http.request(method, path, **kwargs)
+        except httpx.HTTPError as e:
+            self.stats.record(route, time.perf_counter() - start, f"{type(e).__name__}: {e}")
+            return None
+        elapsed = time.perf_counter() - start
+        error = f"HTTP {response.status_code}: {response.text[:200]}" if response.status_code >= 400 else None
+        self.stats.record(route, elapsed, error)
+        return None if error else response
+
+    async def login(self) -> bool:
+        response = await self.request(
+            "POST /api/auth/login", "POST", "/api/auth/login",
+            json={"email": OPERATOR_EMAIL.format(self.index), "password": self.args.operator_password},
+        )
+        if response is None:
+            return False
+        self.http.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+        return True
+
+    async def poll_summary(self):
+        await self.request("GET /api/summary", "GET", "/api/summary")
+
+    async def available_skus(self):
+        await self.request("GET /api/sales/available-skus", "GET", "/api/sales/available-skus")
+
+    async def history_page(self):
+        path = self.rng.choice(["/api/entries", "/api/sales", "/api/rml-purchases", "/api/dross-recycling/entries"])
+        await self.request(f"GET {path}", "GET", path)
+
+    async def refining_form(self):
+        response = await self.request("GET /api/rml-purchases/skus", "GET", "/api/rml-purchases/skus")
+        if response is not None:
+            self.rml_skus = [sku["sku"] for sku in response.json()]
+
+    async def dross_report(self):
+        await self.request("GET /api/dross", "GET", "/api/dross")
+
+    async def export(self):
+        path = self.rng.choice(["/api/entries/export/excel", "/api/dross/export/excel"])
+        await self.request(f"GET {path}", "GET", path)
+
+    def photos(self, count: int):
+        return [("files", (f"photo{i}.jpg", self.photo, "image/jpeg")) for i in range(count)]
+
+    async def submit_refining(self):
+        batches = []
+        for _ in range(self.rng.randint(1, 3)):
+            lead_ingot_kg = self.rng.randint(300, 900)
+            dross = [round(lead_ingot_kg * self.rng.uniform(0.005, 0.02), 1) for _ in range(4)]
+            batches.append({
+                "input_source": self.rng.choice(self.rml_skus) if self.rml_skus and self.rng.random() < 0.5 else "manual",
+                "sb_percentage": round(self.rng.uniform(0.5, 3.5), 2),
+                "lead_ingot_kg": lead_ingot_kg,
+                "lead_ingot_pieces": lead_ingot_kg // 25,
+                "initial_dross_kg": dross[0],
+                "cu_dross_kg": dross[1],
+                "sn_dross_kg": dross[2],
+                "sb_dross_kg": dross[3],
+                "pure_lead_kg": round(lead_ingot_kg - sum(dross), 1),
+                "pure_lead_pieces": lead_ingot_kg // 25,
+            })
+        await self.request(
+            "POST /api/refining/entries", "POST", "/api/refining/entries",
+            data={"batches_data": json.dumps(batches)}, files=self.photos(6 * len(batches)),
+        )
+
+    async def submit_recycling(self):
+        batches = [
+            {
+                "battery_type": self.rng.choice(["PP", "MC/SMF", "HR"]),
+                "battery_kg": self.rng.randint(500, 3000),
+                "quantity_received": 0,
+            }
+            for _ in range(self.rng.randint(1, 3))
+        ]
+        await self.request(
+            "POST /api/recycling/entries", "POST", "/api/recycling/entries",
+            data={"batches_data": json.dumps(batches)}, files=self.photos(len(batches)),
+        )
+
+    async def run(self, active):
+        """Work until `active()` says this operator has been ramped down"""
+        try:
+            # Staggered arrivals so a ramp step is not one synchronized burst
+            await asyncio.sleep(self.rng.uniform(0, 1))
+            if not await self.login():
+                return
+            # The dashboard is the first screen after logging in
+            await self.poll_summary()
+            weights = [weight for weight, _ in self.actions]
+            while active():
+                await asyncio.sleep(self.rng.expovariate(1 / self.args.think_time))
+                if not active():
+                    break
+                action = self.rng.choices(self.actions, weights=weights)[0][1]
+                await action()
+        finally:
+            await self.http.aclose()
+
+
+async def ensure_operator_accounts(args, count: int):
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout) as http:
+        response = await http.post("/api/auth/login", json={"email": args.admin_email, "password": args.admin_password})
+        response.raise_for_status()
+        http.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+        existing = {user["email"] for user in (await http.get("/api/admin/users")).json()}
+        for index in range(count):
+            email = OPERATOR_EMAIL.format(index)
+            if email in existing:
+                continue
+            response = await http.post("/api/admin/users", json={
+                "name": f"Load Operator {index}", "email": email, "password": args.operator_password,
+            })
+            response.raise_for_status()
+
+
+def print_report(report: dict):
+    print(f"\n{'route':<40} {'reqs':>7} {'err%':>6} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for route, stats in report["routes"].items():
+        print(f"{route:<40} {stats['requests']:>7} {stats['error_rate'] * 100:>6.2f} {stats['rps']:>7.2f} "
+              f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['max_ms']:>8.1f}")
+    for route, stats in report["routes"].items():
+        if stats["first_error"]:
+            print(f"First error on {route}: {stats['first_error']}")
+
+
+async def run(args) -> dict:
+    stages = parse_stages(args.stages)
+    peak = max(target for _, target in stages)
+    await ensure_operator_accounts(args, peak)
+
+    rng = random.Random(args.seed)
+    stats = Stats()
+    tasks = {}
+    state = {"target": 0}
+    start = time.monotonic()
+    last_report = start
+
+    while True:
+        target = target_at(stages, time.monotonic() - start)
+        if target is None:
+            break
+        state["target"] = target
+        for index in range(target):
+            task = tasks.get(index)
+            if task is None or task.done():
+                operator = Operator(index, args, stats, random.Random(rng.getrandbits(64)))
+                tasks[index] = asyncio.create_task(operator.run(lambda index=index: index < state["target"]))
+
+        now = time.monotonic()
+        if now - last_report >= REPORT_EVERY_SECONDS:
+            last_report = now
+            requests = sum(len(values) for values in stats.latencies.values())
+            errors = sum(stats.errors.values())
+            running = sum(not task.done() for task in tasks.values())
+            print(f"{now - start:7.0f}s  operators {running:>4}  requests {requests:>8}  errors {errors:>6}")
+        await asyncio.sleep(0.5)
+
+    state["target"] = 0
+    await asyncio.gather(*tasks.values(), return_exceptions=True)
+    report = stats.report()
+    report["meta"] = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "base_url": args.base_url,
+        "stages": args.stages,
+        "peak_operators": peak,
+        "think_time": args.think_time,
+        "photo_bytes": args.photo_bytes,
+    }
+    return report
+
+
+def main():
+    args = parse_args()
+    if not args.admin_password:
+        raise SystemExit("Pass --admin-password or set LOADTEST_ADMIN_PASSWORD")
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
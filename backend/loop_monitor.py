@@ -0,0 +1,108 @@
+"""
+Event-loop lag monitor and blocking-call detector.
+
+A coroutine sleeps for a fixed interval and records how late it wakes up
+(the loop lag). A watchdog thread notices when that coroutine has not run for
+longer than the blocking threshold and captures the event-loop thread's stack
+at that moment, which points at the code that is holding the loop (bcrypt,
+base64 of uploads, openpyxl, ...).
+
+LOOP_LAG_INTERVAL_MS (default 100) and LOOP_BLOCKING_THRESHOLD_MS (default
+200) tune the monitor.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timezone
+
+from metrics import EVENT_LOOP_BLOCKED, EVENT_LOOP_LAG, EVENT_LOOP_LAG_QUANTILE
+
+LAG_INTERVAL_SECONDS = float(os.environ.get('LOOP_LAG_INTERVAL_MS', 100)) / 1000
+BLOCKING_THRESHOLD_SECONDS = float(os.environ.get('LOOP_BLOCKING_THRESHOLD_MS', 200)) / 1000
+LAG_WINDOW = 600  # samples kept for percentiles (one minute at the default interval)
+QUANTILES = (0.5, 0.95, 0.99)
+QUANTILE_UPDATE_EVERY = 10  # ticks
+RECENT_BLOCKING_EVENTS = 50
+
+logger = logging.getLogger("event_loop")
+
+
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class LoopMonitor:
+    def __init__(self, interval: float = LAG_INTERVAL_SECONDS, threshold: float = BLOCKING_THRESHOLD_SECONDS):
+        self.interval = interval
+        self.threshold = threshold
+        self.lags = deque(maxlen=LAG_WINDOW)
+        self.blocking_events = deque(maxlen=RECENT_BLOCKING_EVENTS)
+        self._tick = 0
+        self._tick_started = time.monotonic()
+        self._loop_thread_id = None
+        self._stop = threading.Event()
+        self._watchdog = None
+
+    def percentiles(self) -> dict:
+        values = sorted(self.lags)
+        return {f"p{int(q * 100)}": round(percentile(values, q) * 1000, 2) for q in QUANTILES}
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        try:
+            while True:
+                self._tick_started = time.monotonic()
+                self._tick += 1
+                started = loop.time()
+                await asyncio.sleep(self.interval)
+                lag = max(0.0, loop.time() - started - self.interval)
+                self.lags.append(lag)
+                EVENT_LOOP_LAG.observe(lag)
+                if self._tick % QUANTILE_UPDATE_EVERY == 0:
+                    values = sorted(self.lags)
+                    for q in QUANTILES:
+                        EVENT_LOOP_LAG_QUANTILE.labels(str(q)).set(percentile(values, q))
+        finally:
+            self._stop.set()
+
+    def _watch(self):
+        reported_tick = None
+        while not self._stop.wait(self.threshold / 2):
+            tick = self._tick
+            stalled_for = time.monotonic() - self._tick_started - self.interval
+            if stalled_for < self.threshold or tick == reported_tick:
+                continue
+            reported_tick = tick
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+            self.blocking_events.append({
+                "at": datetime.now(timezone.utc).isoformat(),
+                "blocked_ms": round(stalled_for * 1000, 2),
+                "stack": stack,
+            })
+            EVENT_LOOP_BLOCKED.inc()
+            logger.warning("Event loop blocked for %.0f ms:\n%s", stalled_for * 1000, stack)
+
+    def report(self) -> dict:
+        return {
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "lag_ms": self.percentiles(),
+            "max_lag_ms": round(max(self.lags, default=0.0) * 1000, 2),
+            "blocking_events": list(self.blocking_events)[::-1],
+        }
+
+
+loop_monitor = LoopMonitor()
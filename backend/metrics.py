@@ -0,0 +1,139 @@
+"""
+Prometheus metrics for the API: per-route request counts, latency and size
+histograms, in-flight gauges, upload volume, response compression, MongoDB
+command timings and event-loop lag.
+
+Set PROMETHEUS_MULTIPROC_DIR when running several uvicorn workers so /metrics
+aggregates all of them. MongoDB timings are fed by mongo_monitor.
+"""
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    REGISTRY,
+)
+from prometheus_client import multiprocess
+from starlette.routing import Match
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+RATIO_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+COMPRESSION_CPU_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+UNMATCHED_ROUTE = "unmatched"
+
+REQUESTS = Counter(
+    "http_requests_total", "HTTP requests", ["method", "route", "status"]
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route"], buckets=LATENCY_BUCKETS
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "HTTP response body size", ["method", "route"], buckets=SIZE_BUCKETS
+)
+REQUEST_BODY_BYTES = Counter(
+    "http_request_body_bytes_total", "Request body bytes received (uploads)", ["method", "route"]
+)
+IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests being processed", ["method", "route"], multiprocess_mode="livesum"
+)
+MONGO_COMMAND_LATENCY = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command duration", ["collection", "command"], buckets=MONGO_BUCKETS
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "mongo_command_failures_total", "Failed MongoDB commands", ["collection", "command"]
+)
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds", "Delay of event loop timer callbacks", buckets=LOOP_LAG_BUCKETS
+)
+EVENT_LOOP_LAG_QUANTILE = Gauge(
+    "event_loop_lag_quantile_seconds", "Event loop lag percentiles over the recent window", ["quantile"],
+    multiprocess_mode="max"
+)
+EVENT_LOOP_BLOCKED = Counter(
+    "event_loop_blocked_total", "Times the event loop was blocked longer than the threshold"
+)
+COMPRESSION_RATIO = Histogram(
+    "http_compression_ratio", "Compressed size divided by original size", ["encoding", "route"], buckets=RATIO_BUCKETS
+)
+COMPRESSION_CPU_SECONDS = Histogram(
+    "http_compression_cpu_seconds", "CPU time spent compressing one response", ["encoding", "route"],
+    buckets=COMPRESSION_CPU_BUCKETS
+)
+COMPRESSION_BYTES = Counter(
+    "http_compression_bytes_total", "Bytes into and out of response compression", ["encoding", "direction"]
+)
+
+
+def route_template(app, scope) -> str:
+    """Path template of the route that will handle the request (bounded label values)"""
+    for route in app.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", UNMATCHED_ROUTE)
+    return UNMATCHED_ROUTE
+
+
+class PrometheusMiddleware:
+    """Pure ASGI middleware so streaming responses are measured without buffering"""
+
+    def __init__(self, app, fastapi_app):
+        self.app = app
+        self.fastapi_app = fastapi_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = route_template(self.fastapi_app, scope)
+        status = {"code": 500}
+        response_bytes = 0
+        request_bytes = 0
+
+        async def counting_receive():
+            nonlocal request_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                request_bytes += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            nonlocal response_bytes
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        in_flight = IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            in_flight.dec()
+            REQUEST_LATENCY.labels(method, route).observe(time.perf_counter() - start)
+            REQUESTS.labels(method, route, str(status["code"])).inc()
+            RESPONSE_SIZE.labels(method, route).observe(response_bytes)
+            if request_bytes:
+                REQUEST_BODY_BYTES.labels(method, route).inc(request_bytes)
+
+
+def render_metrics():
+    """Return (body, content_type) for the /metrics endpoint"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,216 @@
+"""
+MongoDB command monitoring: per-command timings for Prometheus, a structured
+slow-query log and rolling top-N statistics by query shape.
+
+MONGO_SLOW_QUERY_MS sets the slow-query threshold (default 100 ms). Reply
+sizes are measured for slow commands only: encoding every reply again would
+cost as much as some of the queries being watched, so `reply_bytes` in the
+statistics sums the replies of slow commands.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import bson
+from pymongo import monitoring
+
+from metrics import MONGO_COMMAND_FAILURES, MONGO_COMMAND_LATENCY
+
+SLOW_QUERY_MS = float(os.environ.get('MONGO_SLOW_QUERY_MS', 100))
+# Statistics cover the current window plus the previous one
+STATS_WINDOW_SECONDS = 15 * 60
+RECENT_SLOW_QUERIES = 200
+
+slow_query_logger = logging.getLogger("mongo.slow_query")
+
+# Commands whose first field names the collection they run against
+COLLECTION_COMMANDS = {
+    "find", "insert", "update", "delete", "aggregate", "count", "distinct",
+    "findAndModify", "createIndexes", "listIndexes", "drop",
+}
+
+
+def command_collection(command_name: str, command) -> str:
+    if command_name == "getMore":
+        return str(command.get("collection", ""))
+    if command_name in COLLECTION_COMMANDS:
+        value = command.get(command_name)
+        if isinstance(value, str):
+            return value
+    return ""
+
+
+def query_shape(value):
+    """Replace literal values with '?' so queries group by structure, not data"""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = [query_shape(item) for item in value]
+        # Lists of literals ($in etc.) collapse to a single placeholder
+        return shapes if any(isinstance(s, (dict, list)) for s in shapes) else "?"
+    return "?"
+
+
+def command_shape(command_name: str, command) -> str:
+    if command_name == "find":
+        shape = {
+            "filter": query_shape(command.get("filter", {})),
+            "sort": list(command.get("sort", {}) or {}),
+            "projection": sorted(command.get("projection", {}) or {}),
+        }
+    elif command_name == "aggregate":
+        shape = {"pipeline": [query_shape(stage) for stage in command.get("pipeline", [])]}
+    elif command_name in ("update", "delete"):
+        statements = command.get("updates" if command_name == "update" else "deletes", [])
+        shape = {"filter": query_shape(statements[0].get("q", {})) if statements else {}}
+    elif command_name in ("count", "findAndModify", "distinct"):
+        shape = {"filter": query_shape(command.get("query", {}) or {})}
+    else:
+        shape = {}
+    return json.dumps(shape, sort_keys=True, default=str)
+
+
+def returned_documents(command_name: str, reply) -> int:
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+    if command_name == "findAndModify":
+        return 1 if reply.get("value") else 0
+    n = reply.get("n")
+    return n if isinstance(n, int) else 0
+
+
+def reply_size(reply) -> int:
+    try:
+        return len(bson.encode(reply))
+    except Exception:
+        return 0
+
+
+class CommandStats:
+    """Rolling per-shape statistics plus a buffer of recent slow commands"""
+
+    def __init__(self, window_seconds: float = STATS_WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+        self.lock = threading.Lock()
+        self.window_started = time.monotonic()
+        self.current = {}
+        self.previous = {}
+        self.recent_slow = deque(maxlen=RECENT_SLOW_QUERIES)
+
+    def _rotate(self, now: float):
+        if now - self.window_started >= self.window_seconds:
+            # After a long idle period the previous window is stale as well
+            self.previous = self.current if now - self.window_started < 2 * self.window_seconds else {}
+            self.current = {}
+            self.window_started = now
+
+    def record(self, key, duration_ms: float, documents: int, size: int, failed: bool):
+        now = time.monotonic()
+        with self.lock:
+            self._rotate(now)
+            stats = self.current.get(key)
+            if stats is None:
+                stats = self.current[key] = {
+                    "count": 0, "failures": 0, "total_ms": 0.0, "max_ms": 0.0,
+                    "documents": 0, "reply_bytes": 0, "slow": 0,
+                }
+            stats["count"] += 1
+            stats["failures"] += int(failed)
+            stats["total_ms"] += duration_ms
+            stats["max_ms"] = max(stats["max_ms"], duration_ms)
+            stats["documents"] += documents
+            stats["reply_bytes"] += size
+            stats["slow"] += int(duration_ms >= SLOW_QUERY_MS)
+
+    def add_slow(self, record: dict):
+        with self.lock:
+            self.recent_slow.append(record)
+
+    def top(self, limit: int = 20, sort_by: str = "total_ms"):
+        with self.lock:
+            self._rotate(time.monotonic())
+            merged = {}
+            for window in (self.previous, self.current):
+                for key, stats in window.items():
+                    total = merged.setdefault(key, {
+                        "count": 0, "failures": 0, "total_ms": 0.0, "max_ms": 0.0,
+                        "documents": 0, "reply_bytes": 0, "slow": 0,
+                    })
+                    for field, value in stats.items():
+                        total[field] = max(total[field], value) if field == "max_ms" else total[field] + value
+            recent = list(self.recent_slow)
+
+        rows = []
+        for (collection, command_name, shape), stats in merged.items():
+            rows.append({
+                "collection": collection,
+                "command": command_name,
+                "shape": shape,
+                **stats,
+                "total_ms": round(stats["total_ms"], 2),
+                "max_ms": round(stats["max_ms"], 2),
+                "avg_ms": round(stats["total_ms"] / stats["count"], 2) if stats["count"] else 0.0,
+            })
+        rows.sort(key=lambda row: row.get(sort_by, 0), reverse=True)
+        return {
+            "threshold_ms": SLOW_QUERY_MS,
+            "window_seconds": self.window_seconds,
+            "top": rows[:limit],
+            "recent_slow": recent[-limit:][::-1],
+        }
+
+
+command_stats = CommandStats()
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Record duration, collection and returned documents of every command,
+    and the reply size of slow ones"""
+
+    def __init__(self, stats: CommandStats = command_stats):
+        self.stats = stats
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        collection = command_collection(event.command_name, event.command)
+        shape = command_shape(event.command_name, event.command)
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (collection, shape)
+
+    def _finish(self, event, reply, failed: bool):
+        with self._lock:
+            collection, shape = self._pending.pop((event.connection_id, event.request_id), ("", "{}"))
+        duration_ms = event.duration_micros / 1000
+        documents = returned_documents(event.command_name, reply) if reply else 0
+        slow = duration_ms >= SLOW_QUERY_MS
+        size = reply_size(reply) if reply and slow else 0
+
+        MONGO_COMMAND_LATENCY.labels(collection, event.command_name).observe(duration_ms / 1000)
+        if failed:
+            MONGO_COMMAND_FAILURES.labels(collection, event.command_name).inc()
+        self.stats.record((collection, event.command_name, shape), duration_ms, documents, size, failed)
+
+        if slow:
+            record = {
+                "at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "collection": collection,
+                "command": event.command_name,
+                "shape": shape,
+                "duration_ms": round(duration_ms, 2),
+                "documents": documents,
+                "reply_bytes": size,
+                "failed": failed,
+            }
+            self.stats.add_slow(record)
+            slow_query_logger.warning(json.dumps(record))
+
+    def succeeded(self, event):
+        self._finish(event, event.reply, failed=False)
+
+    def failed(self, event):
+        self._finish(event, None, failed=True)
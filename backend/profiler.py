@@ -0,0 +1,123 @@
+"""
+Opt-in sampling profiler for single requests.
+
+A request carrying the X-Profile: 1 header (or ?profile=1) from an admin is
+sampled by a background thread that reads the event-loop thread's stack at a
+fixed interval. The result is stored in collapsed-stack format
+("outer;inner;leaf count" per line), which flamegraph.pl and speedscope read
+directly. Requests without the flag go straight through.
+
+The event loop is shared, so samples taken while the profiled request awaits
+I/O can include other requests' work.
+"""
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from urllib.parse import parse_qs
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_QUERY_PARAM = "profile"
+PROFILE_FLAG_VALUES = ("1", "true")
+SAMPLE_INTERVAL_SECONDS = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', 5)) / 1000
+MAX_COLLAPSED_BYTES = 4 * 1024 * 1024
+
+
+def wants_profile(scope) -> bool:
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    if any(value.strip() in PROFILE_FLAG_VALUES for value in query.get(PROFILE_QUERY_PARAM, [])):
+        return True
+    for name, value in scope.get("headers", []):
+        if name == PROFILE_HEADER:
+            return value.decode("latin-1").strip() in PROFILE_FLAG_VALUES
+    return False
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    path = code.co_filename.replace("\\", "/").split("/")
+    return f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> str:
+        self._stop.set()
+        self._thread.join()
+        lines = [f"{stack} {count}" for stack, count in self.counts.most_common()]
+        collapsed = "\n".join(lines)
+        if len(collapsed) > MAX_COLLAPSED_BYTES:
+            collapsed = collapsed[:MAX_COLLAPSED_BYTES].rsplit("\n", 1)[0]
+        return collapsed
+
+
+class ProfilingMiddleware:
+    """`authorize(scope)` returns the admin user for flagged requests (or None);
+    `store(profile)` persists the finished profile document."""
+
+    def __init__(self, app, authorize, store):
+        self.app = app
+        self.authorize = authorize
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        user = await self.authorize(scope)
+        if user is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = str(uuid.uuid4())
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]}
+            await send(message)
+
+        sampler = StackSampler(threading.get_ident())
+        started_at = datetime.now(timezone.utc)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            duration = time.perf_counter() - start
+            collapsed = sampler.stop()
+            await self.store({
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "user_name": user.get('name'),
+                "started_at": started_at.isoformat(),
+                "duration_ms": round(duration * 1000, 2),
+                "interval_ms": round(sampler.interval * 1000, 2),
+                "samples": sampler.samples,
+                "collapsed": collapsed,
+            })
@@ -0,0 +1,37 @@
+"""
+Recreate the flattened `batches` collection from the entries.
+
+Writes one row per embedded batch of every refining, recycling, dross
+recycling, RML purchase and Santosh receipt entry. Run it once after
+upgrading, and again if the rows ever drift from the entries. Stop the API
+first so no writes interleave with the rebuild.
+
+    python rebuild_batches.py
+"""
+import asyncio
+import os
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+load_dotenv()
+
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+DB_NAME = os.environ.get("DB_NAME", "leadtrack_db")
+
+
+async def main():
+    import server
+
+    client = AsyncIOMotorClient(MONGO_URL)
+    server.set_database(client[DB_NAME], client)
+    try:
+        await server.ensure_indexes()
+        count = await server.rebuild_batches()
+        print(f"Wrote {count} batch rows")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
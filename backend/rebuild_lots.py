@@ -0,0 +1,41 @@
+"""
+Rebuild the RML/Santosh lot records and their FIFO allocations from history.
+
+Registers the SKU of every RML purchase and Santosh receipt batch that is not
+in the SKU registry yet, creates one lot per batch, then replays refining
+batches and sales in date order against them. Run it once
+after upgrading, and again whenever the lots need to be recreated from the
+entries. Stop the API first so no writes interleave with the replay.
+
+    python rebuild_lots.py
+"""
+import asyncio
+import os
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+load_dotenv()
+
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+DB_NAME = os.environ.get("DB_NAME", "leadtrack_db")
+
+
+async def main():
+    import server
+
+    client = AsyncIOMotorClient(MONGO_URL)
+    server.set_database(client[DB_NAME], client)
+    try:
+        await server.ensure_indexes()
+        skus = await server.backfill_skus()
+        print(f"Registered {skus['skus']} SKUs; linked {skus['entries']} entries and {skus['sales']} sales")
+        result = await server.rebuild_lots()
+        print(f"Created {result['lots']} lots; allocated {result['refining_entries']} refining entries "
+              f"and {result['sales']} sales")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
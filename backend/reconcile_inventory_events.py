@@ -0,0 +1,40 @@
+"""
+Bring the inventory event log in line with the stored entries.
+
+Appends a "created" event for every entry and sale without one (on the first
+run, that is all existing history), an "adjusted" event where stored figures
+were changed in place, and a "deleted" event for documents removed outside
+the API (e.g. by clear_data.py). Nothing in the log is modified. Safe to run
+again; a second run appends nothing. It reads the whole log and then every
+collection, so stop the API first; writes made in between would be counted
+twice.
+
+    python reconcile_inventory_events.py
+"""
+import asyncio
+import os
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+load_dotenv()
+
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+DB_NAME = os.environ.get("DB_NAME", "leadtrack_db")
+
+
+async def main():
+    import server
+
+    client = AsyncIOMotorClient(MONGO_URL)
+    server.set_database(client[DB_NAME], client)
+    try:
+        await server.ensure_indexes()
+        result = await server.reconcile_inventory_events()
+        print(f"Appended {result['events']} inventory events")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,45 @@
+"""
+orjson-backed JSON responses for large payloads.
+
+FastAPI's default path runs every returned value through jsonable_encoder (a
+recursive Python pass) and then json.dumps. FastJSONResponse hands the value
+straight to orjson instead, producing the same JSON for what the routes return:
+
+- datetimes as isoformat() strings (naive stays naive, UTC keeps "+00:00")
+- floats in shortest round-trip form, as json.dumps writes them (only the
+  exponent of very small or large values is spelled differently, 1e-07 vs 1e-7)
+- Pydantic models as model_dump(mode="json"), which is what response_model
+  serialization produces
+
+Routes that return FastJSONResponse bypass response_model serialization, so
+they must return exactly the fields the model declares (the model still
+documents the route). NaN and infinity are written as null where json.dumps
+would fail the request.
+"""
+from datetime import date
+
+import orjson
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, date):
+        # orjson only encodes exact datetime/date types natively, not subclasses
+        return value.isoformat()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default, option=OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
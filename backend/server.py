@@ -1,9 +1,16 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, File, UploadFile, Form
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, File, UploadFile, Form, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import CursorType, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError
+import asyncio
+import functools
+import json
 import os
+import re
+from collections import OrderedDict
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
@@ -15,15 +22,77 @@ from jose import JWTError, jwt
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import base64
 import io
+import time
+import numpy as np
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment
+from metrics import PrometheusMiddleware, render_metrics
+from mongo_monitor import MongoCommandListener, command_stats
+from compression import CompressionMiddleware
+from profiler import ProfilingMiddleware
+from responses import FastJSONResponse, dumps as json_dumps
+from loop_monitor import loop_monitor
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Database handle. The server connects on startup using MONGO_URL/DB_NAME;
+# tests and tools inject their own (e.g. in-memory) database with set_database().
+client = None
+db = None
+
+def connect_database():
+    global client, db
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], event_listeners=[MongoCommandListener()])
+    db = client[os.environ['DB_NAME']]
+
+def set_database(database, database_client=None):
+    """Point every route at `database` and drop caches built from the previous one"""
+    global client, db
+    client = database_client
+    db = database
+    reset_caches()
+
+async def ensure_indexes():
+    """Create the indexes the read paths rely on (idempotent, run on startup)"""
+    # FIFO lookup of a SKU's open lots, and lots of an RML purchase/Santosh entry
+    await db.lots.create_index("id", unique=True)
+    await db.lots.create_index([("sku", 1), ("timestamp", 1), ("batch_index", 1)])
+    await db.lots.create_index("entry_id")
+    # SKU registry: one document per SKU identity and per label; prefix search
+    await db.skus.create_index("id", unique=True)
+    await db.skus.create_index([("source", 1), ("seller_key", 1), ("sb_percentage", 1), ("inward_date", 1)], unique=True)
+    await db.skus.create_index("label", unique=True)
+    await db.skus.create_index("search_label")
+    await db.skus.create_index("seller_key")
+    # Refining consumption by kind of input and by SKU
+    await db.entries.create_index([("entry_type", 1), ("batches.source_kind", 1)])
+    await db.entries.create_index("batches.sku_id")
+    # Flattened batches: by type and date, narrowed by source, kind of input or user
+    await db.batches.create_index("id", unique=True)
+    await db.batches.create_index("entry_id")
+    await db.batches.create_index([("type", 1), ("date", 1)])
+    await db.batches.create_index([("type", 1), ("source", 1), ("date", 1)])
+    await db.batches.create_index([("type", 1), ("source_kind", 1), ("date", 1)])
+    await db.batches.create_index([("user_id", 1), ("date", 1)])
+    # History search: by type and user, and full text over names, SKUs and remarks
+    await db.batches.create_index([("type", 1), ("user_name", 1), ("date", 1)])
+    await db.batches.create_index([("source", "text"), ("user_name", "text"), ("remarks", "text"), ("seller", "text"),
+                                   ("dross_remarks", "text")], name="history_text")
+    await db.sales.create_index([("timestamp", -1), ("id", 1)])
+    await db.sales.create_index([("sku_type", 1), ("timestamp", -1)])
+    await db.sales.create_index([("party_name", 1), ("timestamp", -1)])
+    await db.sales.create_index([("user_name", 1), ("timestamp", -1)])
+    await db.sales.create_index([("party_name", "text"), ("sku_type", "text")], name="history_text")
+    # Inventory events: the tail after a snapshot, and the events of one entry
+    await db.inventory_events.create_index("seq", unique=True)
+    await db.inventory_events.create_index("entry_id")
+    # An entry is created and deleted once: a second event of either is dropped
+    await db.inventory_events.create_index("key", unique=True)
+    await db.inventory_snapshots.create_index("seq", unique=True)
+    # Point-in-time balances: events by effective date, one stored snapshot per month end
+    await db.inventory_events.create_index([("effective_at", 1), ("seq", 1)])
+    await db.inventory_dated_snapshots.create_index("date", unique=True)
 
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
@@ -33,6 +102,12 @@ api_router = APIRouter(prefix="/api")
 async def health_check():
     return {"status": "healthy"}
 
+# Prometheus scrape endpoint
+@app.get("/metrics")
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
@@ -52,9 +127,8 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+async def get_user_from_token(token: str):
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: str = payload.get("sub")
         if user_id is None:
@@ -66,8 +140,14 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid authentication")
 
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await get_user_from_token(credentials.credentials)
+
+def is_admin(user: dict) -> bool:
+    return user.get('name') == 'TT'
+
 async def require_admin(current_user: dict = Depends(get_current_user)):
-    if current_user.get('name') != 'TT':
+    if not is_admin(current_user):
         raise HTTPException(status_code=403, detail="Admin access required")
     return current_user
 
@@ -106,6 +186,8 @@ class RecoverySettings(BaseModel):
 
 class RefiningBatch(BaseModel):
     input_source: str = "manual"  # 'manual', 'SANTOSH', or RML SKU
+    source_kind: str = "manual"  # One of SOURCE_KINDS, set from input_source on write
+    sku_id: str = ""  # Registry id when input_source is a registered SKU
     sb_percentage: Optional[float] = None  # Required when input_source is SANTOSH
     lead_ingot_kg: float
     lead_ingot_pieces: int
@@ -122,6 +204,10 @@ class RefiningBatch(BaseModel):
     pure_lead_kg: float
     pure_lead_pieces: int = 0
     pure_lead_image: str
+    # Stored derived figures, see apply_refining_totals
+    total_dross_kg: float = 0
+    antimony_kg: float = 0
+    yield_percent: float = 0
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class RefiningEntry(BaseModel):
@@ -131,6 +217,7 @@ class RefiningEntry(BaseModel):
     user_name: str
     entry_type: str = "refining"
     batches: List[RefiningBatch]
+    totals: dict = Field(default_factory=dict)  # Sums over the batches, see apply_refining_totals
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class RecyclingBatch(BaseModel):
@@ -177,6 +264,8 @@ class SaleEntry(BaseModel):
     sku_type: str  # "Pure Lead", "High Lead", or RML SKU name
     quantity_kg: float
     entry_date: Optional[str] = None
+    sku_id: str = ""  # Registry id when sku_type is a registered SKU
+    sb_percentage: Optional[float] = None  # The registered SKU's SB%
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class SaleCreate(BaseModel):
@@ -191,8 +280,10 @@ class RMLReceivedSantoshBatch(BaseModel):
     pieces: int
     sb_percentage: float
     remarks: str = ""  # Seller name / Remark
+    seller: str = ""  # Distinguishes sellers sharing a remark; defaults to the remark
     image: str = ""
     sku: str = ""  # Generated SKU
+    sku_id: str = ""  # Registry id of the SKU
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class RMLReceivedSantoshEntry(BaseModel):
@@ -232,8 +323,10 @@ class RMLPurchaseBatch(BaseModel):
     pieces: int
     sb_percentage: float
     remarks: str = ""
+    seller: str = ""
     image: str
     sku: str = ""
+    sku_id: str = ""
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class RMLPurchaseEntry(BaseModel):
@@ -245,6 +338,297 @@ class RMLPurchaseEntry(BaseModel):
     batches: List[RMLPurchaseBatch]
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+# Change notifications
+# Collections whose contents feed the dashboard summary and stock figures
+SUMMARY_COLLECTIONS = ["entries", "sales", "rml_purchases", "rml_received_santosh", "dross_recycling_entries",
+                       "inventory_events"]
+
+class Broadcaster:
+    """Fan out messages to many subscriber queues. A subscriber whose queue is
+    full is dropped (its backlog is discarded) instead of buffering without bound."""
+
+    def __init__(self, max_queue_size: int = 100):
+        self.max_queue_size = max_queue_size
+        self.subscribers = set()
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+    def publish(self, message):
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self.subscribers.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                # None tells the consumer it has been dropped
+                queue.put_nowait(None)
+
+# Set when a summary collection changes (locally or, through the change stream, in any worker)
+_summary_dirty = asyncio.Event()
+_change_stream_active = False
+
+# Per-collection write counters of this worker. Shared counters live in the
+# collection_versions collection so other workers can see writes too.
+_collection_versions = {}
+
+def mark_collections_changed(*collections: str):
+    for collection in collections:
+        _collection_versions[collection] = _collection_versions.get(collection, 0) + 1
+    if "entries" in collections:
+        invalidate_recycling_columns()
+    if any(collection in SUMMARY_COLLECTIONS for collection in collections):
+        _summary_dirty.set()
+
+async def notify_data_changed(*collections: str):
+    """Called by every write path after it modifies one of the data collections"""
+    mark_collections_changed(*collections)
+    try:
+        for collection in collections:
+            await db.collection_versions.update_one({"_id": collection}, {"$inc": {"version": 1}}, upsert=True)
+    except Exception:
+        logger.exception("Failed to bump collection versions for %s", collections)
+
+async def get_collection_versions(collections) -> tuple:
+    """Current version of each collection. The local counters are authoritative
+    when the change stream relays other workers' writes; otherwise the shared
+    counters are read (one small query)."""
+    if _change_stream_active:
+        return tuple(_collection_versions.get(c, 0) for c in collections)
+    docs = await db.collection_versions.find({"_id": {"$in": list(collections)}}).to_list(len(collections))
+    versions = {doc['_id']: doc.get('version', 0) for doc in docs}
+    return tuple(versions.get(c, 0) for c in collections)
+
+async def watch_data_changes():
+    """Follow writes made by any worker through a database change stream"""
+    global _change_stream_active
+    pipeline = [{"$match": {"ns.coll": {"$in": SUMMARY_COLLECTIONS}}}]
+    try:
+        async with db.watch(pipeline) as stream:
+            _change_stream_active = True
+            async for change in stream:
+                mark_collections_changed(change["ns"]["coll"])
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.info("Data change stream unavailable (%s), relying on local notifications", e)
+    finally:
+        _change_stream_active = False
+
+# Read-through query cache
+# Results of read endpoints are keyed by their arguments plus the versions of
+# the collections they read, so any write to those collections makes the old
+# entries unreachable; they then age out of the LRU.
+QUERY_CACHE_MAX_ENTRIES = 256
+QUERY_CACHE_MAX_BYTES = int(os.environ.get('QUERY_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# Arguments that do not change the result
+QUERY_CACHE_IGNORED_ARGS = {"current_user", "admin", "request"}
+
+class QueryCache:
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (value, size)
+        self.total_bytes = 0
+        self.stats = {}
+        self.inflight = {}
+
+    def route_stats(self, name: str) -> dict:
+        return self.stats.setdefault(name, {"hits": 0, "misses": 0, "coalesced": 0})
+
+    def get(self, key):
+        item = self.entries.get(key)
+        if item is None:
+            return None
+        self.entries.move_to_end(key)
+        return item
+
+    def put(self, key, value, size: int):
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.total_bytes -= self.entries.pop(key)[1]
+        self.entries[key] = (value, size)
+        self.total_bytes += size
+        while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
+
+query_cache = QueryCache(QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_MAX_BYTES)
+# Handed to waiters when the request computing their value is cancelled
+_LEADER_CANCELLED = object()
+
+def cached_query(*collections: str):
+    """Cache an async read function by its arguments and the versions of `collections`"""
+    def decorator(func):
+        name = func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            stats = query_cache.route_stats(name)
+            versions = await get_collection_versions(collections)
+            arguments = tuple(sorted(
+                (key, repr(value)) for key, value in kwargs.items() if key not in QUERY_CACHE_IGNORED_ARGS
+            ))
+            key = (name, repr(args), arguments, versions)
+
+            while True:
+                item = query_cache.get(key)
+                if item is not None:
+                    stats["hits"] += 1
+                    return item[0]
+
+                # Concurrent misses for the same key share one computation
+                pending = query_cache.inflight.get(key)
+                if pending is None:
+                    break
+                value = await asyncio.shield(pending)
+                if value is not _LEADER_CANCELLED:
+                    stats["coalesced"] += 1
+                    return value
+                # The computing request went away (e.g. client disconnect): one waiter takes over
+
+            stats["misses"] += 1
+            future = asyncio.get_running_loop().create_future()
+            query_cache.inflight[key] = future
+            try:
+                value = await func(*args, **kwargs)
+            except asyncio.CancelledError:
+                future.set_result(_LEADER_CANCELLED)
+                raise
+            except BaseException as e:
+                future.set_exception(e)
+                # Retrieve it so an unawaited future does not log a warning
+                future.exception()
+                raise
+            finally:
+                query_cache.inflight.pop(key, None)
+            future.set_result(value)
+            # Routes cache their rendered response, so hits skip serialization as well
+            size = len(value.body) if isinstance(value, Response) else len(json_dumps(value))
+            query_cache.put(key, value, size)
+            return value
+
+        return wrapper
+    return decorator
+
+# Live activity feed
+# Compact, image-free summaries of created and deleted entries. Events are
+# written to a small capped collection that every worker tails, so a
+# subscriber sees writes made by any worker; if the collection cannot be
+# tailed, events are fanned out within this worker only.
+ACTIVITY_FEED_COLLECTION = "activity_feed"
+ACTIVITY_FEED_SIZE_BYTES = 1024 * 1024
+ACTIVITY_FEED_HEARTBEAT_SECONDS = 30.0
+
+activity_broadcaster = Broadcaster(max_queue_size=50)
+_activity_tail_active = False
+
+def summarize_activity(entry_type: str, doc: dict) -> dict:
+    batches = doc.get('batches', [])
+
+    def total(*fields):
+        return round(sum((batch.get(field, 0) or 0) for batch in batches for field in fields), 2)
+
+    summary = {
+        "action": "created",
+        "type": entry_type,
+        "id": doc['id'],
+        "user_name": doc.get('user_name'),
+        "timestamp": doc.get('timestamp'),
+        "batch_count": len(batches),
+    }
+    if entry_type == "refining":
+        summary.update(
+            lead_ingot_kg=total('lead_ingot_kg'),
+            pure_lead_kg=total('pure_lead_kg'),
+            total_dross_kg=total('initial_dross_kg', 'cu_dross_kg', 'sn_dross_kg', 'sb_dross_kg'),
+            skus=sorted({b['input_source'] for b in batches if b.get('input_source') not in (None, '', 'manual')})
+        )
+    elif entry_type == "recycling":
+        summary.update(
+            battery_kg=total('battery_kg'),
+            quantity_received=total('quantity_received'),
+            receivable_kg=total('receivable_kg'),
+            battery_types=sorted({b.get('battery_type', '') for b in batches})
+        )
+    elif entry_type == "dross_recycling":
+        summary.update(
+            quantity_sent=total('quantity_sent'),
+            high_lead_recovered=total('high_lead_recovered')
+        )
+    elif entry_type in ("rml_purchase", "rml_received_santosh"):
+        summary.update(
+            quantity_kg=total('quantity_kg'),
+            skus=[b.get('sku', '') for b in batches]
+        )
+    elif entry_type == "sale":
+        summary.pop("batch_count")
+        summary.update(
+            party_name=doc.get('party_name'),
+            quantity_kg=doc.get('quantity_kg', 0),
+            skus=[doc.get('sku_type', '')]
+        )
+    return summary
+
+def deletion_activity(entry_type: str, entry_id: str, admin: dict) -> dict:
+    return {
+        "action": "deleted",
+        "type": entry_type,
+        "id": entry_id,
+        "user_name": admin.get('name'),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+
+async def publish_activity(event: dict):
+    if _activity_tail_active:
+        try:
+            await db[ACTIVITY_FEED_COLLECTION].insert_one(dict(event))
+            return
+        except Exception:
+            logger.exception("Failed to write activity event, publishing locally")
+    activity_broadcaster.publish(event)
+
+async def tail_activity_feed():
+    global _activity_tail_active
+    try:
+        await db.create_collection(ACTIVITY_FEED_COLLECTION, capped=True, size=ACTIVITY_FEED_SIZE_BYTES)
+    except CollectionInvalid:
+        pass  # Already exists
+    except Exception as e:
+        logger.info("Activity feed collection unavailable (%s), publishing within this worker only", e)
+        return
+
+    collection = db[ACTIVITY_FEED_COLLECTION]
+    last = await collection.find_one({}, {"_id": 1}, sort=[("$natural", -1)])
+    last_id = last['_id'] if last else None
+    _activity_tail_active = True
+    try:
+        while True:
+            query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+            cursor = collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+            async for event in cursor:
+                last_id = event.pop('_id')
+                activity_broadcaster.publish(event)
+            # The cursor dies when the collection is empty; retry shortly
+            await asyncio.sleep(1)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        logger.exception("Activity feed tailing stopped, publishing within this worker only")
+    finally:
+        _activity_tail_active = False
+
 # Routes
 @api_router.get("/")
 async def root():
@@ -307,27 +691,429 @@ async def change_user_password(user_id: str, data: ChangePasswordRequest, admin:
     
     return {"message": f"Password updated for {user['name']}"}
 
+# Recovery settings cache
+# Settings are read once per worker and kept in memory. Every update bumps a
+# version on the settings document; a background watcher (change stream, or
+# version polling when the server is not a replica set) drops the cache in
+# other workers when the version moves.
+SETTINGS_POLL_SECONDS = 5.0
+_recovery_settings_cache = {"settings": None, "version": None}
+
+async def load_recovery_settings() -> RecoverySettings:
+    doc = await db.settings.find_one({"type": "recovery_settings"}, {"_id": 0})
+    settings = RecoverySettings(**doc) if doc else RecoverySettings()
+    _recovery_settings_cache["settings"] = settings
+    _recovery_settings_cache["version"] = doc.get('version', 0) if doc else 0
+    return settings
+
+async def get_cached_recovery_settings() -> RecoverySettings:
+    settings = _recovery_settings_cache["settings"]
+    if settings is None:
+        settings = await load_recovery_settings()
+    return settings
+
+def invalidate_recovery_settings():
+    _recovery_settings_cache["settings"] = None
+    _recovery_settings_cache["version"] = None
+
+async def watch_recovery_settings():
+    try:
+        async with db.settings.watch() as stream:
+            async for _change in stream:
+                invalidate_recovery_settings()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.info("Settings change stream unavailable (%s), polling settings version instead", e)
+
+    while True:
+        await asyncio.sleep(SETTINGS_POLL_SECONDS)
+        cached_version = _recovery_settings_cache["version"]
+        if cached_version is None:
+            continue
+        try:
+            doc = await db.settings.find_one({"type": "recovery_settings"}, {"_id": 0, "version": 1})
+        except Exception:
+            logger.exception("Failed to poll recovery settings version")
+            continue
+        if (doc.get('version', 0) if doc else 0) != cached_version:
+            invalidate_recovery_settings()
+
+def recovery_percent_for(settings: RecoverySettings, battery_type: str) -> float:
+    if battery_type == "PP":
+        return settings.pp_battery_percent
+    if battery_type == "HR":
+        return settings.hr_battery_percent
+    return settings.mc_smf_battery_percent
+
 # Admin - Recovery Settings
 @api_router.get("/admin/recovery-settings", response_model=RecoverySettings)
 async def get_recovery_settings(current_user: dict = Depends(get_current_user)):
-    settings = await db.settings.find_one({"type": "recovery_settings"}, {"_id": 0})
-    if not settings:
-        return RecoverySettings()
-    return RecoverySettings(**settings)
+    return await get_cached_recovery_settings()
 
 @api_router.put("/admin/recovery-settings")
 async def update_recovery_settings(settings: RecoverySettings, admin: dict = Depends(require_admin)):
     await db.settings.update_one(
         {"type": "recovery_settings"},
-        {"$set": {
-            "pp_battery_percent": settings.pp_battery_percent,
-            "mc_smf_battery_percent": settings.mc_smf_battery_percent,
-            "hr_battery_percent": settings.hr_battery_percent
-        }},
+        {
+            "$set": {
+                "pp_battery_percent": settings.pp_battery_percent,
+                "mc_smf_battery_percent": settings.mc_smf_battery_percent,
+                "hr_battery_percent": settings.hr_battery_percent
+            },
+            "$inc": {"version": 1}
+        },
         upsert=True
     )
+    invalidate_recovery_settings()
     return {"message": "Recovery settings updated successfully"}
 
+# Admin - Recovery what-if simulation
+# Battery types in the order of the percentage columns used by the simulator.
+# Anything that is not PP or HR is treated as MC/SMF, as in recovery_percent_for.
+SIMULATION_BATTERY_TYPES = ["PP", "MC/SMF", "HR"]
+SIMULATION_MAX_CANDIDATES = 1000
+SIMULATION_CACHE_TTL_SECONDS = 60
+
+class RecoverySimulationRequest(BaseModel):
+    candidates: List[RecoverySettings]
+    period: str = "month"  # 'day', 'month' or 'year'
+    start_date: Optional[str] = None  # YYYY-MM-DD, inclusive
+    end_date: Optional[str] = None  # YYYY-MM-DD, inclusive
+
+# Column cache of all recycling batches, rebuilt lazily after recycling writes
+# (or after the TTL, so other workers' writes are picked up too)
+_recycling_columns_cache = {"loaded_at": 0.0, "columns": None}
+
+def invalidate_recycling_columns():
+    _recycling_columns_cache["columns"] = None
+
+def _battery_type_index(battery_type: str) -> int:
+    if battery_type == "PP":
+        return 0
+    if battery_type == "HR":
+        return 2
+    return 1
+
+async def load_recycling_columns():
+    """Load recycling batch columns into NumPy arrays (cached)"""
+    cached = _recycling_columns_cache["columns"]
+    if cached is not None and time.monotonic() - _recycling_columns_cache["loaded_at"] < SIMULATION_CACHE_TTL_SECONDS:
+        return cached
+
+    projection = {
+        "_id": 0,
+        "timestamp": 1,
+        "batches.battery_type": 1,
+        "batches.battery_kg": 1,
+        "batches.quantity_received": 1,
+        "batches.receivable_kg": 1,
+    }
+    type_idx, battery_kg, quantity_received, receivable_kg, dates = [], [], [], [], []
+    async for entry in db.entries.find({"entry_type": "recycling"}, projection):
+        timestamp = entry.get('timestamp')
+        if isinstance(timestamp, datetime):
+            timestamp = timestamp.isoformat()
+        entry_date = (timestamp or "")[:10]
+        for batch in entry.get('batches', []):
+            type_idx.append(_battery_type_index(batch.get('battery_type', '')))
+            battery_kg.append(batch.get('battery_kg', 0) or 0)
+            quantity_received.append(batch.get('quantity_received', 0) or 0)
+            receivable_kg.append(batch.get('receivable_kg', 0) or 0)
+            dates.append(entry_date)
+
+    columns = {
+        "type_idx": np.array(type_idx, dtype=np.int64),
+        "battery_kg": np.array(battery_kg, dtype=np.float64),
+        "quantity_received": np.array(quantity_received, dtype=np.float64),
+        "receivable_kg": np.array(receivable_kg, dtype=np.float64),
+        "dates": np.array(dates, dtype="U10"),
+    }
+    _recycling_columns_cache["columns"] = columns
+    _recycling_columns_cache["loaded_at"] = time.monotonic()
+    return columns
+
+@api_router.post("/admin/recovery-settings/simulate")
+async def simulate_recovery_settings(request: RecoverySimulationRequest, admin: dict = Depends(require_admin)):
+    """Evaluate receivable under many candidate recovery percentages in one vectorized pass"""
+    if not request.candidates:
+        raise HTTPException(status_code=400, detail="At least one candidate is required")
+    if len(request.candidates) > SIMULATION_MAX_CANDIDATES:
+        raise HTTPException(status_code=400, detail=f"At most {SIMULATION_MAX_CANDIDATES} candidates are allowed")
+    period_lengths = {"day": 10, "month": 7, "year": 4}
+    if request.period not in period_lengths:
+        raise HTTPException(status_code=400, detail="period must be 'day', 'month' or 'year'")
+
+    columns = await load_recycling_columns()
+    dates = columns["dates"]
+    mask = np.ones(len(dates), dtype=bool)
+    if request.start_date:
+        mask &= dates >= request.start_date
+    if request.end_date:
+        mask &= dates <= request.end_date
+
+    type_idx = columns["type_idx"][mask]
+    battery_kg = columns["battery_kg"][mask]
+    quantity_received = columns["quantity_received"][mask]
+    periods, period_idx = np.unique(dates[mask].astype(f"U{period_lengths[request.period]}"), return_inverse=True)
+
+    # Receivable is linear in the percentage, so reduce batches to per (period, type)
+    # sums once and apply every candidate to those sums
+    num_types = len(SIMULATION_BATTERY_TYPES)
+    group = period_idx.reshape(-1) * num_types + type_idx
+    size = len(periods) * num_types
+    kg_sums = np.bincount(group, weights=battery_kg, minlength=size).reshape(len(periods), num_types)
+    received_sums = np.bincount(group, weights=quantity_received, minlength=size).reshape(len(periods), num_types)
+
+    percents = np.array([
+        [c.pp_battery_percent, c.mc_smf_battery_percent, c.hr_battery_percent]
+        for c in request.candidates
+    ], dtype=np.float64) / 100
+    remelted = percents[:, None, :] * kg_sums[None, :, :]  # (candidates, periods, types)
+    receivable = remelted - received_sums[None, :, :]
+
+    total_remelted = remelted.sum(axis=(1, 2))
+    by_type = receivable.sum(axis=1)
+    by_period = receivable.sum(axis=2)
+    totals = by_type.sum(axis=1)
+
+    results = []
+    for i, candidate in enumerate(request.candidates):
+        results.append({
+            "settings": candidate.model_dump(),
+            "total_remelted_lead_kg": round(float(total_remelted[i]), 2),
+            "total_receivable_kg": round(float(totals[i]), 2),
+            "by_battery_type": {
+                battery_type: round(float(by_type[i, t]), 2)
+                for t, battery_type in enumerate(SIMULATION_BATTERY_TYPES)
+            },
+            "by_period": {
+                str(period): round(float(by_period[i, p]), 2)
+                for p, period in enumerate(periods)
+            }
+        })
+
+    return {
+        "period": request.period,
+        "batch_count": int(mask.sum()),
+        "current_receivable_kg": round(float(columns["receivable_kg"][mask].sum()), 2),
+        "results": results
+    }
+
+# Admin - Recompute historical recycling receivables
+RECOMPUTE_BATCH_SIZE = 500
+RECYCLING_OUTPUT_FIELDS = ("remelted_lead_kg", "receivable_kg", "recovery_percent")
+
+# Keep references to fire-and-forget tasks so they are not garbage collected
+_background_tasks = set()
+
+def start_background_task(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+class RecoveryRecomputeRequest(BaseModel):
+    start_date: str  # YYYY-MM-DD, inclusive
+    end_date: str  # YYYY-MM-DD, inclusive
+
+def entry_date_range_query(start_date: Optional[str], end_date: Optional[str]) -> dict:
+    """Build a timestamp filter for ISO-string entry timestamps (dates inclusive)"""
+    timestamp_filter = {}
+    try:
+        if start_date:
+            timestamp_filter["$gte"] = datetime.fromisoformat(start_date).strftime("%Y-%m-%d")
+        if end_date:
+            next_day = datetime.fromisoformat(end_date) + timedelta(days=1)
+            timestamp_filter["$lt"] = next_day.strftime("%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be in YYYY-MM-DD format")
+    return {"timestamp": timestamp_filter} if timestamp_filter else {}
+
+async def run_recovery_recompute(job_id: str, query: dict):
+    settings = await get_cached_recovery_settings()
+    projection = {**INVENTORY_PROJECTION}
+    for field in ("battery_type", "battery_kg", "quantity_received") + RECYCLING_OUTPUT_FIELDS:
+        projection[f"batches.{field}"] = 1
+
+    processed = 0
+    updated = 0
+    operations = []
+    row_operations = []
+    changed = []
+
+    async def flush():
+        nonlocal updated, operations, row_operations, changed
+        if operations:
+            result = await db.entries.bulk_write(operations, ordered=False)
+            updated += result.modified_count
+            operations = []
+        if row_operations:
+            await db.batches.bulk_write(row_operations, ordered=False)
+            row_operations = []
+        # Receivables moved: "adjusted" events for just the entries changed
+        await log_inventory_changes(changed)
+        changed = []
+        await db.admin_jobs.update_one(
+            {"id": job_id},
+            {"$set": {"processed_entries": processed, "updated_entries": updated}}
+        )
+
+    try:
+        async for entry in db.entries.find(query, projection).batch_size(RECOMPUTE_BATCH_SIZE):
+            changes = {}
+            for batch_idx, batch in enumerate(entry.get('batches', [])):
+                values = calculate_recycling_output(
+                    batch.get('battery_type', ''),
+                    batch.get('battery_kg', 0),
+                    batch.get('quantity_received', 0),
+                    settings
+                )
+                for field, value in zip(RECYCLING_OUTPUT_FIELDS, values):
+                    if batch.get(field) != value:
+                        changes[f"batches.{batch_idx}.{field}"] = value
+            if changes:
+                operations.append(UpdateOne({"id": entry['id']}, {"$set": changes}))
+                row_operations.extend(batch_row_updates(entry['id'], changes))
+                changed.append(("recycling", with_changes(entry, changes)))
+            processed += 1
+            if len(operations) >= RECOMPUTE_BATCH_SIZE:
+                await flush()
+        await flush()
+
+        # Dependent totals are derived from the stored batches, refresh them once
+        await notify_data_changed("entries")
+
+        await db.admin_jobs.update_one(
+            {"id": job_id},
+            {"$set": {"status": "completed", "finished_at": datetime.now(timezone.utc).isoformat()}}
+        )
+    except Exception as e:
+        logger.exception("Recovery recompute job %s failed", job_id)
+        await db.admin_jobs.update_one(
+            {"id": job_id},
+            {"$set": {
+                "status": "failed",
+                "error": str(e),
+                "processed_entries": processed,
+                "updated_entries": updated,
+                "finished_at": datetime.now(timezone.utc).isoformat()
+            }}
+        )
+
+@api_router.post("/admin/recovery-settings/recompute")
+async def recompute_recovery(request: RecoveryRecomputeRequest, admin: dict = Depends(require_admin)):
+    """Recompute remelted lead, receivable and recovery % of recycling entries in a date range
+    with the current recovery settings. Runs in the background; poll /admin/jobs/{job_id}."""
+    query = {"entry_type": "recycling", **entry_date_range_query(request.start_date, request.end_date)}
+    total_entries = await db.entries.count_documents(query)
+
+    job = {
+        "id": str(uuid.uuid4()),
+        "type": "recovery_recompute",
+        "status": "running",
+        "start_date": request.start_date,
+        "end_date": request.end_date,
+        "total_entries": total_entries,
+        "processed_entries": 0,
+        "updated_entries": 0,
+        "started_by": admin['name'],
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "finished_at": None,
+    }
+    await db.admin_jobs.insert_one(job)
+    start_background_task(run_recovery_recompute(job['id'], query))
+
+    return {"job_id": job['id'], "total_entries": total_entries}
+
+@api_router.get("/admin/cache/stats")
+async def get_cache_stats(admin: dict = Depends(require_admin)):
+    routes = {}
+    for name, stats in query_cache.stats.items():
+        # Coalesced requests waited for a computation: neither hits nor misses
+        requests_count = stats["hits"] + stats["misses"] + stats["coalesced"]
+        routes[name] = {
+            **stats,
+            "hit_ratio": round(stats["hits"] / requests_count, 4) if requests_count else 0.0
+        }
+    return {
+        "entries": len(query_cache.entries),
+        "bytes": query_cache.total_bytes,
+        "max_entries": query_cache.max_entries,
+        "max_bytes": query_cache.max_bytes,
+        "routes": routes
+    }
+
+@api_router.get("/admin/mongo/slow-queries")
+async def get_slow_queries(limit: int = 20, sort_by: str = "total_ms", admin: dict = Depends(require_admin)):
+    """Rolling top-N MongoDB command shapes and the most recent slow commands"""
+    if sort_by not in ("total_ms", "max_ms", "count", "documents", "reply_bytes", "slow"):
+        raise HTTPException(status_code=400, detail="Invalid sort_by")
+    return command_stats.top(limit=max(1, min(limit, 200)), sort_by=sort_by)
+
+@api_router.get("/admin/event-loop")
+async def get_event_loop_report(admin: dict = Depends(require_admin)):
+    """Event loop lag percentiles and the stacks of recent blocking calls"""
+    return loop_monitor.report()
+
+# Admin - Request profiles
+PROFILE_COLLECTION_SIZE_BYTES = 64 * 1024 * 1024
+
+async def ensure_profile_collection():
+    try:
+        await db.create_collection("request_profiles", capped=True, size=PROFILE_COLLECTION_SIZE_BYTES)
+    except CollectionInvalid:
+        pass  # Already exists
+    except Exception as e:
+        logger.info("Could not create capped request_profiles collection (%s), using a regular one", e)
+
+async def profile_request_user(scope):
+    """Admin user for a request that asked to be profiled, None otherwise"""
+    authorization = ""
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            authorization = value.decode("latin-1")
+            break
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        user = await get_user_from_token(token)
+    except HTTPException:
+        return None
+    return user if is_admin(user) else None
+
+async def store_request_profile(profile: dict):
+    try:
+        await db.request_profiles.insert_one(profile)
+    except Exception:
+        logger.exception("Failed to store request profile %s", profile['id'])
+
+@api_router.get("/admin/profiles")
+async def list_request_profiles(admin: dict = Depends(require_admin)):
+    return await db.request_profiles.find(
+        {}, {"_id": 0, "collapsed": 0}
+    ).sort("started_at", -1).to_list(100)
+
+@api_router.get("/admin/profiles/{profile_id}")
+async def download_request_profile(profile_id: str, admin: dict = Depends(require_admin)):
+    """Collapsed stacks of a profiled request, ready for flamegraph.pl or speedscope"""
+    profile = await db.request_profiles.find_one({"id": profile_id}, {"_id": 0})
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(
+        content=profile['collapsed'],
+        media_type="text/plain",
+        headers={"Content-Disposition": f"attachment; filename=profile-{profile_id}.collapsed"}
+    )
+
+@api_router.get("/admin/jobs/{job_id}")
+async def get_admin_job(job_id: str, admin: dict = Depends(require_admin)):
+    job = await db.admin_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 # Auth
 @api_router.get("/users/list")
 async def list_all_users():
@@ -366,6 +1152,97 @@ async def login(credentials: UserLogin):
     )
 
 # Refining
+# Derived figures are stored when an entry is written: total dross, antimony
+# (SB% x lead ingot kg / 100, only where SB% was entered) and yield on each
+# batch, and their sums on the entry under `totals`. Aggregations read these.
+DROSS_FIELDS = ("initial_dross_kg", "cu_dross_kg", "sn_dross_kg", "sb_dross_kg")
+REFINING_BATCH_TOTAL_FIELDS = ("total_dross_kg", "antimony_kg", "yield_percent")
+# Stored figures further than this from their recomputed value are inconsistent
+TOTALS_TOLERANCE = 1e-6
+
+def calculate_refining_batch_totals(batch: dict) -> dict:
+    lead_ingot_kg = batch.get('lead_ingot_kg', 0) or 0
+    sb_percentage = batch.get('sb_percentage') or 0
+    return {
+        "total_dross_kg": sum(batch.get(field, 0) or 0 for field in DROSS_FIELDS),
+        "antimony_kg": sb_percentage * lead_ingot_kg / 100,
+        "yield_percent": round(batch.get('pure_lead_kg', 0) / lead_ingot_kg * 100, 2) if lead_ingot_kg > 0 else 0,
+    }
+
+def refining_batch_totals(batch: dict) -> dict:
+    """A batch's stored totals; batches written before they were stored
+    (until backfill_refining_totals.py runs) get them computed"""
+    if all(batch.get(field) is not None for field in REFINING_BATCH_TOTAL_FIELDS):
+        return {field: batch[field] for field in REFINING_BATCH_TOTAL_FIELDS}
+    return {**calculate_refining_batch_totals(batch),
+            **{field: batch[field] for field in REFINING_BATCH_TOTAL_FIELDS if batch.get(field) is not None}}
+
+def calculate_refining_entry_totals(batches: list) -> dict:
+    """Entry totals from batches that already carry their own totals"""
+    lead_ingot_kg = sum(batch.get('lead_ingot_kg', 0) for batch in batches)
+    pure_lead_kg = sum(batch.get('pure_lead_kg', 0) for batch in batches)
+    return {
+        "lead_ingot_kg": lead_ingot_kg,
+        "pure_lead_kg": pure_lead_kg,
+        "total_dross_kg": sum(batch['total_dross_kg'] for batch in batches),
+        "antimony_kg": sum(batch['antimony_kg'] for batch in batches),
+        "yield_percent": round(pure_lead_kg / lead_ingot_kg * 100, 2) if lead_ingot_kg > 0 else 0,
+    }
+
+def apply_refining_totals(doc: dict):
+    for batch in doc.get('batches', []):
+        batch.update(calculate_refining_batch_totals(batch))
+    doc['totals'] = calculate_refining_entry_totals(doc.get('batches', []))
+
+def refining_totals_changes(entry: dict) -> dict:
+    """$set fields that bring an entry's stored totals in line with its batches"""
+    changes = {}
+    batches = []
+    for index, batch in enumerate(entry.get('batches', [])):
+        expected = calculate_refining_batch_totals(batch)
+        for field, value in expected.items():
+            stored = batch.get(field)
+            if stored is None or abs(stored - value) > TOTALS_TOLERANCE:
+                changes[f"batches.{index}.{field}"] = value
+        batches.append({**batch, **expected})
+    expected = calculate_refining_entry_totals(batches)
+    stored = entry.get('totals') or {}
+    if any(stored.get(field) is None or abs(stored[field] - value) > TOTALS_TOLERANCE for field, value in expected.items()):
+        changes["totals"] = expected
+    return changes
+
+async def check_refining_totals(repair: bool = False) -> dict:
+    """Compare every refining entry's stored totals with its batches; with
+    `repair`, overwrite the ones that differ (this is also the backfill)"""
+    projection = {**INVENTORY_PROJECTION, "totals": 1}
+    for field in ("lead_ingot_kg", "pure_lead_kg", "sb_percentage") + DROSS_FIELDS + REFINING_BATCH_TOTAL_FIELDS:
+        projection[f"batches.{field}"] = 1
+    checked, mismatched = 0, []
+    operations, row_operations, changed = [], [], []
+    async for entry in db.entries.find({"entry_type": "refining"}, projection).batch_size(RECOMPUTE_BATCH_SIZE):
+        checked += 1
+        changes = refining_totals_changes(entry)
+        if not changes:
+            continue
+        mismatched.append(entry['id'])
+        if repair:
+            operations.append(UpdateOne({"id": entry['id']}, {"$set": changes}))
+            batch_changes = {path: value for path, value in changes.items() if path.startswith("batches.")}
+            row_operations.extend(batch_row_updates(entry['id'], batch_changes))
+            changed.append(("refining", with_changes(entry, batch_changes)))
+    if operations:
+        await db.entries.bulk_write(operations, ordered=False)
+        if row_operations:
+            await db.batches.bulk_write(row_operations, ordered=False)
+        await log_inventory_changes(changed)
+        await notify_data_changed("entries")
+    return {
+        "checked": checked,
+        "mismatched": len(mismatched),
+        "repaired": len(operations),
+        "sample_entry_ids": mismatched[:20],
+    }
+
 @api_router.post("/refining/entries")
 async def create_refining_entry(
     batches_data: str = Form(...),
@@ -421,17 +1298,53 @@ async def create_refining_entry(
     for batch in doc['batches']:
         batch['timestamp'] = batch['timestamp'].isoformat()
     
-    await db.entries.insert_one(doc)
+    apply_refining_totals(doc)
+    await classify_refining_batches(doc['batches'])
+    await allocate_refining_batches(doc['batches'])
+    try:
+        await db.entries.insert_one(doc)
+    except Exception:
+        await release_lots([a for batch in doc['batches'] for a in batch.get('lot_allocations', [])])
+        raise
+    await insert_batch_rows("refining", doc)
+    await append_inventory_events([inventory_event("created", "refining", doc, current_user["name"])])
+    await notify_data_changed("entries")
+    await publish_activity(summarize_activity("refining", doc))
     return {"id": entry.id, "message": "Refining entry created successfully"}
 
 @api_router.delete("/admin/entries/{entry_id}")
 async def delete_entry(entry_id: str, admin: dict = Depends(require_admin)):
-    result = await db.entries.delete_one({"id": entry_id})
-    if result.deleted_count == 0:
+    deleted = await db.entries.find_one_and_delete(
+        {"id": entry_id}, projection={**INVENTORY_PROJECTION, "batches.lot_allocations": 1}
+    )
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Entry not found")
+    await release_lots([a for batch in deleted.get('batches', []) for a in batch.get('lot_allocations', [])])
+    await db.batches.delete_many({"entry_id": entry_id})
+    await log_deletion(deleted.get('entry_type', 'entry'), deleted, admin['name'])
+    await notify_data_changed("entries")
+    await publish_activity(deletion_activity(deleted.get('entry_type', 'entry'), entry_id, admin))
     return {"message": "Entry deleted successfully"}
 
+@api_router.get("/admin/refining-totals/check")
+async def check_refining_totals_route(admin: dict = Depends(require_admin)):
+    """Refining entries whose stored dross, antimony or yield totals disagree with their batches"""
+    return await check_refining_totals()
+
+@api_router.post("/admin/refining-totals/repair")
+async def repair_refining_totals(admin: dict = Depends(require_admin)):
+    """Recompute the stored totals of the refining entries that disagree with their batches"""
+    return await check_refining_totals(repair=True)
+
 # Recycling
+def calculate_recycling_output(battery_type, battery_kg, quantity_received, settings: RecoverySettings):
+    """Return (remelted_lead_kg, receivable_kg, recovery_percent) for a recycling batch, rounded as stored"""
+    remelted_lead_kg = battery_kg * recovery_percent_for(settings, battery_type) / 100
+    
+    receivable_kg = remelted_lead_kg - quantity_received
+    recovery_percent = (quantity_received / battery_kg * 100) if battery_kg > 0 else 0
+    return round(remelted_lead_kg, 2), round(receivable_kg, 2), round(recovery_percent, 2)
+
 @api_router.post("/recycling/entries")
 async def create_recycling_entry(
     batches_data: str = Form(...),
@@ -442,10 +1355,8 @@ async def create_recycling_entry(
     import json
     batches_json = json.loads(batches_data)
     
-    # Get recovery settings
-    settings = await db.settings.find_one({"type": "recovery_settings"}, {"_id": 0})
-    pp_percent = settings.get('pp_battery_percent', 60.5) / 100 if settings else 0.605
-    mc_smf_percent = settings.get('mc_smf_battery_percent', 58.0) / 100 if settings else 0.58
+    # Recovery settings come from the in-process cache (no query on this path)
+    settings = await get_cached_recovery_settings()
     
     file_idx = 0
     batches = []
@@ -456,13 +1367,9 @@ async def create_recycling_entry(
         quantity_received = batch_data.get('quantity_received', 0)
         has_output_image = batch_data.get('has_output_image', False)
         
-        if battery_type == "PP":
-            remelted_lead_kg = battery_kg * pp_percent
-        else:
-            remelted_lead_kg = battery_kg * mc_smf_percent
-        
-        receivable_kg = remelted_lead_kg - quantity_received
-        recovery_percent = (quantity_received / battery_kg * 100) if battery_kg > 0 else 0
+        remelted_lead_kg, receivable_kg, recovery_percent = calculate_recycling_output(
+            battery_type, battery_kg, quantity_received, settings
+        )
         
         battery_image = base64.b64encode(await files[file_idx].read()).decode('utf-8')
         file_idx += 1
@@ -478,9 +1385,9 @@ async def create_recycling_entry(
             battery_kg=battery_kg,
             battery_image=battery_image,
             quantity_received=quantity_received,
-            remelted_lead_kg=round(remelted_lead_kg, 2),
-            receivable_kg=round(receivable_kg, 2),
-            recovery_percent=round(recovery_percent, 2),
+            remelted_lead_kg=remelted_lead_kg,
+            receivable_kg=receivable_kg,
+            recovery_percent=recovery_percent,
             remelted_lead_image=remelted_lead_image
         )
         batches.append(batch)
@@ -505,6 +1412,10 @@ async def create_recycling_entry(
         batch['timestamp'] = batch['timestamp'].isoformat()
     
     await db.entries.insert_one(doc)
+    await insert_batch_rows("recycling", doc)
+    await append_inventory_events([inventory_event("created", "recycling", doc, current_user["name"])])
+    await notify_data_changed("entries")
+    await publish_activity(summarize_activity("recycling", doc))
     return {"id": entry.id, "message": "Recycling entry created successfully"}
 
 # Dross Recycling
@@ -550,6 +1461,10 @@ async def create_dross_recycling_entry(
         batch['timestamp'] = batch['timestamp'].isoformat()
     
     await db.dross_recycling_entries.insert_one(doc)
+    await insert_batch_rows("dross_recycling", doc)
+    await append_inventory_events([inventory_event("created", "dross_recycling", doc, current_user["name"])])
+    await notify_data_changed("dross_recycling_entries")
+    await publish_activity(summarize_activity("dross_recycling", doc))
     return {"id": entry.id, "message": "Dross recycling entry created successfully"}
 
 @api_router.get("/dross-recycling/entries")
@@ -565,7 +1480,7 @@ async def get_dross_recycling_entries(current_user: dict = Depends(get_current_u
                 batch['timestamp'] = datetime.fromisoformat(batch['timestamp'])
             batch.pop('spectro_image', None)
     
-    return entries
+    return FastJSONResponse(entries)
 
 @api_router.get("/dross-recycling/entries/{entry_id}")
 async def get_dross_recycling_entry_detail(entry_id: str, current_user: dict = Depends(get_current_user)):
@@ -580,15 +1495,887 @@ async def get_dross_recycling_entry_detail(entry_id: str, current_user: dict = D
         if isinstance(batch.get('timestamp'), str):
             batch['timestamp'] = datetime.fromisoformat(batch['timestamp'])
     
-    return entry
+    return FastJSONResponse(entry)
 
 @api_router.delete("/admin/dross-recycling/{entry_id}")
 async def delete_dross_recycling_entry(entry_id: str, admin: dict = Depends(require_admin)):
-    result = await db.dross_recycling_entries.delete_one({"id": entry_id})
-    if result.deleted_count == 0:
+    deleted = await db.dross_recycling_entries.find_one_and_delete({"id": entry_id}, projection=INVENTORY_PROJECTION)
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Entry not found")
+    await db.batches.delete_many({"entry_id": entry_id})
+    await log_deletion("dross_recycling", deleted, admin['name'])
+    await notify_data_changed("dross_recycling_entries")
+    await publish_activity(deletion_activity("dross_recycling", entry_id, admin))
     return {"message": "Dross recycling entry deleted successfully"}
 
+# Flattened batches
+# One document per embedded batch of a refining, recycling, dross recycling,
+# RML purchase or Santosh receipt entry, so per-batch analytics can filter on
+# indexed fields instead of unrolling whole entries. A row holds its entry's
+# id, type, date and user, the batch's `source` and the batch's scalar fields
+# (no images). The write, update and delete paths keep it in step with the
+# entries; rebuild_batches() recreates it from them.
+BATCH_COLLECTIONS = ("entries", "dross_recycling_entries", "rml_purchases", "rml_received_santosh")
+# Entry type of each collection's documents ("entries" documents name their own)
+BATCH_ENTRY_TYPES = {"dross_recycling_entries": "dross_recycling", "rml_purchases": "rml_purchase",
+                     "rml_received_santosh": "rml_received_santosh"}
+# The batch field that becomes `source` for each entry type
+BATCH_SOURCE_FIELDS = {"refining": "input_source", "recycling": "battery_type", "dross_recycling": "dross_type",
+                       "rml_purchase": "sku", "rml_received_santosh": "sku"}
+# Batch fields not copied to rows: lot bookkeeping, which is kept on the entries only
+BATCH_ROW_EXCLUDED_FIELDS = {"timestamp", "unallocated_kg"}
+
+def batch_row_id(entry_id: str, batch_index: int) -> str:
+    return f"{entry_id}:{batch_index}"
+
+def flatten_batches(entry_type: str, doc: dict) -> list:
+    """Batch rows for an entry document as stored"""
+    rows = []
+    for index, batch in enumerate(doc.get('batches', [])):
+        row = {
+            "id": batch_row_id(doc['id'], index),
+            "entry_id": doc['id'],
+            "batch_index": index,
+            "type": entry_type,
+            "date": doc['timestamp'][:10],
+            "timestamp": doc['timestamp'],
+            "user_id": doc.get('user_id'),
+            "user_name": doc.get('user_name'),
+            "source": batch.get(BATCH_SOURCE_FIELDS.get(entry_type, ""), ""),
+        }
+        for field, value in batch.items():
+            if field in row or field in BATCH_ROW_EXCLUDED_FIELDS or field.endswith("image"):
+                continue
+            if isinstance(value, (list, dict)):
+                continue
+            row[field] = value
+        rows.append(row)
+    return rows
+
+async def insert_batch_rows(entry_type: str, doc: dict):
+    rows = flatten_batches(entry_type, doc)
+    if rows:
+        await db.batches.insert_many(rows)
+
+def batch_row_updates(entry_id: str, changes: dict) -> list:
+    """Row updates mirroring a {"batches.<index>.<field>": value} $set on an entry"""
+    by_row = {}
+    for path, value in changes.items():
+        _, index, field = path.split(".", 2)
+        if field not in BATCH_ROW_EXCLUDED_FIELDS:
+            by_row.setdefault(batch_row_id(entry_id, int(index)), {})[field] = value
+    return [UpdateOne({"id": row_id}, {"$set": fields}) for row_id, fields in by_row.items()]
+
+async def rebuild_batches() -> int:
+    """Recreate the batch rows from all entries; returns the number of rows"""
+    await db.batches.delete_many({})
+    count = 0
+    for collection in BATCH_COLLECTIONS:
+        rows = []
+        async for doc in db[collection].find({}, {"_id": 0}).batch_size(RECOMPUTE_BATCH_SIZE):
+            rows.extend(flatten_batches(BATCH_ENTRY_TYPES.get(collection) or doc.get('entry_type', ''), doc))
+            if len(rows) >= RECOMPUTE_BATCH_SIZE:
+                await db.batches.insert_many(rows, ordered=False)
+                count += len(rows)
+                rows = []
+        if rows:
+            await db.batches.insert_many(rows, ordered=False)
+            count += len(rows)
+    return count
+
+# SKU registry
+# One document per RML/Santosh SKU with a stable id and its parsed attributes.
+# A SKU is identified by (source, seller, SB%, inward date); the label is the
+# string that refining batches and sales name it by. Batches carry an optional
+# `seller` so two sellers writing the same remark get separate SKUs (the second
+# label is suffixed " #2"). Without it the remark is the seller.
+SKU_SEARCH_LIMIT = 50
+
+def seller_key(seller: str) -> str:
+    return " ".join(seller.split()).lower()
+
+def sku_label(source: str, remarks: str, sb_percentage: float, inward_date: str) -> str:
+    """Both sources show the inward date as DD/MM/YYYY. Santosh labels written
+    before this used YYYY-MM-DD; parse_sku_label still reads those."""
+    day = datetime.strptime(inward_date, "%Y-%m-%d").strftime("%d/%m/%Y")
+    if source == LOT_SOURCES["rml_received_santosh"]:
+        return f"SANTOSH-{remarks}, {sb_percentage}%, {day}"
+    return f"{remarks}, {sb_percentage}%, {day}"
+
+def parse_sku_label(label: str):
+    """(remarks, inward_date as YYYY-MM-DD) from a SKU label, or None"""
+    parts = label.rsplit(", ", 2)
+    if len(parts) != 3:
+        return None
+    remarks, _, day = parts
+    if remarks.startswith("SANTOSH-"):
+        remarks = remarks[len("SANTOSH-"):]
+    for fmt in ("%d/%m/%Y", "%Y-%m-%d"):
+        try:
+            return remarks, datetime.strptime(day, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return None
+
+async def register_sku(source: str, seller: str, sb_percentage: float, inward_date: str, label: str) -> dict:
+    """The registry entry for these attributes, created on first use"""
+    key = {"source": source, "seller_key": seller_key(seller), "sb_percentage": sb_percentage, "inward_date": inward_date}
+    existing = await db.skus.find_one(key, {"_id": 0})
+    if existing:
+        return existing
+    for attempt in range(1, 100):
+        sku = {
+            "id": str(uuid.uuid4()),
+            **key,
+            "seller": seller,
+            "label": label if attempt == 1 else f"{label} #{attempt}",
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        sku["search_label"] = sku["label"].lower()
+        try:
+            await db.skus.insert_one(sku)
+        except DuplicateKeyError:
+            # Either a concurrent request registered the same SKU, or another
+            # seller already holds this label
+            existing = await db.skus.find_one(key, {"_id": 0})
+            if existing:
+                return existing
+            continue
+        sku.pop("_id", None)
+        return sku
+    raise HTTPException(status_code=409, detail=f"Too many SKUs labelled {label}")
+
+# Kinds of refining input. "santosh" is the legacy SANTOSH source, which is
+# deducted from the recycling receivable; the RML kinds are the SKU sources.
+SOURCE_KINDS = ("manual", "santosh", "rml_purchase", "rml_received_santosh")
+
+def classify_input_source(input_source: Optional[str], skus: dict):
+    """(source_kind, sku_id) of a refining input_source. `skus` maps labels to
+    registry entries; labels missing from it are classified by their form."""
+    if input_source in (None, "", "manual"):
+        return "manual", ""
+    if input_source == "SANTOSH":
+        return "santosh", ""
+    sku = skus.get(input_source)
+    if sku:
+        return sku['source'], sku['id']
+    if input_source.startswith("SANTOSH-"):
+        return "rml_received_santosh", ""
+    return "rml_purchase", ""
+
+async def skus_by_label(labels=None) -> dict:
+    query = {"label": {"$in": list(labels)}} if labels is not None else {}
+    return {
+        sku['label']: sku
+        async for sku in db.skus.find(query, {"_id": 0, "id": 1, "label": 1, "source": 1, "sb_percentage": 1,
+                                                  "inward_date": 1})
+    }
+
+async def classify_refining_batches(batches: list):
+    """Store source_kind and sku_id on refining batches about to be written"""
+    skus = await skus_by_label({batch.get('input_source') for batch in batches})
+    for batch in batches:
+        batch['source_kind'], batch['sku_id'] = classify_input_source(batch.get('input_source'), skus)
+
+async def backfill_source_kinds() -> int:
+    """Set source_kind and sku_id on existing refining batches; returns the
+    number of entries changed. Run after backfill_skus."""
+    skus = await skus_by_label()
+    updates, row_updates, changed = [], [], []
+    async for entry in db.entries.find({"entry_type": "refining"}, {**INVENTORY_PROJECTION, "batches.sku_id": 1}):
+        fields = {}
+        for index, batch in enumerate(entry.get('batches', [])):
+            source_kind, sku_id = classify_input_source(batch.get('input_source'), skus)
+            if batch.get('source_kind') != source_kind or batch.get('sku_id') != sku_id:
+                fields[f"batches.{index}.source_kind"] = source_kind
+                fields[f"batches.{index}.sku_id"] = sku_id
+        if fields:
+            updates.append(UpdateOne({"id": entry['id']}, {"$set": fields}))
+            row_updates.extend(batch_row_updates(entry['id'], fields))
+            changed.append(("refining", with_changes(entry, fields)))
+    if updates:
+        await db.entries.bulk_write(updates, ordered=False)
+        await db.batches.bulk_write(row_updates, ordered=False)
+        await log_inventory_changes(changed)
+        await notify_data_changed("entries")
+    return len(updates)
+
+async def backfill_skus() -> dict:
+    """Register the SKUs of existing RML purchases and Santosh receipts and
+    store each batch's sku_id, then link sales of those SKUs (sku_id and
+    SB%). Existing labels are kept as they are."""
+    registered, updated = set(), 0
+    for collection, source in LOT_SOURCES.items():
+        async for doc in db[collection].find({}, {"_id": 0, "id": 1, "timestamp": 1, "batches.sku": 1, "batches.sku_id": 1,
+                                                   "batches.seller": 1, "batches.sb_percentage": 1}):
+            update = {}
+            for index, batch in enumerate(doc.get('batches', [])):
+                label = batch.get('sku')
+                if not label:
+                    continue
+                remarks, inward_date = parse_sku_label(label) or (label, doc['timestamp'][:10])
+                sku = await register_sku(source, batch.get('seller') or remarks, batch.get('sb_percentage'), inward_date, label)
+                registered.add(sku['id'])
+                if batch.get('sku_id') != sku['id']:
+                    update[f"batches.{index}.sku_id"] = sku['id']
+            if update:
+                await db[collection].update_one({"id": doc['id']}, {"$set": update})
+                row_updates = batch_row_updates(doc['id'], update)
+                await db.batches.bulk_write(row_updates, ordered=False)
+                updated += 1
+
+    skus = await skus_by_label()
+    sale_updates = []
+    async for sale in db.sales.find({"sku_type": {"$nin": list(NON_LOT_SOURCES)}},
+                                    {"_id": 0, "id": 1, "sku_type": 1, "sku_id": 1, "sb_percentage": 1}):
+        sku = skus.get(sale['sku_type'])
+        if sku and (sale.get('sku_id') != sku['id'] or sale.get('sb_percentage') != sku['sb_percentage']):
+            sale_updates.append(UpdateOne({"id": sale['id']}, {"$set": {"sku_id": sku['id'], "sb_percentage": sku['sb_percentage']}}))
+    if sale_updates:
+        await db.sales.bulk_write(sale_updates, ordered=False)
+        await notify_data_changed("sales")
+    return {"skus": len(registered), "entries": updated, "sales": len(sale_updates)}
+
+# Inventory lots
+# Every RML purchase batch and Santosh receipt batch is a lot with its own
+# remaining quantity. Refining batches (by input_source) and sales (by
+# sku_type) that name a SKU draw from that SKU's open lots oldest first; the
+# allocations are stored on the consuming batch or sale, so deleting it puts
+# the kg back. Consumption beyond the open lots is kept as unallocated_kg.
+LOT_SOURCES = {"rml_purchases": "rml_purchase", "rml_received_santosh": "rml_received_santosh"}
+# Lots with less than this left are treated as used up (float dust from $inc)
+LOT_EPSILON_KG = 0.001
+# input_source / sku_type values that never refer to a lot
+NON_LOT_SOURCES = {"", "manual", "SANTOSH", "Pure Lead", "High Lead"}
+
+def build_lots(collection: str, doc: dict) -> list:
+    """Lot documents for the batches of an RML purchase or Santosh receipt entry"""
+    lots = []
+    for index, batch in enumerate(doc.get('batches', [])):
+        if not batch.get('sku'):
+            continue
+        lots.append({
+            "id": str(uuid.uuid4()),
+            "source": LOT_SOURCES[collection],
+            "entry_id": doc['id'],
+            "batch_index": index,
+            "sku": batch['sku'],
+            "sku_id": batch.get('sku_id', ''),
+            "seller": batch.get('seller') or batch.get('remarks', ''),
+            "sb_percentage": batch.get('sb_percentage'),
+            "pieces": batch.get('pieces', 0),
+            "quantity_kg": batch.get('quantity_kg', 0),
+            "remaining_kg": batch.get('quantity_kg', 0),
+            "inward_date": doc['timestamp'][:10],
+            "timestamp": doc['timestamp'],
+        })
+    return lots
+
+async def consume_lots(sku: str, quantity_kg: float):
+    """Take `quantity_kg` of `sku` from its open lots, oldest first.
+    Returns (allocations, unallocated_kg)."""
+    allocations = []
+    needed = quantity_kg or 0
+    if sku in NON_LOT_SOURCES:
+        return allocations, 0.0
+    while needed > LOT_EPSILON_KG:
+        lot = await db.lots.find_one(
+            {"sku": sku, "remaining_kg": {"$gt": LOT_EPSILON_KG}},
+            {"_id": 0, "id": 1, "remaining_kg": 1},
+            sort=[("timestamp", 1), ("batch_index", 1)],
+        )
+        if lot is None:
+            break
+        take = min(needed, lot['remaining_kg'])
+        # Conditional decrement: if another request drew from the lot meanwhile, read it again
+        result = await db.lots.update_one(
+            {"id": lot['id'], "remaining_kg": {"$gte": take}}, {"$inc": {"remaining_kg": -take}}
+        )
+        if result.modified_count == 0:
+            continue
+        allocations.append({"lot_id": lot['id'], "kg": take})
+        needed -= take
+    return allocations, round(max(0.0, needed), 3)
+
+async def release_lots(allocations):
+    """Return allocated kg to their lots (lots of deleted entries are skipped)"""
+    for allocation in allocations or []:
+        await db.lots.update_one({"id": allocation['lot_id']}, {"$inc": {"remaining_kg": allocation['kg']}})
+
+async def allocate_refining_batches(batches: list):
+    for batch in batches:
+        allocations, unallocated = await consume_lots(batch.get('input_source', 'manual'), batch.get('lead_ingot_kg', 0))
+        if allocations or unallocated:
+            batch['lot_allocations'] = allocations
+            batch['unallocated_kg'] = unallocated
+
+async def rebuild_lots() -> dict:
+    """Recreate all lots and allocations by replaying purchases, receipts,
+    refining batches and sales in date order. Run it with writes stopped."""
+    lots = []
+    for collection in LOT_SOURCES:
+        async for doc in db[collection].find({}, {"_id": 0, "id": 1, "timestamp": 1, "batches.sku": 1, "batches.sku_id": 1,
+                                                   "batches.seller": 1, "batches.remarks": 1, "batches.sb_percentage": 1,
+                                                   "batches.pieces": 1, "batches.quantity_kg": 1}):
+            lots.extend(build_lots(collection, doc))
+    lots.sort(key=lambda lot: (lot['timestamp'], lot['batch_index']))
+    open_lots = {}
+    for lot in lots:
+        open_lots.setdefault(lot['sku'], []).append(lot)
+
+    def draw(sku, quantity_kg):
+        allocations, needed = [], quantity_kg or 0
+        if sku in NON_LOT_SOURCES:
+            return allocations, 0.0
+        for lot in open_lots.get(sku, []):
+            if needed <= LOT_EPSILON_KG:
+                break
+            if lot['remaining_kg'] <= LOT_EPSILON_KG:
+                continue
+            take = min(needed, lot['remaining_kg'])
+            lot['remaining_kg'] -= take
+            needed -= take
+            allocations.append({"lot_id": lot['id'], "kg": take})
+        return allocations, round(max(0.0, needed), 3)
+
+    # Consumers in date order; refining before sales on the same timestamp
+    consumers = []
+    async for entry in db.entries.find({"entry_type": "refining"}, {"_id": 0, "id": 1, "timestamp": 1,
+                                                                    "batches.input_source": 1, "batches.lead_ingot_kg": 1}):
+        consumers.append((entry['timestamp'], 0, entry))
+    async for sale in db.sales.find({}, {"_id": 0, "id": 1, "timestamp": 1, "sku_type": 1, "quantity_kg": 1}):
+        consumers.append((sale['timestamp'], 1, sale))
+    consumers.sort(key=lambda item: (item[0], item[1]))
+
+    entry_updates, sale_updates = [], []
+    for _, kind, doc in consumers:
+        if kind == 0:
+            update = {"$set": {}, "$unset": {}}
+            for index, batch in enumerate(doc.get('batches', [])):
+                allocations, unallocated = draw(batch.get('input_source', 'manual'), batch.get('lead_ingot_kg', 0))
+                if allocations or unallocated:
+                    update["$set"][f"batches.{index}.lot_allocations"] = allocations
+                    update["$set"][f"batches.{index}.unallocated_kg"] = unallocated
+                else:
+                    update["$unset"][f"batches.{index}.lot_allocations"] = ""
+                    update["$unset"][f"batches.{index}.unallocated_kg"] = ""
+            update = {operator: fields for operator, fields in update.items() if fields}
+            if update:
+                entry_updates.append(UpdateOne({"id": doc['id']}, update))
+        else:
+            allocations, unallocated = draw(doc.get('sku_type', ''), doc.get('quantity_kg', 0))
+            if allocations or unallocated:
+                update = {"$set": {"lot_allocations": allocations, "unallocated_kg": unallocated}}
+            else:
+                update = {"$unset": {"lot_allocations": "", "unallocated_kg": ""}}
+            sale_updates.append(UpdateOne({"id": doc['id']}, update))
+
+    await db.lots.delete_many({})
+    if lots:
+        await db.lots.insert_many(lots)
+    if entry_updates:
+        await db.entries.bulk_write(entry_updates, ordered=False)
+    if sale_updates:
+        await db.sales.bulk_write(sale_updates, ordered=False)
+    await notify_data_changed("entries", "sales", "rml_purchases", "rml_received_santosh")
+    return {"lots": len(lots), "refining_entries": len(entry_updates), "sales": len(sale_updates)}
+
+async def rebuild_derived_data() -> dict:
+    """Bring every collection derived from the entries up to date, in dependency
+    order: SKU registry, batch classification, refining totals, lots, batch
+    rows, then the inventory events for whatever changed"""
+    skus = await backfill_skus()
+    classified = await backfill_source_kinds()
+    totals = await check_refining_totals(repair=True)
+    lots = await rebuild_lots()
+    rows = await rebuild_batches()
+    events = await reconcile_inventory_events()
+    return {"skus": skus['skus'], "refining_entries_classified": classified, "refining_totals_repaired": totals['repaired'],
+            "lots": lots['lots'], "batch_rows": rows, "inventory_events": events['events']}
+
+async def open_lot_balances(source: Optional[str] = None) -> list:
+    """Remaining kg per SKU over open lots, in order of each SKU's oldest lot"""
+    match = {"remaining_kg": {"$gt": LOT_EPSILON_KG}}
+    if source:
+        match["source"] = source
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"timestamp": 1, "batch_index": 1}},
+        {"$group": {
+            "_id": "$sku",
+            "source": {"$first": "$source"},
+            "sb_percentage": {"$first": "$sb_percentage"},
+            "remaining_kg": {"$sum": "$remaining_kg"},
+            "pieces": {"$sum": "$pieces"},
+            "oldest": {"$first": "$timestamp"},
+        }},
+        {"$sort": {"oldest": 1}},
+    ]
+    return await db.lots.aggregate(pipeline).to_list(None)
+
+# Inventory events
+# Every write that changes a stock figure appends an immutable event holding
+# the kg it adds to or takes from each balance ("account"); deleting an entry
+# appends the negated event instead of removing anything. Events are numbered
+# by a shared counter. Every INVENTORY_SNAPSHOT_INTERVAL events the balances
+# are stored as a snapshot, so the current state is the latest snapshot plus
+# the events after it. Bulk repairs that rewrite stored figures append
+# events for the entries they changed (log_inventory_changes()); the full
+# reconcile_inventory_events() is for offline use.
+# Balances as of a date count events by the date they take effect (the
+# entry's date, which may be in the past). Month-end balances are stored as
+# dated snapshots, each holding the events recorded up to its `seq`; a query
+# adds the events effective after its month end plus any recorded since. A
+# dated snapshot is built from the events themselves, up to the latest seq
+# below which none can still be in flight (settled_inventory_seq()).
+INVENTORY_SNAPSHOT_INTERVAL = int(os.environ.get('INVENTORY_SNAPSHOT_INTERVAL', 500))
+# An event is stored within this long of taking its number
+INVENTORY_SETTLE_SECONDS = float(os.environ.get('INVENTORY_SETTLE_SECONDS', 60))
+# Per-account differences below this are float dust, not a change
+INVENTORY_EPSILON_KG = 1e-6
+# Entry type of each collection's documents ("entries" documents name their own)
+INVENTORY_ENTRY_TYPES = {**BATCH_ENTRY_TYPES, "sales": "sale"}
+# Fields inventory_deltas() reads, for projections of deleted documents
+INVENTORY_BATCH_FIELDS = ("input_source", "source_kind", "lead_ingot_kg", "pure_lead_kg", "sb_percentage", *DROSS_FIELDS,
+                          *REFINING_BATCH_TOTAL_FIELDS, "quantity_received", "receivable_kg", "high_lead_recovered", "sku",
+                          "quantity_kg")
+INVENTORY_PROJECTION = {"_id": 0, "id": 1, "entry_type": 1, "timestamp": 1, "sku_type": 1, "quantity_kg": 1,
+                        **{f"batches.{field}": 1 for field in INVENTORY_BATCH_FIELDS}}
+
+def inventory_deltas(entry_type: str, doc: dict) -> dict:
+    """kg an entry adds to each account (negative where it draws stock down)"""
+    deltas = {}
+
+    def add(account, kg):
+        if kg:
+            deltas[account] = deltas.get(account, 0) + kg
+
+    if entry_type == "sale":
+        quantity_kg = doc.get('quantity_kg', 0)
+        sku_type = doc.get('sku_type') or ''
+        add("sold", quantity_kg)
+        if sku_type == "Pure Lead":
+            add("sold:pure_lead", quantity_kg)
+        elif sku_type == "High Lead":
+            add("sold:high_lead", quantity_kg)
+        elif sku_type:
+            add("sold:rml", quantity_kg)
+        if sku_type not in NON_LOT_SOURCES:
+            add(f"sku:{sku_type}", -quantity_kg)
+        return deltas
+    for batch in doc.get('batches', []):
+        if entry_type == "refining":
+            source_kind = batch.get('source_kind') or "manual"
+            totals = refining_batch_totals(batch)
+            add("pure_lead_produced", batch.get('pure_lead_kg', 0))
+            add("dross", totals['total_dross_kg'])
+            add("antimony", totals['antimony_kg'])
+            add(f"refined:{source_kind}", batch.get('lead_ingot_kg', 0))
+            if source_kind in LOT_SOURCES.values():
+                add(f"sku:{batch.get('input_source')}", -batch.get('lead_ingot_kg', 0))
+        elif entry_type == "recycling":
+            add("remelted_lead", batch.get('quantity_received', 0))
+            add("receivable", batch.get('receivable_kg', 0))
+        elif entry_type == "dross_recycling":
+            add("high_lead_recovered", batch.get('high_lead_recovered', 0))
+        elif entry_type in ("rml_purchase", "rml_received_santosh"):
+            add("rml_purchased" if entry_type == "rml_purchase" else "santosh_received", batch.get('quantity_kg', 0))
+            if batch.get('sku'):
+                add(f"sku:{batch['sku']}", batch.get('quantity_kg', 0))
+    return deltas
+
+def inventory_event(event: str, entry_type: str, doc: dict, user_name: str = "", deltas: Optional[dict] = None) -> dict:
+    """A "created", "deleted" or "adjusted" event for `doc`; a deletion takes
+    the entry's deltas back out unless explicit `deltas` are given"""
+    if deltas is None:
+        deltas = inventory_deltas(entry_type, doc)
+        if event == "deleted":
+            deltas = {account: -kg for account, kg in deltas.items()}
+    event_id = str(uuid.uuid4())
+    return {
+        "id": event_id,
+        "key": f"{doc['id']}:{event}" if event in ("created", "deleted") else event_id,
+        "event": event,
+        "entry_type": entry_type,
+        "entry_id": doc['id'],
+        "effective_at": doc.get('timestamp'),
+        "user_name": user_name,
+        "deltas": [{"account": account, "kg": kg} for account, kg in deltas.items()],
+    }
+
+def deletion_events(entry_type: str, doc: dict, user_name: str = "") -> list:
+    """A "created" and a "deleted" event for a document the log has not seen
+    (written before the log and not seeded yet, or whose own route is still
+    logging it), so it nets to zero; a second "created" event is dropped"""
+    return [inventory_event("created", entry_type, doc, user_name), inventory_event("deleted", entry_type, doc, user_name)]
+
+async def log_deletion(entry_type: str, doc: dict, user_name: str):
+    """Log the deletion of `doc` as just removed by a delete route"""
+    if await db.inventory_events.find_one({"key": f"{doc['id']}:created"}, {"_id": 1}) is None:
+        await append_inventory_events(deletion_events(entry_type, doc, user_name))
+    else:
+        await append_inventory_events([inventory_event("deleted", entry_type, doc, user_name)])
+
+async def append_inventory_events(events: list):
+    """Number and store `events`, and take a snapshot when an interval is crossed"""
+    if not events:
+        return
+    counter = await db.counters.find_one_and_update(
+        {"_id": "inventory_events"}, {"$inc": {"seq": len(events)}}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+    last = counter['seq']
+    # Stamped once numbered, so events recorded before a time were numbered before it (settled_inventory_seq())
+    recorded_at = datetime.now(timezone.utc).isoformat()
+    for seq, event in enumerate(events, start=last - len(events) + 1):
+        event['seq'] = seq
+        event['recorded_at'] = recorded_at
+    try:
+        await db.inventory_events.insert_many(events, ordered=False)
+    except BulkWriteError as e:
+        # A "created" or "deleted" event the entry already has (another path recorded it) is dropped
+        if any(error['code'] != 11000 for error in e.details['writeErrors']):
+            raise
+    # Snapshot one interval behind, so writers holding lower numbers have stored their events
+    if last // INVENTORY_SNAPSHOT_INTERVAL > (last - len(events)) // INVENTORY_SNAPSHOT_INTERVAL:
+        boundary = (last // INVENTORY_SNAPSHOT_INTERVAL - 1) * INVENTORY_SNAPSHOT_INTERVAL
+        if boundary > 0:
+            await take_inventory_snapshot(boundary)
+    await notify_data_changed("inventory_events")
+
+async def inventory_balances(through_seq: Optional[int] = None) -> dict:
+    """Account balances after event `through_seq` (default: all events), from
+    the latest snapshot at or before it plus the events since"""
+    snapshot_query = {} if through_seq is None else {"seq": {"$lte": through_seq}}
+    snapshot = await db.inventory_snapshots.find_one(snapshot_query, {"_id": 0}, sort=[("seq", -1)])
+    balances = {row['account']: row['kg'] for row in snapshot['balances']} if snapshot else {}
+    seq_range = {"$gt": snapshot['seq'] if snapshot else 0}
+    if through_seq is not None:
+        seq_range["$lte"] = through_seq
+    async for group in db.inventory_events.aggregate([
+        {"$match": {"seq": seq_range}},
+        {"$project": {"_id": 0, "deltas": 1}},
+        {"$unwind": "$deltas"},
+        {"$group": {"_id": "$deltas.account", "kg": {"$sum": "$deltas.kg"}}},
+    ]):
+        balances[group['_id']] = balances.get(group['_id'], 0) + group['kg']
+    return balances
+
+async def settled_inventory_seq() -> int:
+    """A seq up to which every event is stored: that of the latest event
+    recorded more than INVENTORY_SETTLE_SECONDS ago, as every event numbered
+    before it has had that long to be stored"""
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=INVENTORY_SETTLE_SECONDS)).isoformat()
+    event = await db.inventory_events.find_one({"recorded_at": {"$lt": cutoff}}, {"_id": 0, "seq": 1}, sort=[("seq", -1)])
+    return event['seq'] if event else 0
+
+def next_day(day: str) -> str:
+    return (datetime.strptime(day, "%Y-%m-%d").date() + timedelta(days=1)).isoformat()
+
+async def add_inventory_events(balances: dict, before: str, after: Optional[str] = None, base_seq: int = 0,
+                               through_seq: Optional[int] = None):
+    """Add to `balances` (a snapshot of the days before `after`, holding the
+    events up to `base_seq`) the events effective before the day `before` that
+    it lacks: those effective from `after` on and those recorded since"""
+    clauses = [{"seq": {"$gt": base_seq}, "effective_at": {"$lt": before}}]
+    if after:
+        clauses.append({"effective_at": {"$gte": after, "$lt": before}})
+    match = {"$or": clauses}
+    if through_seq is not None:
+        match["seq"] = {"$lte": through_seq}
+    async for group in db.inventory_events.aggregate([
+        {"$match": match},
+        {"$project": {"_id": 0, "deltas": 1}},
+        {"$unwind": "$deltas"},
+        {"$group": {"_id": "$deltas.account", "kg": {"$sum": "$deltas.kg"}}},
+    ]):
+        balances[group['_id']] = balances.get(group['_id'], 0) + group['kg']
+    return balances
+
+async def month_end_snapshot(month_end: str, safe_seq: int) -> Optional[dict]:
+    """Stored balances as of `month_end`, brought up to event `safe_seq` when
+    more than an interval behind. Built from the closest earlier month end."""
+    snapshot = await db.inventory_dated_snapshots.find_one({"date": month_end}, {"_id": 0})
+    if not safe_seq or (snapshot and safe_seq - snapshot['seq'] <= INVENTORY_SNAPSHOT_INTERVAL):
+        return snapshot
+    base = snapshot or await db.inventory_dated_snapshots.find_one(
+        {"date": {"$lt": month_end}, "seq": {"$lte": safe_seq}}, {"_id": 0}, sort=[("date", -1)]
+    )
+    balances = {row['account']: row['kg'] for row in base['balances']} if base else {}
+    await add_inventory_events(balances, next_day(month_end), next_day(base['date']) if base else None,
+                               base['seq'] if base else 0, through_seq=safe_seq)
+    snapshot = {
+        "date": month_end,
+        "seq": safe_seq,
+        "taken_at": datetime.now(timezone.utc).isoformat(),
+        "balances": [{"account": account, "kg": kg} for account, kg in balances.items()],
+    }
+    try:
+        await db.inventory_dated_snapshots.replace_one({"date": month_end, "seq": {"$lt": safe_seq}}, snapshot, upsert=True)
+    except DuplicateKeyError:
+        pass  # another worker stored it
+    return snapshot
+
+async def inventory_balances_as_of(as_of: str) -> dict:
+    """Account balances over the events effective on or before `as_of`
+    (YYYY-MM-DD), from the month-end snapshot before it"""
+    try:
+        day = datetime.strptime(as_of, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="as_of must be a date in YYYY-MM-DD format")
+    # The month end at or before the date, and only of a month that has ended
+    last_closed = datetime.now(timezone.utc).date().replace(day=1) - timedelta(days=1)
+    month_end = day if (day + timedelta(days=1)).day == 1 else day.replace(day=1) - timedelta(days=1)
+    month_end = min(month_end, last_closed).isoformat()
+    # A dated snapshot may only cover events that are certainly all stored
+    snapshot = await month_end_snapshot(month_end, await settled_inventory_seq())
+    balances = {row['account']: row['kg'] for row in snapshot['balances']} if snapshot else {}
+    return await add_inventory_events(balances, next_day(day.isoformat()), next_day(snapshot['date']) if snapshot else None,
+                                      snapshot['seq'] if snapshot else 0)
+
+async def sku_balances(balances: dict) -> list:
+    """RML and Santosh SKUs with stock in `balances` (received less used in
+    refining and sold), oldest inward date first, shaped like open_lot_balances()"""
+    stock = {account[4:]: kg for account, kg in balances.items() if account.startswith("sku:") and kg > LOT_EPSILON_KG}
+    skus = await skus_by_label(stock)
+    ordered = sorted(stock, key=lambda label: (skus.get(label, {}).get('inward_date') or "", label))
+    return [{"_id": label, "sb_percentage": skus.get(label, {}).get('sb_percentage'), "remaining_kg": stock[label]}
+            for label in ordered]
+
+async def take_inventory_snapshot(through_seq: int):
+    balances = await inventory_balances(through_seq)
+    try:
+        await db.inventory_snapshots.insert_one({
+            "seq": through_seq,
+            "taken_at": datetime.now(timezone.utc).isoformat(),
+            "balances": [{"account": account, "kg": kg} for account, kg in balances.items()],
+        })
+    except DuplicateKeyError:
+        pass  # another worker took it
+
+def inventory_changes(expected: dict, recorded: dict) -> dict:
+    """Per-account kg that takes `recorded` to `expected`, without float dust"""
+    changes = {account: expected.get(account, 0) - recorded.get(account, 0) for account in {*expected, *recorded}}
+    return {account: kg for account, kg in changes.items() if abs(kg) > INVENTORY_EPSILON_KG}
+
+def with_changes(doc: dict, changes: dict) -> dict:
+    """`doc` with the `batches.{index}.{field}` paths of a $set applied"""
+    batches = [dict(batch) for batch in doc.get('batches', [])]
+    for path, value in changes.items():
+        if path.startswith("batches."):
+            _, index, field = path.split(".", 2)
+            batches[int(index)][field] = value
+    return {**doc, "batches": batches}
+
+async def log_inventory_changes(entries: list, deleted: bool = False):
+    """Append events for `entries`, (entry_type, doc) pairs projected on
+    INVENTORY_PROJECTION as now stored (or, with `deleted`, as just removed),
+    against the events already logged for those entries only, so it is safe
+    while other writes run. An entry the log has not seen gets its "created"
+    event, which its own write path may also be recording; one of them is kept."""
+    for start in range(0, len(entries), RECOMPUTE_BATCH_SIZE):
+        chunk = entries[start:start + RECOMPUTE_BATCH_SIZE]
+        ids = [doc['id'] for _, doc in chunk]
+        logged = {}
+        async for group in db.inventory_events.aggregate([
+            {"$match": {"entry_id": {"$in": ids}}},
+            {"$project": {"_id": 0, "entry_id": 1, "deltas": 1}},
+            {"$unwind": "$deltas"},
+            {"$group": {"_id": {"entry_id": "$entry_id", "account": "$deltas.account"}, "kg": {"$sum": "$deltas.kg"}}},
+        ]):
+            logged.setdefault(group['_id']['entry_id'], {})[group['_id']['account']] = group['kg']
+        kinds = {}
+        async for event in db.inventory_events.find({"entry_id": {"$in": ids}}, {"_id": 0, "entry_id": 1, "event": 1}):
+            kinds.setdefault(event['entry_id'], set()).add(event['event'])
+        events = []
+        for entry_type, doc in chunk:
+            seen = kinds.get(doc['id'], set())
+            if "deleted" in seen:
+                # Removed meanwhile by its delete route, which took out the deltas as stored
+                if deleted or "created" in seen:
+                    continue
+                changes, event = inventory_deltas(entry_type, doc), "created"
+            elif deleted:
+                if not seen:
+                    # A document from before the log, or whose "created" event is still being written
+                    events.extend(deletion_events(entry_type, doc))
+                    continue
+                changes, event = inventory_changes({}, logged.get(doc['id'], {})), "deleted"
+            else:
+                changes = inventory_changes(inventory_deltas(entry_type, doc), logged.get(doc['id'], {}))
+                event = "adjusted" if seen else "created"
+            if changes:
+                events.append(inventory_event(event, entry_type, doc, deltas=changes))
+        await append_inventory_events(events)
+
+# Seeding the log on the first start after upgrading. One process holds the
+# claim (`counters` "inventory_events_seed") under a lease it renews while it
+# works; a claim whose lease lapsed without `completed_at` is taken over and
+# the seed run again, which is safe as documents already logged add nothing.
+# Stock figures read from the log answer 503 until the seed has completed.
+INVENTORY_SEED_LEASE_SECONDS = float(os.environ.get('INVENTORY_SEED_LEASE_SECONDS', 300))
+_inventory_seed = {"complete": False}
+
+async def claim_inventory_seed() -> Optional[str]:
+    """Take the seed claim unless it is complete or held under a live lease;
+    returns the claim's started_at, which renewals match on, or None"""
+    now = datetime.now(timezone.utc)
+    started_at = now.isoformat()
+    try:
+        await db.counters.update_one(
+            {"_id": "inventory_events_seed", "completed_at": {"$exists": False},
+             "$or": [{"lease_until": {"$exists": False}}, {"lease_until": {"$lt": started_at}}]},
+            {"$set": {"started_at": started_at,
+                      "lease_until": (now + timedelta(seconds=INVENTORY_SEED_LEASE_SECONDS)).isoformat()}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return None  # complete, or another process holds it
+    return started_at
+
+async def renew_inventory_seed(started_at: str):
+    lease_until = datetime.now(timezone.utc) + timedelta(seconds=INVENTORY_SEED_LEASE_SECONDS)
+    await db.counters.update_one({"_id": "inventory_events_seed", "started_at": started_at},
+                                 {"$set": {"lease_until": lease_until.isoformat()}})
+
+async def run_inventory_seed(started_at: str) -> int:
+    """Log every stored document the log has not seen, then mark the claim
+    complete; returns the documents read"""
+    seeded = 0
+    for collection, entry_type in [("entries", None), *INVENTORY_ENTRY_TYPES.items()]:
+        docs = []
+        async for doc in db[collection].find({}, INVENTORY_PROJECTION).batch_size(RECOMPUTE_BATCH_SIZE):
+            docs.append((entry_type or doc.get('entry_type'), doc))
+            if len(docs) == RECOMPUTE_BATCH_SIZE:
+                await log_inventory_changes(docs)
+                await renew_inventory_seed(started_at)
+                seeded, docs = seeded + len(docs), []
+        await log_inventory_changes(docs)
+        seeded += len(docs)
+    await db.counters.update_one({"_id": "inventory_events_seed"},
+                                 {"$set": {"completed_at": datetime.now(timezone.utc).isoformat()}})
+    # Summaries refused or computed while seeding are recomputed
+    await notify_data_changed("inventory_events")
+    logger.info("Seeded the inventory event log from %d documents", seeded)
+    return seeded
+
+async def seed_inventory_events() -> int:
+    """Seed the log if no process has completed it or holds the claim;
+    returns the documents read"""
+    started_at = await claim_inventory_seed()
+    if started_at is None:
+        return 0
+    return await run_inventory_seed(started_at)
+
+async def watch_inventory_seed(started_at: Optional[str]):
+    """Run the seed claimed at startup, or wait for the process holding it and
+    take over if its lease lapses before it completes"""
+    while True:
+        if started_at is not None:
+            try:
+                await run_inventory_seed(started_at)
+                return
+            except Exception:
+                logger.exception("Seeding the inventory event log failed; retrying when the lease lapses")
+        claim = await db.counters.find_one({"_id": "inventory_events_seed"}, {"_id": 0, "completed_at": 1})
+        if claim is not None and claim.get('completed_at'):
+            return
+        await asyncio.sleep(INVENTORY_SEED_LEASE_SECONDS / 2)
+        started_at = await claim_inventory_seed()
+
+async def require_inventory_log():
+    """503 while the log is being seeded, as its balances are still partial"""
+    if _inventory_seed["complete"]:
+        return
+    claim = await db.counters.find_one({"_id": "inventory_events_seed"}, {"_id": 0, "completed_at": 1})
+    if claim is not None and not claim.get('completed_at'):
+        raise HTTPException(status_code=503, detail="Stock figures are being rebuilt after an upgrade, try again shortly")
+    # Without a claim nothing is pending yet (every start takes it before serving)
+    _inventory_seed["complete"] = claim is not None
+
+async def reconcile_inventory_events() -> dict:
+    """Append the events that make the log agree with the stored documents:
+    "created" for documents without events (including everything written
+    before the log existed), "adjusted" where stored figures were changed in
+    place, "deleted" for documents removed outside the delete routes. It
+    reads the whole log before the documents, so run it with writes stopped."""
+    logged = {}
+    async for group in db.inventory_events.aggregate([
+        {"$sort": {"seq": 1}},
+        {"$unwind": "$deltas"},
+        {"$group": {
+            "_id": {"entry_id": "$entry_id", "account": "$deltas.account"},
+            "kg": {"$sum": "$deltas.kg"},
+            "entry_type": {"$last": "$entry_type"},
+            "effective_at": {"$last": "$effective_at"},
+            "events": {"$addToSet": "$event"},
+        }},
+    ]):
+        entry = logged.setdefault(group['_id']['entry_id'], {
+            "id": group['_id']['entry_id'], "entry_type": group['entry_type'],
+            "timestamp": group['effective_at'], "deltas": {}, "events": set(),
+        })
+        entry['deltas'][group['_id']['account']] = group['kg']
+        entry['events'].update(group['events'])
+
+    events = []
+    for collection, entry_type in [("entries", None), *INVENTORY_ENTRY_TYPES.items()]:
+        async for doc in db[collection].find({}, INVENTORY_PROJECTION):
+            doc_type = entry_type or doc.get('entry_type')
+            previous = logged.pop(doc['id'], None)
+            changes = inventory_changes(inventory_deltas(doc_type, doc), previous['deltas'] if previous else {})
+            if changes:
+                events.append(inventory_event("adjusted" if previous else "created", doc_type, doc, deltas=changes))
+    for entry in logged.values():
+        changes = inventory_changes({}, entry['deltas'])
+        if changes:
+            event = "adjusted" if "deleted" in entry['events'] else "deleted"
+            events.append(inventory_event(event, entry['entry_type'], entry, deltas=changes))
+    events.sort(key=lambda event: event['effective_at'] or "")
+    await append_inventory_events(events)
+    return {"events": len(events)}
+
+def summary_from_balances(balances: dict) -> SummaryStats:
+    def kg(account):
+        return balances.get(account, 0)
+
+    total_pure_lead_manufactured = kg("pure_lead_produced")
+    total_high_lead = kg("high_lead_recovered")
+    total_remelted_lead = kg("remelted_lead")
+    total_rml_purchased = kg("rml_purchased")
+    rml_received_santosh_total = kg("santosh_received")
+    total_sold = kg("sold")
+    
+    # Receivable less SANTOSH used in refining and RML received from Santosh
+    total_receivable = max(0, kg("receivable") - kg("refined:santosh") - rml_received_santosh_total)
+    
+    pure_lead_stock = max(0, total_pure_lead_manufactured - kg("sold:pure_lead"))
+    # RML Stock = RML Purchases + RML Received Santosh - RML SKUs Used in Refining - RML Sold
+    rml_stock = max(0, total_rml_purchased + rml_received_santosh_total - kg("refined:rml_purchase")
+                    - kg("refined:rml_received_santosh") - kg("sold:rml"))
+    high_lead_stock = max(0, total_high_lead - kg("sold:high_lead"))
+    
+    # Legacy calculations for backward compatibility
+    remelted_lead_in_stock = max(0, total_remelted_lead + total_rml_purchased - total_sold)
+    available_stock = pure_lead_stock + rml_stock + high_lead_stock
+    
+    return SummaryStats(
+        # New simplified dashboard stats
+        pure_lead_stock=round(pure_lead_stock, 2),
+        rml_stock=round(rml_stock, 2),
+        total_receivable=round(total_receivable, 2),
+        high_lead_stock=round(high_lead_stock, 2),
+        total_dross=round(kg("dross"), 2),
+        antimony_recoverable=round(kg("antimony"), 2),
+        # Legacy fields
+        total_pure_lead_manufactured=round(total_pure_lead_manufactured, 2),
+        total_remelted_lead=round(total_remelted_lead, 2),
+        total_sold=round(total_sold, 2),
+        available_stock=round(available_stock, 2),
+        remelted_lead_in_stock=round(remelted_lead_in_stock, 2),
+        total_high_lead=round(total_high_lead, 2),
+        total_rml_purchased=round(total_rml_purchased, 2)
+    )
+
 # RML Purchases
 @api_router.post("/rml-purchases")
 async def create_rml_purchase(
@@ -609,26 +2396,21 @@ async def create_rml_purchase(
         if not remarks:
             remarks = 'RML'
         
-        # Use entry_date for the date of inward
-        if entry_date:
-            inward_date = entry_date  # Format: YYYY-MM-DD
-            # Convert to DD/MM/YYYY format
-            from datetime import datetime as dt
-            date_obj = dt.fromisoformat(entry_date)
-            formatted_date = date_obj.strftime("%d/%m/%Y")
-        else:
-            from datetime import datetime as dt
-            formatted_date = dt.now().strftime("%d/%m/%Y")
-        
-        sku = f"{remarks}, {batch_data['sb_percentage']}%, {formatted_date}"
+        # Use entry_date for the date of inward (same UTC day as the entry timestamp)
+        inward_date = entry_date or datetime.now(timezone.utc).strftime('%Y-%m-%d')
+        seller = batch_data.get('seller') or remarks
+        label = sku_label("rml_purchase", remarks, batch_data['sb_percentage'], inward_date)
+        sku = await register_sku("rml_purchase", seller, batch_data['sb_percentage'], inward_date, label)
         
         batch = RMLPurchaseBatch(
             quantity_kg=batch_data['quantity_kg'],
             pieces=batch_data['pieces'],
             sb_percentage=batch_data['sb_percentage'],
             remarks=batch_data.get('remarks', ''),
+            seller=seller,
             image=image,
-            sku=sku
+            sku=sku['label'],
+            sku_id=sku['id']
         )
         batches.append(batch)
     
@@ -652,6 +2434,13 @@ async def create_rml_purchase(
         batch['timestamp'] = batch['timestamp'].isoformat()
     
     await db.rml_purchases.insert_one(doc)
+    lots = build_lots("rml_purchases", doc)
+    if lots:
+        await db.lots.insert_many(lots)
+    await insert_batch_rows("rml_purchase", doc)
+    await append_inventory_events([inventory_event("created", "rml_purchase", doc, current_user["name"])])
+    await notify_data_changed("rml_purchases")
+    await publish_activity(summarize_activity("rml_purchase", doc))
     return {"id": entry.id, "message": "RML purchase created successfully"}
 
 @api_router.get("/rml-purchases")
@@ -667,14 +2456,19 @@ async def get_rml_purchases(current_user: dict = Depends(get_current_user)):
                 batch['timestamp'] = datetime.fromisoformat(batch['timestamp'])
             batch.pop('image', None)  # Don't return image data in list
     
-    return entries
+    return FastJSONResponse(entries)
 
 @api_router.delete("/admin/rml-purchases/{entry_id}")
 async def delete_rml_purchase(entry_id: str, admin: dict = Depends(require_admin)):
     """Delete an RML purchase entry (TT admin only)"""
-    result = await db.rml_purchases.delete_one({"id": entry_id})
-    if result.deleted_count == 0:
+    deleted = await db.rml_purchases.find_one_and_delete({"id": entry_id}, projection=INVENTORY_PROJECTION)
+    if deleted is None:
         raise HTTPException(status_code=404, detail="RML purchase entry not found")
+    await db.lots.delete_many({"entry_id": entry_id})
+    await db.batches.delete_many({"entry_id": entry_id})
+    await log_deletion("rml_purchase", deleted, admin['name'])
+    await notify_data_changed("rml_purchases")
+    await publish_activity(deletion_activity("rml_purchase", entry_id, admin))
     return {"message": "RML purchase entry deleted successfully"}
 
 @api_router.delete("/admin/clear-all-data")
@@ -682,98 +2476,43 @@ async def clear_all_data(admin: dict = Depends(require_admin)):
     """Clear all entries from the database (TT admin only) - keeps users and settings"""
     deleted = {}
     
-    # Clear all data collections
-    result = await db.entries.delete_many({})
-    deleted['entries'] = result.deleted_count
-    
-    result = await db.dross_recycling_entries.delete_many({})
-    deleted['dross_recycling'] = result.deleted_count
-    
-    result = await db.rml_purchases.delete_many({})
-    deleted['rml_purchases'] = result.deleted_count
-    
-    result = await db.rml_received_santosh.delete_many({})
-    deleted['rml_received_santosh'] = result.deleted_count
-    
-    result = await db.sales.delete_many({})
-    deleted['sales'] = result.deleted_count
-    
+    # Clear all data collections. Documents are removed by id, as read, so the
+    # event log (which is kept) records exactly the removals.
+    for collection, name in [("entries", "entries"), ("dross_recycling_entries", "dross_recycling"),
+                             ("rml_purchases", "rml_purchases"), ("rml_received_santosh", "rml_received_santosh"),
+                             ("sales", "sales")]:
+        deleted[name] = 0
+        docs = await db[collection].find({}, INVENTORY_PROJECTION).to_list(None)
+        for start in range(0, len(docs), RECOMPUTE_BATCH_SIZE):
+            chunk = docs[start:start + RECOMPUTE_BATCH_SIZE]
+            result = await db[collection].delete_many({"id": {"$in": [doc['id'] for doc in chunk]}})
+            deleted[name] += result.deleted_count
+            await log_inventory_changes(
+                [(INVENTORY_ENTRY_TYPES.get(collection) or doc.get('entry_type'), doc) for doc in chunk], deleted=True
+            )
+    
+    await db.lots.delete_many({})
+    await db.skus.delete_many({})
+    await db.batches.delete_many({})
+    
+    await notify_data_changed(*SUMMARY_COLLECTIONS)
     return {"message": "All data cleared successfully", "deleted": deleted}
 
 @api_router.get("/rml-purchases/skus")
+@cached_query("rml_purchases", "rml_received_santosh", "entries", "sales")
 async def get_rml_skus(current_user: dict = Depends(get_current_user)):
     """Get available RML SKUs for use in refining (includes RML Purchases and RML Received Santosh)"""
-    # Get RML Purchases
-    entries = await db.rml_purchases.find({}, {"_id": 0}).to_list(1000)
-    
-    # Get RML Received Santosh
-    santosh_entries = await db.rml_received_santosh.find({}, {"_id": 0}).to_list(1000)
-    
-    # Get refining entries to calculate used quantities
-    refining_entries = await db.entries.find({"entry_type": "refining"}, {"_id": 0}).to_list(10000)
-    
-    # Aggregate SKUs with available quantities
-    skus = {}
-    
-    # Add RML Purchases
-    for entry in entries:
-        for batch in entry.get('batches', []):
-            sku = batch.get('sku', '')
-            if sku:
-                if sku not in skus:
-                    skus[sku] = {
-                        'sku': sku,
-                        'sb_percentage': batch.get('sb_percentage', 0),
-                        'total_quantity_kg': 0,
-                        'total_pieces': 0
-                    }
-                skus[sku]['total_quantity_kg'] += batch.get('quantity_kg', 0)
-                skus[sku]['total_pieces'] += batch.get('pieces', 0)
-    
-    # Add RML Received Santosh
-    for entry in santosh_entries:
-        for batch in entry.get('batches', []):
-            sku = batch.get('sku', '')
-            if sku:
-                if sku not in skus:
-                    skus[sku] = {
-                        'sku': sku,
-                        'sb_percentage': batch.get('sb_percentage', 0),
-                        'total_quantity_kg': 0,
-                        'total_pieces': 0
-                    }
-                skus[sku]['total_quantity_kg'] += batch.get('quantity_kg', 0)
-                skus[sku]['total_pieces'] += batch.get('pieces', 0)
-    
-    # Deduct used in refining
-    for entry in refining_entries:
-        for batch in entry.get('batches', []):
-            input_source = batch.get('input_source', 'manual')
-            if input_source in skus:
-                skus[input_source]['total_quantity_kg'] -= batch.get('lead_ingot_kg', 0)
-    
-    # Return SKUs with available quantity > 0
-    result = []
-    for sku, data in skus.items():
-        available = max(0, data['total_quantity_kg'])
-        if available > 0:
-            result.append({
-                'sku': data['sku'],
-                'sb_percentage': data['sb_percentage'],
-                'total_quantity_kg': round(available, 2),
-                'total_pieces': data['total_pieces']
-            })
-    
-    return result
-
-@api_router.delete("/admin/rml-purchases/{entry_id}")
-async def delete_rml_purchase(entry_id: str, admin: dict = Depends(require_admin)):
-    result = await db.rml_purchases.delete_one({"id": entry_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Entry not found")
-    return {"message": "RML purchase deleted successfully"}
+    balances = await open_lot_balances()
+    return FastJSONResponse([
+        {
+            'sku': balance['_id'],
+            'sb_percentage': balance['sb_percentage'],
+            'total_quantity_kg': round(balance['remaining_kg'], 2),
+            'total_pieces': balance['pieces']
+        }
+        for balance in balances
+    ])
 
-# RML Received Santosh - deducts from recycling receivable
 @api_router.post("/rml-received-santosh")
 async def create_rml_received_santosh(
     batches_data: str = Form(...),
@@ -790,26 +2529,26 @@ async def create_rml_received_santosh(
         if idx < len(files):
             image = base64.b64encode(await files[idx].read()).decode('utf-8')
         
-        # Generate SKU: "SANTOSH, {sb}%, {date}"
+        # Generate SKU: "SANTOSH-{remarks}, {sb}%, {date}"
         remarks = batch_data.get('remarks', 'SANTOSH')
         if not remarks:
             remarks = 'SANTOSH'
         
         # Use entry_date if provided, otherwise use current date
-        if entry_date:
-            formatted_date = entry_date
-        else:
-            formatted_date = datetime.now(timezone.utc).strftime('%Y-%m-%d')
-        
-        sku = f"SANTOSH-{remarks}, {batch_data['sb_percentage']}%, {formatted_date}"
+        inward_date = entry_date or datetime.now(timezone.utc).strftime('%Y-%m-%d')
+        seller = batch_data.get('seller') or remarks
+        label = sku_label("rml_received_santosh", remarks, batch_data['sb_percentage'], inward_date)
+        sku = await register_sku("rml_received_santosh", seller, batch_data['sb_percentage'], inward_date, label)
         
         batch = RMLReceivedSantoshBatch(
             quantity_kg=batch_data['quantity_kg'],
             pieces=batch_data['pieces'],
             sb_percentage=batch_data['sb_percentage'],
             remarks=remarks,
+            seller=seller,
             image=image,
-            sku=sku
+            sku=sku['label'],
+            sku_id=sku['id']
         )
         batches.append(batch)
     
@@ -833,6 +2572,13 @@ async def create_rml_received_santosh(
         batch['timestamp'] = batch['timestamp'].isoformat()
     
     await db.rml_received_santosh.insert_one(doc)
+    lots = build_lots("rml_received_santosh", doc)
+    if lots:
+        await db.lots.insert_many(lots)
+    await insert_batch_rows("rml_received_santosh", doc)
+    await append_inventory_events([inventory_event("created", "rml_received_santosh", doc, current_user["name"])])
+    await notify_data_changed("rml_received_santosh")
+    await publish_activity(summarize_activity("rml_received_santosh", doc))
     return {"id": entry.id, "message": "RML Received Santosh entry created successfully"}
 
 @api_router.get("/rml-received-santosh")
@@ -848,55 +2594,33 @@ async def get_rml_received_santosh(current_user: dict = Depends(get_current_user
                 batch['timestamp'] = datetime.fromisoformat(batch['timestamp'])
             batch.pop('image', None)  # Don't return image data in list
     
-    return entries
+    return FastJSONResponse(entries)
 
 @api_router.get("/rml-received-santosh/skus")
+@cached_query("rml_received_santosh", "entries", "sales")
 async def get_rml_received_santosh_skus(current_user: dict = Depends(get_current_user)):
     """Get available RML Received Santosh SKUs for use in refining"""
-    entries = await db.rml_received_santosh.find({}, {"_id": 0}).to_list(1000)
-    
-    # Get refining entries to calculate used quantities
-    refining_entries = await db.entries.find({"entry_type": "refining"}, {"_id": 0}).to_list(10000)
-    
-    # Aggregate SKUs with quantities
-    skus = {}
-    for entry in entries:
-        for batch in entry.get('batches', []):
-            sku = batch.get('sku', '')
-            if sku:
-                if sku not in skus:
-                    skus[sku] = {
-                        'quantity_kg': 0,
-                        'sb_percentage': batch.get('sb_percentage', 0)
-                    }
-                skus[sku]['quantity_kg'] += batch.get('quantity_kg', 0)
-    
-    # Deduct used in refining
-    for entry in refining_entries:
-        for batch in entry.get('batches', []):
-            input_source = batch.get('input_source', 'manual')
-            if input_source.startswith('SANTOSH-') and input_source in skus:
-                skus[input_source]['quantity_kg'] -= batch.get('lead_ingot_kg', 0)
-    
-    # Return SKUs with available quantity > 0
-    result = []
-    for sku, data in skus.items():
-        available = max(0, data['quantity_kg'])
-        if available > 0:
-            result.append({
-                'sku': sku,
-                'available_kg': round(available, 2),
-                'sb_percentage': data['sb_percentage']
-            })
-    
-    return result
+    balances = await open_lot_balances(source=LOT_SOURCES["rml_received_santosh"])
+    return FastJSONResponse([
+        {
+            'sku': balance['_id'],
+            'available_kg': round(balance['remaining_kg'], 2),
+            'sb_percentage': balance['sb_percentage']
+        }
+        for balance in balances
+    ])
 
 @api_router.delete("/admin/rml-received-santosh/{entry_id}")
 async def delete_rml_received_santosh(entry_id: str, admin: dict = Depends(require_admin)):
     """Delete an RML Received Santosh entry (TT admin only)"""
-    result = await db.rml_received_santosh.delete_one({"id": entry_id})
-    if result.deleted_count == 0:
+    deleted = await db.rml_received_santosh.find_one_and_delete({"id": entry_id}, projection=INVENTORY_PROJECTION)
+    if deleted is None:
         raise HTTPException(status_code=404, detail="RML Received Santosh entry not found")
+    await db.lots.delete_many({"entry_id": entry_id})
+    await db.batches.delete_many({"entry_id": entry_id})
+    await log_deletion("rml_received_santosh", deleted, admin['name'])
+    await notify_data_changed("rml_received_santosh")
+    await publish_activity(deletion_activity("rml_received_santosh", entry_id, admin))
     return {"message": "RML Received Santosh entry deleted successfully"}
 
 @api_router.get("/entries")
@@ -918,7 +2642,7 @@ async def get_entries(current_user: dict = Depends(get_current_user)):
             batch.pop('battery_image', None)
             batch.pop('remelted_lead_image', None)
     
-    return entries
+    return FastJSONResponse(entries)
 
 @api_router.get("/entries/{entry_id}")
 async def get_entry_detail(entry_id: str, current_user: dict = Depends(get_current_user)):
@@ -933,11 +2657,16 @@ async def get_entry_detail(entry_id: str, current_user: dict = Depends(get_curre
         if isinstance(batch.get('timestamp'), str):
             batch['timestamp'] = datetime.fromisoformat(batch['timestamp'])
     
-    return entry
+    return FastJSONResponse(entry)
+
+# Just the refining fields the dross views show (no images)
+DROSS_PROJECTION = {"_id": 0, "id": 1, "user_name": 1, "timestamp": 1, "batches.timestamp": 1, "batches.total_dross_kg": 1,
+                    **{f"batches.{field}": 1 for field in DROSS_FIELDS}}
 
 @api_router.get("/dross")
+@cached_query("entries")
 async def get_dross_data(current_user: dict = Depends(get_current_user)):
-    refining_entries = await db.entries.find({"entry_type": "refining"}, {"_id": 0}).to_list(10000)
+    refining_entries = await db.entries.find({"entry_type": "refining"}, DROSS_PROJECTION).to_list(10000)
     
     dross_data = []
     for entry in refining_entries:
@@ -957,11 +2686,11 @@ async def get_dross_data(current_user: dict = Depends(get_current_user)):
                 'cu_dross_kg': batch.get('cu_dross_kg', 0),
                 'sn_dross_kg': batch.get('sn_dross_kg', 0),
                 'sb_dross_kg': batch.get('sb_dross_kg', 0),
-                'total_dross': batch.get('initial_dross_kg', 0) + batch.get('cu_dross_kg', 0) + batch.get('sn_dross_kg', 0) + batch.get('sb_dross_kg', 0)
+                'total_dross': refining_batch_totals(batch)['total_dross_kg']
             })
     
     dross_data.sort(key=lambda x: x['timestamp'], reverse=True)
-    return dross_data
+    return FastJSONResponse(dross_data)
 
 @api_router.get("/dross/recoveries")
 async def get_dross_recoveries(current_user: dict = Depends(get_current_user)):
@@ -970,16 +2699,83 @@ async def get_dross_recoveries(current_user: dict = Depends(get_current_user)):
     # The actual HIGH LEAD recovery is tracked via /api/dross-recycling/entries
     return []
 
+# Lots
+@api_router.get("/lots")
+async def get_lots(
+    sku: Optional[str] = None,
+    source: Optional[str] = None,
+    open_only: bool = True,
+    current_user: dict = Depends(get_current_user)
+):
+    """RML and Santosh lots in FIFO order with their remaining kg, SB% and age"""
+    query = {}
+    if sku:
+        query["sku"] = sku
+    if source:
+        query["source"] = source
+    if open_only:
+        query["remaining_kg"] = {"$gt": LOT_EPSILON_KG}
+    lots = await db.lots.find(query, {"_id": 0}).sort([("timestamp", 1), ("batch_index", 1)]).to_list(10000)
+    
+    today = datetime.now(timezone.utc).date()
+    for lot in lots:
+        lot['remaining_kg'] = round(max(0, lot['remaining_kg']), 2)
+        lot['age_days'] = (today - datetime.fromisoformat(lot['inward_date']).date()).days
+    return FastJSONResponse(lots)
+
+# Inventory events
+INVENTORY_EVENTS_PAGE_MAX = 1000
+
+@api_router.get("/admin/inventory-events")
+async def list_inventory_events(
+    entry_id: Optional[str] = None,
+    after_seq: int = 0,
+    limit: int = 100,
+    admin: dict = Depends(require_admin)
+):
+    """Inventory events in the order they were recorded, from `after_seq` on"""
+    query = {"seq": {"$gt": after_seq}}
+    if entry_id:
+        query["entry_id"] = entry_id
+    limit = max(1, min(limit, INVENTORY_EVENTS_PAGE_MAX))
+    events = await db.inventory_events.find(query, {"_id": 0}).sort("seq", 1).limit(limit).to_list(None)
+    return FastJSONResponse(events)
+
+# SKU registry
+@api_router.get("/skus")
+async def search_skus(
+    q: str = "",
+    source: Optional[str] = None,
+    limit: int = 20,
+    current_user: dict = Depends(get_current_user)
+):
+    """Autocomplete over registered SKUs: `q` matches the start of the label or
+    of the seller name, case-insensitively. Sorted by label."""
+    query = {}
+    prefix = seller_key(q)
+    if prefix:
+        # Anchored, case-sensitive regexes on lower-cased fields are index range scans
+        pattern = "^" + re.escape(prefix)
+        query["$or"] = [{"search_label": {"$regex": pattern}}, {"seller_key": {"$regex": pattern}}]
+    if source:
+        query["source"] = source
+    limit = max(1, min(limit, SKU_SEARCH_LIMIT))
+    skus = await db.skus.find(query, {"_id": 0, "search_label": 0, "seller_key": 0}).sort("search_label", 1).limit(limit).to_list(None)
+    return FastJSONResponse(skus)
+
 # Sales
 @api_router.post("/sales", response_model=SaleEntry)
 async def create_sale(sale_data: SaleCreate, current_user: dict = Depends(get_current_user)):
+    sku = (await skus_by_label([sale_data.sku_type])).get(sale_data.sku_type) or {}
     sale = SaleEntry(
         user_id=current_user["id"],
         user_name=current_user["name"],
         party_name=sale_data.party_name,
         sku_type=sale_data.sku_type,
         quantity_kg=sale_data.quantity_kg,
-        entry_date=sale_data.entry_date
+        entry_date=sale_data.entry_date,
+        sku_id=sku.get('id', ''),
+        sb_percentage=sku.get('sb_percentage')
     )
     
     doc = sale.model_dump()
@@ -992,29 +2788,32 @@ async def create_sale(sale_data: SaleCreate, current_user: dict = Depends(get_cu
     else:
         doc['timestamp'] = doc['timestamp'].isoformat()
     
-    await db.sales.insert_one(doc)
+    allocations, unallocated = await consume_lots(doc['sku_type'], doc['quantity_kg'])
+    if allocations or unallocated:
+        doc['lot_allocations'] = allocations
+        doc['unallocated_kg'] = unallocated
+    try:
+        await db.sales.insert_one(doc)
+    except Exception:
+        await release_lots(allocations)
+        raise
+    await append_inventory_events([inventory_event("created", "sale", doc, current_user["name"])])
+    await notify_data_changed("sales")
+    await publish_activity(summarize_activity("sale", doc))
     
-    return sale
+    return FastJSONResponse(sale)
 
 @api_router.get("/sales/available-skus", response_model=List[AvailableSKU])
-async def get_available_skus(current_user: dict = Depends(get_current_user)):
-    """Get all available SKUs with their current stock for sales"""
+@cached_query(*SUMMARY_COLLECTIONS)
+async def get_available_skus(as_of: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """Get all available SKUs with their current stock for sales, or with
+    `as_of` (YYYY-MM-DD) their stock at the end of that day"""
+    await require_inventory_log()
     available_skus = []
+    balances = await inventory_balances_as_of(as_of) if as_of else await inventory_balances()
     
-    # Get all refining entries for calculations
-    refining_entries = await db.entries.find({"entry_type": "refining"}, {"_id": 0}).to_list(10000)
-    
-    # Get all sales
-    sales = await db.sales.find({}, {"_id": 0}).to_list(10000)
-    
-    # Calculate Pure Lead stock
-    total_pure_lead = sum(
-        batch['pure_lead_kg']
-        for entry in refining_entries
-        for batch in entry.get('batches', [])
-    )
-    pure_lead_sold = sum(sale['quantity_kg'] for sale in sales if sale.get('sku_type') == 'Pure Lead')
-    pure_lead_stock = max(0, total_pure_lead - pure_lead_sold)
+    # Pure Lead produced in refining less Pure Lead sold
+    pure_lead_stock = max(0, balances.get("pure_lead_produced", 0) - balances.get("sold:pure_lead", 0))
     
     if pure_lead_stock > 0:
         available_skus.append(AvailableSKU(
@@ -1024,15 +2823,8 @@ async def get_available_skus(current_user: dict = Depends(get_current_user)):
             display_name="Pure Lead"
         ))
     
-    # Calculate High Lead stock
-    dross_recycling_entries = await db.dross_recycling_entries.find({}, {"_id": 0}).to_list(10000)
-    total_high_lead = sum(
-        batch['high_lead_recovered']
-        for entry in dross_recycling_entries
-        for batch in entry.get('batches', [])
-    )
-    high_lead_sold = sum(sale['quantity_kg'] for sale in sales if sale.get('sku_type') == 'High Lead')
-    high_lead_stock = max(0, total_high_lead - high_lead_sold)
+    # High Lead recovered from dross less High Lead sold
+    high_lead_stock = max(0, balances.get("high_lead_recovered", 0) - balances.get("sold:high_lead", 0))
     
     if high_lead_stock > 0:
         available_skus.append(AvailableSKU(
@@ -1042,70 +2834,16 @@ async def get_available_skus(current_user: dict = Depends(get_current_user)):
             display_name="High Lead"
         ))
     
-    # Calculate RML SKUs stock
-    rml_purchases = await db.rml_purchases.find({}, {"_id": 0}).to_list(10000)
-    
-    # Aggregate RML purchases by SKU
-    rml_skus = {}
-    for entry in rml_purchases:
-        for batch in entry.get('batches', []):
-            sku = batch.get('sku', '')
-            if sku:
-                if sku not in rml_skus:
-                    rml_skus[sku] = {
-                        'purchased_kg': 0,
-                        'sb_percentage': batch.get('sb_percentage', 0)
-                    }
-                rml_skus[sku]['purchased_kg'] += batch.get('quantity_kg', 0)
-    
-    # Deduct RML used in refining
-    for entry in refining_entries:
-        for batch in entry.get('batches', []):
-            input_source = batch.get('input_source', 'manual')
-            if input_source != 'manual' and input_source != 'SANTOSH':
-                # This is an RML SKU used in refining
-                if input_source in rml_skus:
-                    rml_skus[input_source]['purchased_kg'] -= batch.get('lead_ingot_kg', 0)
-    
-    # Deduct RML sold
-    for sale in sales:
-        sku_type = sale.get('sku_type', '')
-        if sku_type and sku_type not in ['Pure Lead', 'High Lead']:
-            if sku_type in rml_skus:
-                rml_skus[sku_type]['purchased_kg'] -= sale['quantity_kg']
-    
-    # Add RML Received Santosh entries to rml_skus
-    rml_santosh_entries = await db.rml_received_santosh.find({}, {"_id": 0}).to_list(10000)
-    for entry in rml_santosh_entries:
-        for batch in entry.get('batches', []):
-            sku = batch.get('sku', '')
-            if sku:
-                if sku not in rml_skus:
-                    rml_skus[sku] = {
-                        'purchased_kg': 0,
-                        'sb_percentage': batch.get('sb_percentage', 0)
-                    }
-                rml_skus[sku]['purchased_kg'] += batch.get('quantity_kg', 0)
-    
-    # Deduct Santosh SKUs used in refining
-    for entry in refining_entries:
-        for batch in entry.get('batches', []):
-            input_source = batch.get('input_source', 'manual')
-            if input_source.startswith('SANTOSH-') and input_source in rml_skus:
-                rml_skus[input_source]['purchased_kg'] -= batch.get('lead_ingot_kg', 0)
-    
-    # Add RML SKUs with positive stock
-    for sku, data in rml_skus.items():
-        stock = max(0, data['purchased_kg'])
-        if stock > 0:
-            available_skus.append(AvailableSKU(
-                sku_type=sku,
-                sb_percentage=data['sb_percentage'],
-                available_kg=round(stock, 2),
-                display_name=f"{sku} (SB: {data['sb_percentage']}%)"
-            ))
+    # RML and Santosh SKUs: open lot balances, or past stock from the SKU balances
+    for balance in await sku_balances(balances) if as_of else await open_lot_balances():
+        available_skus.append(AvailableSKU(
+            sku_type=balance['_id'],
+            sb_percentage=balance['sb_percentage'],
+            available_kg=round(balance['remaining_kg'], 2),
+            display_name=f"{balance['_id']} (SB: {balance['sb_percentage']}%)"
+        ))
     
-    return available_skus
+    return FastJSONResponse(available_skus)
 
 @api_router.get("/sales")
 async def get_sales(current_user: dict = Depends(get_current_user)):
@@ -1115,151 +2853,302 @@ async def get_sales(current_user: dict = Depends(get_current_user)):
         if isinstance(sale['timestamp'], str):
             sale['timestamp'] = datetime.fromisoformat(sale['timestamp'])
     
-    return sales
+    return FastJSONResponse(sales)
+
+# Sales analytics
+SALES_ANALYTICS_TOP_MAX = 100
+
+def sales_group(key) -> list:
+    """$group stages for one breakdown: kg and sale count per `key`, largest first"""
+    return [
+        {"$group": {"_id": key, "quantity_kg": {"$sum": "$quantity_kg"}, "sale_count": {"$sum": 1}}},
+        {"$sort": {"quantity_kg": -1, "_id": 1}},
+    ]
+
+def sales_rows(groups: list, name: str) -> list:
+    return [
+        {name: group['_id'], "quantity_kg": round(group['quantity_kg'], 2), "sale_count": group['sale_count']}
+        for group in groups
+    ]
+
+@api_router.get("/sales/analytics")
+@cached_query("sales")
+async def get_sales_analytics(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    top: int = 10,
+    current_user: dict = Depends(get_current_user)
+):
+    """Sold kg and number of sales by party, SKU, month and SB%, plus the top
+    `top` customers. Grouped in the database in one pass over the date range."""
+    top = max(1, min(top, SALES_ANALYTICS_TOP_MAX))
+    # Timestamps are ISO strings, so the first seven characters are the month
+    result = await db.sales.aggregate([
+        {"$match": entry_date_range_query(start_date, end_date)},
+        {"$project": {"_id": 0, "party_name": 1, "sku_type": 1, "sb_percentage": 1, "quantity_kg": 1, "timestamp": 1}},
+        {"$facet": {
+            "total": [{"$group": {"_id": None, "quantity_kg": {"$sum": "$quantity_kg"}, "sale_count": {"$sum": 1}}}],
+            "by_party": sales_group("$party_name"),
+            "by_sku": sales_group("$sku_type"),
+            "by_month": [*sales_group({"$substr": ["$timestamp", 0, 7]}), {"$sort": {"_id": 1}}],
+            "by_sb_percentage": sales_group({"$ifNull": ["$sb_percentage", None]}),
+        }},
+    ]).to_list(None)
+    groups = result[0] if result else {}
+    total = (groups.get('total') or [{"quantity_kg": 0, "sale_count": 0}])[0]
+    by_party = sales_rows(groups.get('by_party', []), "party_name")
+    return FastJSONResponse({
+        "total_kg": round(total['quantity_kg'], 2),
+        "sale_count": total['sale_count'],
+        "by_party": by_party,
+        "by_sku": sales_rows(groups.get('by_sku', []), "sku_type"),
+        "by_month": sales_rows(groups.get('by_month', []), "month"),
+        "by_sb_percentage": sales_rows(groups.get('by_sb_percentage', []), "sb_percentage"),
+        "top_customers": by_party[:top],
+    })
 
 @api_router.delete("/admin/sales/{sale_id}")
 async def delete_sale(sale_id: str, admin: dict = Depends(require_admin)):
-    result = await db.sales.delete_one({"id": sale_id})
-    if result.deleted_count == 0:
+    deleted = await db.sales.find_one_and_delete({"id": sale_id}, projection={**INVENTORY_PROJECTION, "lot_allocations": 1})
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Sale not found")
+    await release_lots(deleted.get('lot_allocations'))
+    await log_deletion("sale", deleted, admin['name'])
+    await notify_data_changed("sales")
+    await publish_activity(deletion_activity("sale", sale_id, admin))
     return {"message": "Sale deleted successfully"}
 
+# History search
+# Entries are matched through their batch rows (one entry matches when any of
+# its batches does) and returned whole but without images; sales are matched
+# directly. Newest first, paged, with the total number of matches.
+HISTORY_PAGE_SIZE_MAX = 100
+# Where each type's rows are read from, and the kg field min_kg/max_kg apply to
+HISTORY_COLLECTIONS = {"refining": "entries", "recycling": "entries", "dross_recycling": "dross_recycling_entries",
+                       "rml_purchase": "rml_purchases", "rml_received_santosh": "rml_received_santosh", "sale": "sales"}
+HISTORY_KG_FIELDS = {"refining": "lead_ingot_kg", "recycling": "battery_kg", "dross_recycling": "quantity_sent",
+                     "rml_purchase": "quantity_kg", "rml_received_santosh": "quantity_kg", "sale": "quantity_kg"}
+HISTORY_IMAGE_FIELDS = ("lead_ingot_image", "initial_dross_image", "cu_dross_image", "sn_dross_image", "sb_dross_image",
+                        "pure_lead_image", "battery_image", "remelted_lead_image", "spectro_image", "image")
+HISTORY_ENTRY_PROJECTION = {"_id": 0, **{f"batches.{field}": 0 for field in HISTORY_IMAGE_FIELDS}}
+
+def kg_range_query(min_kg: Optional[float], max_kg: Optional[float]) -> Optional[dict]:
+    kg_filter = {}
+    if min_kg is not None:
+        kg_filter["$gte"] = min_kg
+    if max_kg is not None:
+        kg_filter["$lte"] = max_kg
+    return kg_filter or None
+
+@api_router.get("/history/search")
+async def search_history(
+    type: str,
+    user: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    sku: Optional[str] = None,
+    battery_type: Optional[str] = None,
+    party: Optional[str] = None,
+    min_kg: Optional[float] = None,
+    max_kg: Optional[float] = None,
+    q: Optional[str] = None,
+    page: int = 1,
+    page_size: int = 50,
+    current_user: dict = Depends(get_current_user)
+):
+    """Filtered, paged history of one type of entry or of sales.
+
+    `sku` is the refining input source, the purchase/receipt SKU or the sold
+    SKU; `battery_type` applies to recycling and `party` (a case-insensitive
+    prefix) to sales. `q` is a full-text search over names, SKUs and remarks."""
+    if type not in HISTORY_COLLECTIONS:
+        raise HTTPException(status_code=400, detail=f"type must be one of: {', '.join(HISTORY_COLLECTIONS)}")
+    if battery_type and type != "recycling":
+        raise HTTPException(status_code=400, detail="battery_type only applies to recycling")
+    if party and type != "sale":
+        raise HTTPException(status_code=400, detail="party only applies to sales")
+    if sku and type in ("recycling", "dross_recycling"):
+        raise HTTPException(status_code=400, detail=f"sku does not apply to {type}")
+    page = max(1, page)
+    page_size = max(1, min(page_size, HISTORY_PAGE_SIZE_MAX))
+    kg_filter = kg_range_query(min_kg, max_kg)
+
+    if type == "sale":
+        query = entry_date_range_query(start_date, end_date)
+        if q:
+            query["$text"] = {"$search": q}
+        if user:
+            query["user_name"] = user
+        if sku:
+            query["sku_type"] = sku
+        if party:
+            query["party_name"] = {"$regex": "^" + re.escape(party), "$options": "i"}
+        if kg_filter:
+            query["quantity_kg"] = kg_filter
+        total = await db.sales.count_documents(query)
+        rows = await db.sales.find(query, {"_id": 0, "lot_allocations": 0}).sort([("timestamp", -1), ("id", 1)]) \
+            .skip((page - 1) * page_size).limit(page_size).to_list(None)
+        return FastJSONResponse({"total": total, "page": page, "page_size": page_size, "rows": rows})
+
+    match = {"type": type}
+    if q:
+        match["$text"] = {"$search": q}
+    date_filter = entry_date_range_query(start_date, end_date).get("timestamp")
+    if date_filter:
+        match["date"] = date_filter
+    if user:
+        match["user_name"] = user
+    if sku or battery_type:
+        match["source"] = sku or battery_type
+    if kg_filter:
+        match[HISTORY_KG_FIELDS[type]] = kg_filter
+    result = await db.batches.aggregate([
+        {"$match": match},
+        {"$group": {"_id": "$entry_id", "timestamp": {"$first": "$timestamp"}}},
+        {"$sort": {"timestamp": -1, "_id": 1}},
+        {"$facet": {
+            "total": [{"$count": "count"}],
+            "page": [{"$skip": (page - 1) * page_size}, {"$limit": page_size}],
+        }},
+    ]).to_list(None)
+    total = result[0]["total"][0]["count"] if result and result[0]["total"] else 0
+    entry_ids = [row["_id"] for row in result[0]["page"]] if result else []
+    entries = {
+        entry['id']: entry
+        async for entry in db[HISTORY_COLLECTIONS[type]].find({"id": {"$in": entry_ids}}, HISTORY_ENTRY_PROJECTION)
+    }
+    rows = [entries[entry_id] for entry_id in entry_ids if entry_id in entries]
+    return FastJSONResponse({"total": total, "page": page, "page_size": page_size, "rows": rows})
+
 # Summary
 @api_router.get("/summary", response_model=SummaryStats)
-async def get_summary(current_user: dict = Depends(get_current_user)):
-    # Get all refining entries
-    refining_entries = await db.entries.find({"entry_type": "refining"}, {"_id": 0}).to_list(10000)
-    
-    # Calculate total pure lead produced from refining
-    total_pure_lead_manufactured = sum(
-        batch['pure_lead_kg']
-        for entry in refining_entries
-        for batch in entry.get('batches', [])
-    )
-    
-    # Calculate total dross from refining
-    total_dross = sum(
-        batch.get('initial_dross_kg', 0) + batch.get('cu_dross_kg', 0) + batch.get('sn_dross_kg', 0) + batch.get('sb_dross_kg', 0)
-        for entry in refining_entries
-        for batch in entry.get('batches', [])
-    )
-    
-    # Calculate Antimony Recoverable from Drosses
-    # Formula: SB% x Quantity / 100 for each batch (to get actual antimony weight)
-    antimony_recoverable = sum(
-        (batch.get('sb_percentage', 0) or 0) * batch.get('lead_ingot_kg', 0) / 100
-        for entry in refining_entries
-        for batch in entry.get('batches', [])
-        if batch.get('sb_percentage')  # Only count batches with SB% entered
-    )
-    
-    # Get dross recycling entries for High Lead
-    dross_recycling_entries = await db.dross_recycling_entries.find({}, {"_id": 0}).to_list(10000)
-    total_high_lead = sum(
-        batch['high_lead_recovered']
-        for entry in dross_recycling_entries
-        for batch in entry.get('batches', [])
-    )
-    
-    # Get recycling entries for receivable
-    recycling_entries = await db.entries.find({"entry_type": "recycling"}, {"_id": 0}).to_list(10000)
-    total_remelted_lead = sum(
-        batch.get('quantity_received', 0)
-        for entry in recycling_entries
-        for batch in entry.get('batches', [])
-    )
-    
-    # Calculate lead receivable from recycling
-    raw_receivable = sum(
-        batch.get('receivable_kg', 0)
-        for entry in recycling_entries
-        for batch in entry.get('batches', [])
-    )
-    
-    # Calculate SANTOSH usage (deduct from receivable) - legacy SANTOSH input source
-    santosh_usage = sum(
-        batch.get('lead_ingot_kg', 0)
-        for entry in refining_entries
-        for batch in entry.get('batches', [])
-        if batch.get('input_source') == 'SANTOSH'
-    )
-    
-    # Calculate RML Received Santosh total (deduct from receivable)
-    rml_received_santosh_entries = await db.rml_received_santosh.find({}, {"_id": 0}).to_list(10000)
-    rml_received_santosh_total = sum(
-        batch.get('quantity_kg', 0)
-        for entry in rml_received_santosh_entries
-        for batch in entry.get('batches', [])
-    )
-    
-    # Adjust receivable by deducting SANTOSH usage and RML Received Santosh
-    total_receivable = max(0, raw_receivable - santosh_usage - rml_received_santosh_total)
-    
-    # RML Purchases
-    rml_purchases = await db.rml_purchases.find({}, {"_id": 0}).to_list(10000)
-    total_rml_purchased = sum(
-        batch.get('quantity_kg', 0)
-        for entry in rml_purchases
-        for batch in entry.get('batches', [])
-    )
-    
-    # Calculate RML Purchases used in refining (non-manual, non-SANTOSH, non-SANTOSH- input sources)
-    rml_purchases_used_in_refining = sum(
-        batch.get('lead_ingot_kg', 0)
-        for entry in refining_entries
-        for batch in entry.get('batches', [])
-        if batch.get('input_source') not in ['manual', 'SANTOSH', None, ''] 
-        and not batch.get('input_source', '').startswith('SANTOSH-')
-    )
-    
-    # Calculate RML Received Santosh used in refining (SANTOSH- prefixed SKUs)
-    santosh_skus_used_in_refining = sum(
-        batch.get('lead_ingot_kg', 0)
-        for entry in refining_entries
-        for batch in entry.get('batches', [])
-        if batch.get('input_source', '').startswith('SANTOSH-')
-    )
-    
-    # Get all sales
-    sales = await db.sales.find({}, {"_id": 0}).to_list(10000)
-    total_sold = sum(sale['quantity_kg'] for sale in sales)
-    
-    # Calculate SKU-specific sales
-    pure_lead_sold = sum(sale['quantity_kg'] for sale in sales if sale.get('sku_type') == 'Pure Lead')
-    high_lead_sold = sum(sale['quantity_kg'] for sale in sales if sale.get('sku_type') == 'High Lead')
-    rml_sold = sum(sale['quantity_kg'] for sale in sales if sale.get('sku_type') not in ['Pure Lead', 'High Lead', None, ''])
-    
-    # Calculate final stocks
-    pure_lead_stock = max(0, total_pure_lead_manufactured - pure_lead_sold)
-    # RML Stock = RML Purchases + RML Received Santosh - RML SKUs Used in Refining - RML Sold
-    rml_stock = max(0, total_rml_purchased + rml_received_santosh_total - rml_purchases_used_in_refining - santosh_skus_used_in_refining - rml_sold)
-    high_lead_stock = max(0, total_high_lead - high_lead_sold)
-    
-    # Legacy calculations for backward compatibility
-    remelted_lead_in_stock = max(0, total_remelted_lead + total_rml_purchased - total_sold)
-    available_stock = pure_lead_stock + rml_stock + high_lead_stock
-    
-    return SummaryStats(
-        # New simplified dashboard stats
-        pure_lead_stock=round(pure_lead_stock, 2),
-        rml_stock=round(rml_stock, 2),
-        total_receivable=round(total_receivable, 2),
-        high_lead_stock=round(high_lead_stock, 2),
-        total_dross=round(total_dross, 2),
-        antimony_recoverable=round(antimony_recoverable, 2),
-        # Legacy fields
-        total_pure_lead_manufactured=round(total_pure_lead_manufactured, 2),
-        total_remelted_lead=round(total_remelted_lead, 2),
-        total_sold=round(total_sold, 2),
-        available_stock=round(available_stock, 2),
-        remelted_lead_in_stock=round(remelted_lead_in_stock, 2),
-        total_high_lead=round(total_high_lead, 2),
-        total_rml_purchased=round(total_rml_purchased, 2)
+async def get_summary(as_of: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """Dashboard figures; with `as_of` (YYYY-MM-DD), counting only entries dated on or before it"""
+    return FastJSONResponse(await compute_summary(as_of))
+
+@cached_query("inventory_events")
+async def compute_summary(as_of: Optional[str] = None) -> SummaryStats:
+    await require_inventory_log()
+    # Balances from the latest inventory snapshot and the events after it
+    if as_of:
+        return summary_from_balances(await inventory_balances_as_of(as_of))
+    return summary_from_balances(await inventory_balances())
+
+# Live summary stream (Server-Sent Events)
+# One producer per worker recomputes the summary after a burst of writes and
+# publishes only the stats that changed, however many screens are connected.
+SUMMARY_STREAM_DEBOUNCE_SECONDS = 1.0
+# Without a change stream, writes from other workers are only seen on this refresh
+SUMMARY_STREAM_FALLBACK_REFRESH_SECONDS = 30.0
+SUMMARY_STREAM_HEARTBEAT_SECONDS = 15.0
+
+summary_broadcaster = Broadcaster()
+_summary_snapshot = {"stats": None}
+_summary_snapshot_lock = asyncio.Lock()
+
+async def get_summary_snapshot() -> dict:
+    async with _summary_snapshot_lock:
+        if _summary_snapshot["stats"] is None:
+            _summary_snapshot["stats"] = (await compute_summary()).model_dump()
+        return _summary_snapshot["stats"]
+
+async def run_summary_stream():
+    while True:
+        timeout = None if _change_stream_active else SUMMARY_STREAM_FALLBACK_REFRESH_SECONDS
+        try:
+            await asyncio.wait_for(_summary_dirty.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+        if not summary_broadcaster.subscribers:
+            # Nobody is watching: drop the snapshot instead of recomputing it
+            _summary_dirty.clear()
+            _summary_snapshot["stats"] = None
+            continue
+
+        # Let a burst of writes settle so it costs a single recomputation
+        await asyncio.sleep(SUMMARY_STREAM_DEBOUNCE_SECONDS)
+        _summary_dirty.clear()
+        try:
+            stats = (await compute_summary()).model_dump()
+        except Exception:
+            logger.exception("Failed to recompute summary for stream")
+            continue
+
+        async with _summary_snapshot_lock:
+            previous = _summary_snapshot["stats"] or {}
+            _summary_snapshot["stats"] = stats
+        delta = {key: value for key, value in stats.items() if previous.get(key) != value}
+        if delta:
+            summary_broadcaster.publish(delta)
+
+def format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@api_router.get("/stream/summary")
+async def stream_summary(request: Request, token: str):
+    """Server-Sent Events: a 'snapshot' event with all stats, then 'delta' events
+    with only the stats that changed. EventSource cannot send headers, so the
+    access token is passed as a query parameter."""
+    await get_user_from_token(token)
+    await require_inventory_log()
+    queue = summary_broadcaster.subscribe()
+
+    async def event_stream():
+        try:
+            yield format_sse("snapshot", await get_summary_snapshot())
+            while True:
+                try:
+                    delta = await asyncio.wait_for(queue.get(), timeout=SUMMARY_STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                if delta is None:
+                    # Dropped for falling behind; the client reconnects and gets a fresh snapshot
+                    break
+                yield format_sse("delta", delta)
+        finally:
+            summary_broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
+# Live activity feed (WebSocket)
+@api_router.websocket("/ws/activity")
+async def activity_feed(websocket: WebSocket, token: str):
+    try:
+        await get_user_from_token(token)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    queue = activity_broadcaster.subscribe()
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=ACTIVITY_FEED_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                await websocket.send_json({"action": "ping"})
+                continue
+            if event is None:
+                # Dropped for falling behind
+                await websocket.close(code=1013)
+                break
+            await websocket.send_json(event)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        activity_broadcaster.unsubscribe(queue)
+
 @api_router.get("/dross/export/excel")
 async def export_dross_excel(current_user: dict = Depends(get_current_user)):
-    refining_entries = await db.entries.find({"entry_type": "refining"}, {"_id": 0}).sort("timestamp", -1).to_list(10000)
+    refining_entries = await db.entries.find({"entry_type": "refining"}, DROSS_PROJECTION).sort("timestamp", -1).to_list(10000)
     
     wb = Workbook()
     ws_dross = wb.active
@@ -1286,7 +3175,7 @@ async def export_dross_excel(current_user: dict = Depends(get_current_user)):
             timestamp = datetime.fromisoformat(timestamp)
         
         for batch_idx, batch in enumerate(entry.get('batches', []), 1):
-            total_dross = batch.get('initial_dross_kg', 0) + batch.get('cu_dross_kg', 0) + batch.get('sn_dross_kg', 0) + batch.get('sb_dross_kg', 0)
+            total_dross = refining_batch_totals(batch)['total_dross_kg']
             
             ws_dross.cell(row=row_num, column=1, value=timestamp.strftime("%Y-%m-%d"))
             ws_dross.cell(row=row_num, column=2, value=timestamp.strftime("%H:%M:%S"))
@@ -1363,7 +3252,7 @@ async def export_entries_excel(current_user: dict = Depends(get_current_user)):
     headers_refining = [
         "Date", "Time", "Employee", "Batch #",
         "Lead Ingot (kg)", "Pieces",
-        "Initial Dross (kg)", "2nd Dross (kg)", "3rd Dross (kg)",
+        "Initial Dross (kg)", "CU Dross (kg)", "SN Dross (kg)", "SB Dross (kg)",
         "Pure Lead Output (kg)"
     ]
     
@@ -1391,9 +3280,10 @@ async def export_entries_excel(current_user: dict = Depends(get_current_user)):
                 ws_refining.cell(row=row_num, column=5, value=batch['lead_ingot_kg'])
                 ws_refining.cell(row=row_num, column=6, value=batch['lead_ingot_pieces'])
                 ws_refining.cell(row=row_num, column=7, value=batch['initial_dross_kg'])
-                ws_refining.cell(row=row_num, column=8, value=batch['dross_2nd_kg'])
-                ws_refining.cell(row=row_num, column=9, value=batch['dross_3rd_kg'])
-                ws_refining.cell(row=row_num, column=10, value=batch['pure_lead_kg'])
+                ws_refining.cell(row=row_num, column=8, value=batch.get('cu_dross_kg', 0))
+                ws_refining.cell(row=row_num, column=9, value=batch.get('sn_dross_kg', 0))
+                ws_refining.cell(row=row_num, column=10, value=batch.get('sb_dross_kg', 0))
+                ws_refining.cell(row=row_num, column=11, value=batch['pure_lead_kg'])
                 row_num += 1
     
     ws_recycling = wb.create_sheet("Recycling")
@@ -1430,7 +3320,7 @@ async def export_entries_excel(current_user: dict = Depends(get_current_user)):
                 row_num += 1
     
     ws_sales = wb.create_sheet("Sales")
-    headers_sales = ["Date", "Time", "Employee", "Party Name", "Quantity Sold (kg)"]
+    headers_sales = ["Date", "Time", "Employee", "Party Name", "SKU", "Quantity Sold (kg)"]
     
     for col_num, header in enumerate(headers_sales, 1):
         cell = ws_sales.cell(row=1, column=col_num, value=header)
@@ -1448,7 +3338,8 @@ async def export_entries_excel(current_user: dict = Depends(get_current_user)):
         ws_sales.cell(row=row_num, column=2, value=timestamp.strftime("%H:%M:%S"))
         ws_sales.cell(row=row_num, column=3, value=sale['user_name'])
         ws_sales.cell(row=row_num, column=4, value=sale['party_name'])
-        ws_sales.cell(row=row_num, column=5, value=sale['quantity_kg'])
+        ws_sales.cell(row=row_num, column=5, value=sale.get('sku_type', ''))
+        ws_sales.cell(row=row_num, column=6, value=sale['quantity_kg'])
     
     for ws in [ws_refining, ws_recycling, ws_sales]:
         for column in ws.columns:
@@ -1483,12 +3374,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Server-sent events must reach the client as they are written
+app.add_middleware(CompressionMiddleware, fastapi_app=app, exclude_routes={"/api/stream/summary"})
+app.add_middleware(ProfilingMiddleware, authorize=profile_request_user, store=store_request_profile)
+app.add_middleware(PrometheusMiddleware, fastapi_app=app)
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
+def reset_caches():
+    query_cache.clear()
+    _collection_versions.clear()
+    invalidate_recycling_columns()
+    invalidate_recovery_settings()
+    _inventory_seed["complete"] = False
+
+@app.on_event("startup")
+async def start_background_watchers():
+    if db is None:
+        connect_database()
+    start_background_task(watch_recovery_settings())
+    start_background_task(watch_data_changes())
+    start_background_task(run_summary_stream())
+    start_background_task(tail_activity_feed())
+    start_background_task(loop_monitor.run())
+    await ensure_indexes()
+    await ensure_profile_collection()
+    # Upgraded databases have entries but no event log yet. Claim before
+    # serving so that summaries wait for the seed, then seed in the background.
+    start_background_task(watch_inventory_seed(await claim_inventory_seed()))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    for task in list(_background_tasks):
+        task.cancel()
+    if client is not None:
+        client.close()
\ No newline at end of file
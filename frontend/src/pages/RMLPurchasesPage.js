@@ -24,6 +24,7 @@ export default function RMLPurchasesPage({ user }) {
     quantity_kg: '',
     pieces: '',
     sb_percentage: '',
+    seller: '',
     remarks: '',
     images: []
   }]);
@@ -34,6 +35,7 @@ export default function RMLPurchasesPage({ user }) {
       quantity_kg: '',
       pieces: '',
       sb_percentage: '',
+      seller: '',
       remarks: '',
       images: []
     }]);
@@ -101,11 +103,11 @@ export default function RMLPurchasesPage({ user }) {
   const handleSubmit = async () => {
     // Validate all batches
     const incompleteBatches = batches.filter(b => 
-      !b.quantity_kg || !b.pieces || !b.sb_percentage || !b.remarks || b.images.length === 0
+      !b.quantity_kg || !b.pieces || !b.sb_percentage || !b.seller || !b.remarks || b.images.length === 0
     );
 
     if (incompleteBatches.length > 0) {
-      toast.error('Please complete all fields (quantity, pieces, SB%, seller name/remark, and at least one photo)');
+      toast.error('Please complete all fields (quantity, pieces, SB%, seller name, remark, and at least one photo)');
       return;
     }
 
@@ -117,6 +119,7 @@ export default function RMLPurchasesPage({ user }) {
         quantity_kg: parseFloat(batch.quantity_kg),
         pieces: parseInt(batch.pieces),
         sb_percentage: parseFloat(batch.sb_percentage),
+        seller: batch.seller,
         remarks: batch.remarks || ''
       }));
       
@@ -149,7 +152,7 @@ export default function RMLPurchasesPage({ user }) {
 
   const canSubmit = () => {
     return batches.every(batch => 
-      batch.quantity_kg && batch.pieces && batch.sb_percentage && batch.remarks && batch.images.length > 0
+      batch.quantity_kg && batch.pieces && batch.sb_percentage && batch.seller && batch.remarks && batch.images.length > 0
     );
   };
 
@@ -345,16 +348,32 @@ export default function RMLPurchasesPage({ user }) {
 
               <div>
                 <Label className="block text-sm font-bold text-slate-500 uppercase tracking-wider mb-2">
-                  Seller Name / Remark <span className="text-red-500">*</span>
+                  Seller Name <span className="text-red-500">*</span>
+                </Label>
+                <Input
+                  type="text"
+                  value={batch.seller}
+                  onChange={(e) => handleInputChange(batchIndex, 'seller', e.target.value)}
+                  className="h-14 text-xl px-4 w-full border-2 border-slate-200 rounded-lg focus:ring-2 focus:ring-purple-200 focus:border-purple-400"
+                  placeholder="Enter seller name (required)"
+                />
+                {!batch.seller && (
+                  <p className="text-sm text-red-500 mt-1">* Seller Name is required</p>
+                )}
+              </div>
+
+              <div>
+                <Label className="block text-sm font-bold text-slate-500 uppercase tracking-wider mb-2">
+                  Remark <span className="text-red-500">*</span>
                 </Label>
                 <Textarea
                   value={batch.remarks}
                   onChange={(e) => handleInputChange(batchIndex, 'remarks', e.target.value)}
                   className="min-h-[80px] text-lg px-4 py-3 w-full border-2 border-slate-200 rounded-lg focus:ring-2 focus:ring-purple-200 focus:border-purple-400"
-                  placeholder="Enter seller name or remarks (required)"
+                  placeholder="Enter remark shown in the SKU (required)"
                 />
                 {!batch.remarks && (
-                  <p className="text-sm text-red-500 mt-1">* Seller Name / Remark is required</p>
+                  <p className="text-sm text-red-500 mt-1">* Remark is required</p>
                 )}
               </div>
 
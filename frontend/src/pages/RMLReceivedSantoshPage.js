@@ -24,6 +24,7 @@ export default function RMLReceivedSantoshPage({ user }) {
     quantity_kg: '',
     pieces: '',
     sb_percentage: '',
+    seller: '',
     remarks: '',
     images: []
   }]);
@@ -34,6 +35,7 @@ export default function RMLReceivedSantoshPage({ user }) {
       quantity_kg: '',
       pieces: '',
       sb_percentage: '',
+      seller: '',
       remarks: '',
       images: []
     }]);
@@ -101,11 +103,11 @@ export default function RMLReceivedSantoshPage({ user }) {
   const handleSubmit = async () => {
     // Validate all batches
     const incompleteBatches = batches.filter(b => 
-      !b.quantity_kg || !b.pieces || !b.sb_percentage || b.images.length === 0
+      !b.quantity_kg || !b.pieces || !b.sb_percentage || !b.seller || b.images.length === 0
     );
 
     if (incompleteBatches.length > 0) {
-      toast.error('Please complete all fields (quantity, pieces, SB%, and at least one photo)');
+      toast.error('Please complete all fields (quantity, pieces, SB%, seller name, and at least one photo)');
       return;
     }
 
@@ -117,6 +119,7 @@ export default function RMLReceivedSantoshPage({ user }) {
         quantity_kg: parseFloat(batch.quantity_kg),
         pieces: parseInt(batch.pieces),
         sb_percentage: parseFloat(batch.sb_percentage),
+        seller: batch.seller,
         remarks: batch.remarks || 'SANTOSH'
       }));
       
@@ -149,7 +152,7 @@ export default function RMLReceivedSantoshPage({ user }) {
 
   const canSubmit = () => {
     return batches.every(batch => 
-      batch.quantity_kg && batch.pieces && batch.sb_percentage && batch.images.length > 0
+      batch.quantity_kg && batch.pieces && batch.sb_percentage && batch.seller && batch.images.length > 0
     );
   };
 
@@ -217,7 +220,10 @@ export default function RMLReceivedSantoshPage({ user }) {
     if (!batch.sb_percentage) return '';
     const remarks = batch.remarks || 'SANTOSH';
     const sb = parseFloat(batch.sb_percentage);
-    return `SANTOSH-${remarks}, ${sb}%, ${entryDate}`;
+    // Format date as DD/MM/YYYY
+    const dateParts = entryDate.split('-');
+    const formattedDate = `${dateParts[2]}/${dateParts[1]}/${dateParts[0]}`;
+    return `SANTOSH-${remarks}, ${sb}%, ${formattedDate}`;
   };
 
   return (
@@ -340,6 +346,22 @@ export default function RMLReceivedSantoshPage({ user }) {
                 </div>
               </div>
 
+              <div>
+                <Label className="block text-sm font-bold text-slate-500 uppercase tracking-wider mb-2">
+                  Seller Name <span className="text-red-500">*</span>
+                </Label>
+                <Input
+                  type="text"
+                  value={batch.seller}
+                  onChange={(e) => handleInputChange(batchIndex, 'seller', e.target.value)}
+                  className="h-14 text-xl px-4 w-full border-2 border-slate-200 rounded-lg focus:ring-2 focus:ring-green-200 focus:border-green-400"
+                  placeholder="Enter seller name (required)"
+                />
+                {!batch.seller && (
+                  <p className="text-sm text-red-500 mt-1">* Seller Name is required</p>
+                )}
+              </div>
+
               <div>
                 <Label className="block text-sm font-bold text-slate-500 uppercase tracking-wider mb-2">
                   Remarks (Optional)
@@ -0,0 +1,66 @@
+"""
+Hermetic API test harness.
+
+The app runs in-process through httpx's ASGI transport against a fresh
+in-memory Motor stand-in (mongomock-motor) per test, so the suite needs no
+network, no MongoDB and no deployed backend.
+"""
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+PASSWORD = "secret123"
+# bcrypt is deliberately slow; hash the shared test password once
+PASSWORD_HASH = server.hash_password(PASSWORD)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def database():
+    mongo_client = AsyncMongoMockClient()
+    database = mongo_client["leadtrack_test"]
+    server.set_database(database, mongo_client)
+    await server.ensure_indexes()
+    yield database
+    server.set_database(None)
+
+
+@pytest.fixture
+async def api(database):
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        yield client
+
+
+async def create_user(database, name: str, email: str) -> dict:
+    user = {
+        "id": f"user-{name.lower()}",
+        "name": name,
+        "email": email,
+        "hashed_password": PASSWORD_HASH,
+        "created_at": "2026-01-01T00:00:00+00:00",
+    }
+    await database.users.insert_one(dict(user))
+    token = server.create_access_token({"sub": user["id"]})
+    return {**user, "headers": {"Authorization": f"Bearer {token}"}}
+
+
+@pytest.fixture
+async def admin(database):
+    return await create_user(database, "TT", "tt@leadtrack.in")
+
+
+@pytest.fixture
+async def operator(database):
+    return await create_user(database, "Ramesh", "ramesh@leadtrack.in")
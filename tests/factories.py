@@ -0,0 +1,64 @@
+"""Request builders shared by the API tests"""
+import json
+
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 60
+
+
+def photos(count: int):
+    return [("files", (f"photo{i}.jpg", JPEG, "image/jpeg")) for i in range(count)]
+
+
+def refining_batch(input_source="manual", lead_ingot_kg=500, pure_lead_kg=470, sb_percentage=2.0, **fields):
+    return {
+        "input_source": input_source,
+        "sb_percentage": sb_percentage,
+        "lead_ingot_kg": lead_ingot_kg,
+        "lead_ingot_pieces": 20,
+        "initial_dross_kg": 12,
+        "cu_dross_kg": 4,
+        "sn_dross_kg": 2,
+        "sb_dross_kg": 3,
+        "pure_lead_kg": pure_lead_kg,
+        "pure_lead_pieces": 19,
+        **fields,
+    }
+
+
+async def post_refining(api, headers, batches, entry_date=None):
+    data = {"batches_data": json.dumps(batches)}
+    if entry_date:
+        data["entry_date"] = entry_date
+    return await api.post("/api/refining/entries", data=data, files=photos(6 * len(batches)), headers=headers)
+
+
+async def post_recycling(api, headers, batches, entry_date=None):
+    data = {"batches_data": json.dumps(batches)}
+    if entry_date:
+        data["entry_date"] = entry_date
+    return await api.post("/api/recycling/entries", data=data, files=photos(len(batches)), headers=headers)
+
+
+async def post_rml_purchase(api, headers, batches, entry_date=None):
+    data = {"batches_data": json.dumps(batches)}
+    if entry_date:
+        data["entry_date"] = entry_date
+    return await api.post("/api/rml-purchases", data=data, files=photos(len(batches)), headers=headers)
+
+
+async def post_santosh_receipt(api, headers, batches, entry_date=None):
+    data = {"batches_data": json.dumps(batches)}
+    if entry_date:
+        data["entry_date"] = entry_date
+    return await api.post("/api/rml-received-santosh", data=data, files=photos(len(batches)), headers=headers)
+
+
+async def post_dross_recycling(api, headers, batches):
+    data = {"batches_data": json.dumps(batches)}
+    return await api.post("/api/dross-recycling/entries", data=data, files=photos(len(batches)), headers=headers)
+
+
+async def post_sale(api, headers, sku_type, quantity_kg, party_name="Acme Batteries", entry_date=None):
+    body = {"party_name": party_name, "sku_type": sku_type, "quantity_kg": quantity_kg}
+    if entry_date:
+        body["entry_date"] = entry_date
+    return await api.post("/api/sales", json=body, headers=headers)
@@ -0,0 +1,154 @@
+import asyncio
+
+import pytest
+
+import server
+from tests.factories import post_recycling, post_refining, refining_batch
+
+pytestmark = pytest.mark.anyio
+
+XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+async def test_recovery_settings_defaults_and_update(api, admin, operator):
+    defaults = (await api.get("/api/admin/recovery-settings", headers=operator["headers"])).json()
+    assert defaults["pp_battery_percent"] == 60.5
+
+    forbidden = await api.put("/api/admin/recovery-settings", json=defaults, headers=operator["headers"])
+    assert forbidden.status_code == 403
+
+    response = await api.put(
+        "/api/admin/recovery-settings",
+        json={"pp_battery_percent": 62.0, "mc_smf_battery_percent": 58.0, "hr_battery_percent": 51.0},
+        headers=admin["headers"],
+    )
+    assert response.status_code == 200
+    updated = (await api.get("/api/admin/recovery-settings", headers=operator["headers"])).json()
+    assert updated["pp_battery_percent"] == 62.0
+    assert updated["hr_battery_percent"] == 51.0
+
+
+async def test_recovery_simulation(api, admin, operator):
+    await post_recycling(api, operator["headers"], [{"battery_type": "PP", "battery_kg": 1000, "quantity_received": 0}], "2026-01-07")
+    response = await api.post(
+        "/api/admin/recovery-settings/simulate",
+        json={"candidates": [
+            {"pp_battery_percent": 60.0, "mc_smf_battery_percent": 57.5, "hr_battery_percent": 50.0},
+            {"pp_battery_percent": 65.0, "mc_smf_battery_percent": 57.5, "hr_battery_percent": 50.0},
+        ]},
+        headers=admin["headers"],
+    )
+    assert response.status_code == 200
+    assert response.json()
+
+
+async def test_recovery_recompute_job(api, admin, operator, database):
+    await post_recycling(api, operator["headers"], [{"battery_type": "PP", "battery_kg": 1000, "quantity_received": 100}], "2026-01-07")
+    await api.put(
+        "/api/admin/recovery-settings",
+        json={"pp_battery_percent": 70.0, "mc_smf_battery_percent": 57.5, "hr_battery_percent": 50.0},
+        headers=admin["headers"],
+    )
+    job = (await api.post("/api/admin/recovery-settings/recompute", json={"start_date": "2026-01-01", "end_date": "2026-01-31"}, headers=admin["headers"])).json()
+
+    for _ in range(100):
+        status = (await api.get(f"/api/admin/jobs/{job['job_id']}", headers=admin["headers"])).json()
+        if status["status"] != "running":
+            break
+        await asyncio.sleep(0.01)
+    assert status["status"] == "completed"
+
+    batch = (await database.entries.find_one({"entry_type": "recycling"}))["batches"][0]
+    assert batch["remelted_lead_kg"] == 700
+    assert batch["receivable_kg"] == 600
+    row = await database.batches.find_one({"type": "recycling"})
+    assert (row["remelted_lead_kg"], row["receivable_kg"]) == (700, 600)
+    adjusted = await database.inventory_events.find({"event": "adjusted"}, {"_id": 0}).to_list(None)
+    assert [event["deltas"] for event in adjusted] == [[{"account": "receivable", "kg": 600 - 505}]]
+    summary = (await api.get("/api/summary", headers=admin["headers"])).json()
+    assert summary["total_receivable"] == 600
+
+
+async def test_refining_totals_check_and_repair(api, admin, operator, database):
+    entry_id = (await post_refining(api, operator["headers"], [refining_batch(), refining_batch()])).json()["id"]
+    await post_refining(api, operator["headers"], [refining_batch()])
+    check = (await api.get("/api/admin/refining-totals/check", headers=admin["headers"])).json()
+    assert (check["checked"], check["mismatched"]) == (2, 0)
+
+    # An entry from before totals were stored, and one edited by hand
+    await database.entries.update_one({"id": entry_id}, {"$unset": {"totals": "", "batches.0.antimony_kg": ""},
+                                                         "$set": {"batches.1.cu_dross_kg": 10}})
+    check = (await api.get("/api/admin/refining-totals/check", headers=admin["headers"])).json()
+    assert (check["mismatched"], check["repaired"], check["sample_entry_ids"]) == (1, 0, [entry_id])
+
+    repaired = (await api.post("/api/admin/refining-totals/repair", headers=admin["headers"])).json()
+    assert repaired["repaired"] == 1
+    doc = await database.entries.find_one({"id": entry_id})
+    assert doc["batches"][1]["total_dross_kg"] == 27
+    assert doc["totals"]["total_dross_kg"] == 48
+    assert (await database.batches.find_one({"id": f"{entry_id}:1"}))["total_dross_kg"] == 27
+    summary = (await api.get("/api/summary", headers=admin["headers"])).json()
+    assert summary["total_dross"] == 48 + 21
+    assert summary["antimony_recoverable"] == 30
+
+    forbidden = await api.get("/api/admin/refining-totals/check", headers=operator["headers"])
+    assert forbidden.status_code == 403
+
+
+async def test_exports_return_workbooks(api, admin, operator):
+    await post_refining(api, operator["headers"], [refining_batch()])
+    await post_recycling(api, operator["headers"], [{"battery_type": "PP", "battery_kg": 100, "quantity_received": 0}])
+
+    for path in ("/api/entries/export/excel", "/api/dross/export/excel"):
+        response = await api.get(path, headers=admin["headers"])
+        assert response.status_code == 200, path
+        assert response.headers["content-type"] == XLSX
+        assert response.content[:2] == b"PK"
+
+
+async def test_cache_stats(api, admin, operator):
+    await api.get("/api/summary", headers=operator["headers"])
+    await api.get("/api/summary", headers=operator["headers"])
+    stats = (await api.get("/api/admin/cache/stats", headers=admin["headers"])).json()
+    assert stats["routes"]["compute_summary"]["hits"] >= 1
+
+
+async def test_waiting_on_a_computation_is_coalesced_not_a_hit(database):
+    started, release, calls = asyncio.Event(), asyncio.Event(), []
+
+    @server.cached_query("sales")
+    async def slow_query():
+        calls.append(1)
+        started.set()
+        await release.wait()
+        return {"value": len(calls)}
+
+    leader = asyncio.create_task(slow_query())
+    await started.wait()
+    waiters = [asyncio.create_task(slow_query()) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    assert await asyncio.gather(leader, *waiters) == [{"value": 1}] * 4
+    assert await slow_query() == {"value": 1}
+    assert server.query_cache.stats["slow_query"] == {"hits": 1, "misses": 1, "coalesced": 3}
+
+
+async def test_cancelled_computation_is_taken_over_by_a_waiter(database):
+    started, calls = asyncio.Event(), []
+
+    @server.cached_query("sales")
+    async def cancellable_query():
+        calls.append(1)
+        started.set()
+        if len(calls) == 1:
+            await asyncio.Event().wait()  # the first caller's client disconnects
+        return {"value": len(calls)}
+
+    leader = asyncio.create_task(cancellable_query())
+    await started.wait()
+    waiter = asyncio.create_task(cancellable_query())
+    await asyncio.sleep(0)
+    leader.cancel()
+    assert await waiter == {"value": 2}
+    assert leader.cancelled()
+    assert server.query_cache.stats["cancellable_query"] == {"hits": 0, "misses": 2, "coalesced": 0}
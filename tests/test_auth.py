@@ -0,0 +1,72 @@
+import pytest
+
+from tests.conftest import PASSWORD
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_api_root(api):
+    response = await api.get("/api/")
+    assert response.status_code == 200
+
+
+async def test_login_returns_token_for_valid_credentials(api, operator):
+    response = await api.post("/api/auth/login", json={"email": operator["email"], "password": PASSWORD})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["token_type"] == "bearer"
+    assert body["user"]["name"] == "Ramesh"
+
+    me = await api.get("/api/entries", headers={"Authorization": f"Bearer {body['access_token']}"})
+    assert me.status_code == 200
+
+
+async def test_login_rejects_wrong_password(api, operator):
+    response = await api.post("/api/auth/login", json={"email": operator["email"], "password": "wrong"})
+    assert response.status_code == 401
+
+
+async def test_requests_without_token_are_rejected(api, database):
+    response = await api.get("/api/entries")
+    assert response.status_code in (401, 403)
+
+
+async def test_invalid_token_is_rejected(api, database):
+    response = await api.get("/api/entries", headers={"Authorization": "Bearer not-a-token"})
+    assert response.status_code == 401
+
+
+async def test_users_list_is_public(api, operator, admin):
+    response = await api.get("/api/users/list")
+    assert response.status_code == 200
+    assert {user["name"] for user in response.json()} >= {"Ramesh", "TT"}
+
+
+async def test_admin_endpoints_require_admin(api, operator):
+    response = await api.get("/api/admin/users", headers=operator["headers"])
+    assert response.status_code == 403
+
+
+async def test_admin_creates_and_deletes_user(api, admin):
+    created = await api.post(
+        "/api/admin/users",
+        json={"name": "Suresh", "email": "suresh@leadtrack.in", "password": "pw123456"},
+        headers=admin["headers"],
+    )
+    assert created.status_code == 200
+    user_id = created.json()["id"]
+
+    duplicate = await api.post(
+        "/api/admin/users",
+        json={"name": "Suresh", "email": "suresh@leadtrack.in", "password": "pw123456"},
+        headers=admin["headers"],
+    )
+    assert duplicate.status_code == 400
+
+    users = await api.get("/api/admin/users", headers=admin["headers"])
+    assert "Suresh" in {user["name"] for user in users.json()}
+
+    deleted = await api.delete(f"/api/admin/users/{user_id}", headers=admin["headers"])
+    assert deleted.status_code == 200
+    users = await api.get("/api/admin/users", headers=admin["headers"])
+    assert "Suresh" not in {user["name"] for user in users.json()}
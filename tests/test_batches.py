@@ -0,0 +1,60 @@
+import pytest
+
+import server
+from tests.factories import (
+    post_dross_recycling, post_recycling, post_refining, post_rml_purchase, post_santosh_receipt, refining_batch,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+async def rows(database, **query):
+    return await database.batches.find(query, {"_id": 0}).sort([("timestamp", 1), ("batch_index", 1)]).to_list(None)
+
+
+@pytest.fixture
+async def history(api, operator):
+    headers = operator["headers"]
+    await post_rml_purchase(api, headers, [{"quantity_kg": 500, "pieces": 5, "sb_percentage": 2.5, "remarks": "Ravi"}], "2026-01-05")
+    await post_santosh_receipt(api, headers, [{"quantity_kg": 200, "pieces": 2, "sb_percentage": 1.5, "remarks": "Kanpur"}], "2026-01-05")
+    refining = await post_refining(
+        api, headers, [refining_batch("Ravi, 2.5%, 05/01/2026", lead_ingot_kg=300), refining_batch()], "2026-01-06"
+    )
+    await post_recycling(api, headers, [{"battery_type": "PP", "battery_kg": 1000, "quantity_received": 200}], "2026-01-07")
+    await post_dross_recycling(api, headers, [{"dross_type": "cu_dross", "quantity_sent": 40, "high_lead_recovered": 15}])
+    return refining.json()["id"]
+
+
+async def test_rows_mirror_batches(database, operator, history):
+    refining = await rows(database, type="refining")
+    assert [(row["source"], row["source_kind"], row["lead_ingot_kg"]) for row in refining] == [
+        ("Ravi, 2.5%, 05/01/2026", "rml_purchase", 300), ("manual", "manual", 500),
+    ]
+    row = refining[0]
+    assert (row["id"], row["entry_id"], row["batch_index"]) == (f"{history}:0", history, 0)
+    assert (row["date"], row["user_name"]) == ("2026-01-06", "Ramesh")
+    assert not [field for field in row if field.endswith("image")]
+    assert "lot_allocations" not in row and "unallocated_kg" not in row
+
+    assert (await rows(database, type="recycling"))[0]["source"] == "PP"
+    assert (await rows(database, type="dross_recycling"))[0]["high_lead_recovered"] == 15
+    assert [row["source"] for row in await rows(database, type="rml_received_santosh")] == ["SANTOSH-Kanpur, 1.5%, 05/01/2026"]
+
+
+async def test_deletes_remove_rows(api, admin, database, history):
+    await api.delete(f"/api/admin/entries/{history}", headers=admin["headers"])
+    assert await rows(database, entry_id=history) == []
+
+    purchase = await database.rml_purchases.find_one({})
+    await api.delete(f"/api/admin/rml-purchases/{purchase['id']}", headers=admin["headers"])
+    assert await rows(database, type="rml_purchase") == []
+
+    await api.delete("/api/admin/clear-all-data", headers=admin["headers"])
+    assert await database.batches.count_documents({}) == 0
+
+
+async def test_rebuild_matches_incremental_rows(database, history):
+    before = await rows(database)
+    assert len(before) == 6
+    assert await server.rebuild_batches() == 6
+    assert await rows(database) == before
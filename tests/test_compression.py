@@ -0,0 +1,76 @@
+import gzip
+
+import brotli
+import pytest
+
+from compression import is_compressible, negotiate_encoding
+from tests.factories import post_refining, refining_batch
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, deflate, br", "br"),
+    ("gzip", "gzip"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("br;q=0, gzip;q=0", None),
+    ("identity", None),
+    ("*", "br"),
+    ("*;q=0.1, gzip;q=0.2", "gzip"),
+])
+def test_negotiate_encoding(header, expected):
+    assert negotiate_encoding(header) == expected
+
+
+@pytest.mark.parametrize("content_type, expected", [
+    ("application/json", True),
+    ("text/plain; charset=utf-8", True),
+    ("text/event-stream", False),
+    ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", False),
+    ("image/jpeg", False),
+])
+def test_is_compressible(content_type, expected):
+    assert is_compressible(content_type) is expected
+
+
+@pytest.fixture
+async def entry_id(api, operator):
+    response = await post_refining(api, operator["headers"], [refining_batch()] * 3)
+    return response.json()["id"]
+
+
+@pytest.mark.parametrize("encoding, decompress", [("gzip", gzip.decompress), ("br", brotli.decompress)])
+async def test_detail_payload_is_compressed(api, operator, entry_id, encoding, decompress):
+    headers = {**operator["headers"], "Accept-Encoding": encoding}
+    plain = await api.get(f"/api/entries/{entry_id}", headers={**operator["headers"], "Accept-Encoding": "identity"})
+    # Read the raw bytes so httpx does not decode them
+    async with api.stream("GET", f"/api/entries/{entry_id}", headers=headers) as response:
+        raw = b"".join([chunk async for chunk in response.aiter_raw()])
+
+    assert "content-encoding" not in plain.headers
+    assert plain.headers["vary"] == "Accept-Encoding"
+    assert response.headers["content-encoding"] == encoding
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) == len(raw) < len(plain.content)
+    assert decompress(raw) == plain.content
+
+
+async def test_small_responses_are_not_compressed(api, database):
+    response = await api.get("/api/", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    # A larger representation of the same URL would be compressed
+    assert response.headers["vary"] == "Accept-Encoding"
+
+
+async def test_workbooks_are_not_compressed(api, operator, entry_id):
+    response = await api.get("/api/entries/export/excel", headers={**operator["headers"], "Accept-Encoding": "gzip, br"})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert "vary" not in response.headers
+
+
+async def test_compression_metrics(api, operator, entry_id):
+    await api.get(f"/api/entries/{entry_id}", headers={**operator["headers"], "Accept-Encoding": "gzip"})
+    metrics = (await api.get("/metrics")).text
+    assert 'http_compression_ratio_count{encoding="gzip",route="/api/entries/{entry_id}"}' in metrics
+    assert 'http_compression_bytes_total{direction="out",encoding="gzip"}' in metrics
@@ -0,0 +1,108 @@
+import pytest
+
+from tests.factories import post_dross_recycling, post_recycling, post_refining, refining_batch
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_create_refining_entry_stores_batches_and_photos(api, operator, database):
+    response = await post_refining(api, operator["headers"], [refining_batch(), refining_batch(pure_lead_kg=480)], "2026-01-08")
+    assert response.status_code == 200
+    entry_id = response.json()["id"]
+
+    doc = await database.entries.find_one({"id": entry_id})
+    assert doc["entry_type"] == "refining"
+    assert doc["user_name"] == "Ramesh"
+    assert doc["timestamp"].startswith("2026-01-08T12:00:00")
+    assert [batch["pure_lead_kg"] for batch in doc["batches"]] == [470, 480]
+    assert doc["batches"][0]["lead_ingot_image"]
+
+
+async def test_refining_entry_stores_totals(api, operator, database):
+    batches = [refining_batch(sb_percentage=2.0), refining_batch(sb_percentage=None, lead_ingot_kg=400, pure_lead_kg=380)]
+    entry_id = (await post_refining(api, operator["headers"], batches)).json()["id"]
+
+    doc = await database.entries.find_one({"id": entry_id})
+    assert [(b["total_dross_kg"], b["antimony_kg"], b["yield_percent"]) for b in doc["batches"]] == [(21, 10, 94), (21, 0, 95)]
+    assert doc["totals"] == {
+        "lead_ingot_kg": 900, "pure_lead_kg": 850, "total_dross_kg": 42, "antimony_kg": 10, "yield_percent": 94.44,
+    }
+
+
+async def test_dross_views_read_entries_without_stored_totals(api, operator, database):
+    legacy = refining_batch()
+    await database.entries.insert_one({"id": "legacy", "entry_type": "refining", "user_name": "Ramesh",
+                                       "timestamp": "2025-12-01T12:00:00", "batches": [legacy]})
+    dross = await api.get("/api/dross", headers=operator["headers"])
+    assert dross.status_code == 200
+    assert dross.json()[0]["total_dross"] == 21
+    export = await api.get("/api/dross/export/excel", headers=operator["headers"])
+    assert export.status_code == 200
+
+
+async def test_entries_list_and_detail(api, operator):
+    created = await post_refining(api, operator["headers"], [refining_batch()])
+    entry_id = created.json()["id"]
+
+    listed = await api.get("/api/entries", headers=operator["headers"])
+    assert listed.status_code == 200
+    entries = listed.json()
+    assert [entry["id"] for entry in entries] == [entry_id]
+    assert "lead_ingot_image" not in entries[0]["batches"][0]
+
+    detail = await api.get(f"/api/entries/{entry_id}", headers=operator["headers"])
+    assert detail.status_code == 200
+    assert detail.json()["batches"][0]["lead_ingot_image"]
+
+    missing = await api.get("/api/entries/does-not-exist", headers=operator["headers"])
+    assert missing.status_code == 404
+
+
+async def test_recycling_output_uses_recovery_settings(api, admin, operator):
+    await api.put(
+        "/api/admin/recovery-settings",
+        json={"pp_battery_percent": 60.0, "mc_smf_battery_percent": 55.0, "hr_battery_percent": 50.0},
+        headers=admin["headers"],
+    )
+    response = await post_recycling(api, operator["headers"], [
+        {"battery_type": "PP", "battery_kg": 1000, "quantity_received": 200},
+        {"battery_type": "HR", "battery_kg": 500, "quantity_received": 0},
+    ])
+    assert response.status_code == 200
+
+    entries = (await api.get("/api/entries", headers=operator["headers"])).json()
+    pp, hr = entries[0]["batches"]
+    assert pp["remelted_lead_kg"] == 600
+    assert pp["receivable_kg"] == 400
+    assert hr["remelted_lead_kg"] == 250
+
+
+async def test_dross_recycling_entry(api, operator):
+    response = await post_dross_recycling(api, operator["headers"], [
+        {"dross_type": "cu", "quantity_sent": 20, "high_lead_recovered": 15},
+    ])
+    assert response.status_code == 200
+
+    entries = (await api.get("/api/dross-recycling/entries", headers=operator["headers"])).json()
+    assert entries[0]["batches"][0]["high_lead_recovered"] == 15
+
+
+async def test_dross_report_lists_refining_dross(api, operator):
+    await post_refining(api, operator["headers"], [refining_batch()])
+    rows = (await api.get("/api/dross", headers=operator["headers"])).json()
+    assert len(rows) == 1
+    assert rows[0]["total_dross"] == 12 + 4 + 2 + 3
+
+
+async def test_only_admin_can_delete_entries(api, admin, operator):
+    entry_id = (await post_refining(api, operator["headers"], [refining_batch()])).json()["id"]
+
+    forbidden = await api.delete(f"/api/admin/entries/{entry_id}", headers=operator["headers"])
+    assert forbidden.status_code == 403
+
+    deleted = await api.delete(f"/api/admin/entries/{entry_id}", headers=admin["headers"])
+    assert deleted.status_code == 200
+    assert (await api.get("/api/entries", headers=admin["headers"])).json() == []
+
+    again = await api.delete(f"/api/admin/entries/{entry_id}", headers=admin["headers"])
+    assert again.status_code == 404
@@ -0,0 +1,72 @@
+import pytest
+
+from tests.factories import post_recycling, post_refining, post_rml_purchase, post_sale, refining_batch
+
+pytestmark = pytest.mark.anyio
+
+SKU = "Ravi, 2.5%, 05/01/2026"
+
+
+async def search(api, headers, **params):
+    response = await api.get("/api/history/search", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+@pytest.fixture
+async def history(api, admin, operator):
+    await post_rml_purchase(api, operator["headers"], [{"quantity_kg": 900, "pieces": 9, "sb_percentage": 2.5, "remarks": "Ravi"}], "2026-01-05")
+    for day in range(6, 11):
+        await post_refining(api, operator["headers"], [refining_batch(lead_ingot_kg=100 * day)], f"2026-01-{day:02d}")
+    await post_refining(api, admin["headers"], [refining_batch(), refining_batch(SKU, lead_ingot_kg=300)], "2026-01-08")
+    await post_recycling(api, operator["headers"], [{"battery_type": "PP", "battery_kg": 1000, "quantity_received": 0}], "2026-01-07")
+    await post_recycling(api, operator["headers"], [{"battery_type": "HR", "battery_kg": 400, "quantity_received": 0}], "2026-01-08")
+    await post_sale(api, operator["headers"], "Pure Lead", 100, party_name="Exide Dealer", entry_date="2026-01-09")
+    await post_sale(api, operator["headers"], SKU, 50, party_name="Amara Batteries", entry_date="2026-01-10")
+    await post_sale(api, admin["headers"], "Pure Lead", 75, party_name="exide works", entry_date="2026-01-11")
+
+
+async def test_entries_are_paged_newest_first_without_images(api, operator, history):
+    first = await search(api, operator["headers"], type="refining", page_size=4)
+    assert first["total"] == 6
+    assert [row["timestamp"][:10] for row in first["rows"]] == ["2026-01-10", "2026-01-09", "2026-01-08", "2026-01-08"]
+    second = await search(api, operator["headers"], type="refining", page_size=4, page=2)
+    assert [row["timestamp"][:10] for row in second["rows"]] == ["2026-01-07", "2026-01-06"]
+    batch = first["rows"][0]["batches"][0]
+    assert batch["lead_ingot_kg"] == 1000
+    assert not [field for field in batch if field.endswith("image")]
+
+
+async def test_entry_filters(api, operator, history):
+    headers = operator["headers"]
+    by_date = await search(api, headers, type="refining", start_date="2026-01-07", end_date="2026-01-08")
+    assert by_date["total"] == 3
+    by_user = await search(api, headers, type="refining", user="TT")
+    assert [len(row["batches"]) for row in by_user["rows"]] == [2]
+    # An entry matches when any of its batches does
+    by_sku = await search(api, headers, type="refining", sku=SKU)
+    assert by_sku["rows"] == by_user["rows"]
+    by_kg = await search(api, headers, type="refining", min_kg=700, max_kg=900)
+    assert [row["batches"][0]["lead_ingot_kg"] for row in by_kg["rows"]] == [900, 800, 700]
+    by_battery = await search(api, headers, type="recycling", battery_type="HR")
+    assert [row["batches"][0]["battery_kg"] for row in by_battery["rows"]] == [400]
+    purchases = await search(api, headers, type="rml_purchase", sku=SKU)
+    assert purchases["total"] == 1
+
+
+async def test_sale_filters(api, operator, history):
+    headers = operator["headers"]
+    sales = await search(api, headers, type="sale")
+    assert [row["quantity_kg"] for row in sales["rows"]] == [75, 50, 100]
+    by_party = await search(api, headers, type="sale", party="EXIDE")
+    assert [row["party_name"] for row in by_party["rows"]] == ["exide works", "Exide Dealer"]
+    assert (await search(api, headers, type="sale", sku=SKU))["total"] == 1
+    assert (await search(api, headers, type="sale", user="Ramesh", max_kg=60))["total"] == 1
+    assert (await search(api, headers, type="sale", end_date="2026-01-09"))["total"] == 1
+
+
+async def test_invalid_filters(api, operator):
+    for params in ({"type": "bogus"}, {"type": "refining", "party": "x"}, {"type": "sale", "battery_type": "PP"},
+                   {"type": "recycling", "sku": SKU}, {"type": "sale", "start_date": "09/01/2026"}):
+        response = await api.get("/api/history/search", params=params, headers=operator["headers"])
+        assert response.status_code == 400, params
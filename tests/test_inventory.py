@@ -0,0 +1,97 @@
+import pytest
+
+from tests.factories import (
+    post_dross_recycling,
+    post_recycling,
+    post_refining,
+    post_rml_purchase,
+    post_sale,
+    post_santosh_receipt,
+    refining_batch,
+)
+
+pytestmark = pytest.mark.anyio
+
+RML_SKU = "Ravi, 2.5%, 05/01/2026"
+SANTOSH_SKU = "SANTOSH-Kanpur, 1.5%, 06/01/2026"
+
+
+@pytest.fixture
+async def stocked(api, operator):
+    """RML and Santosh lots, recycling, refining from both lots, dross recycling and two sales"""
+    headers = operator["headers"]
+    await post_rml_purchase(api, headers, [{"quantity_kg": 1000, "pieces": 10, "sb_percentage": 2.5, "remarks": "Ravi"}], "2026-01-05")
+    await post_santosh_receipt(api, headers, [{"quantity_kg": 300, "pieces": 3, "sb_percentage": 1.5, "remarks": "Kanpur"}], "2026-01-06")
+    await post_recycling(api, headers, [{"battery_type": "PP", "battery_kg": 1000, "quantity_received": 200}], "2026-01-07")
+    await post_refining(api, headers, [
+        refining_batch(RML_SKU, lead_ingot_kg=400, pure_lead_kg=370, sb_percentage=2.5),
+        refining_batch(SANTOSH_SKU, lead_ingot_kg=100, pure_lead_kg=95, sb_percentage=1.5),
+    ], "2026-01-08")
+    await post_dross_recycling(api, headers, [{"dross_type": "cu", "quantity_sent": 20, "high_lead_recovered": 15}])
+    await post_sale(api, headers, "Pure Lead", 100, entry_date="2026-01-09")
+    await post_sale(api, headers, RML_SKU, 50, party_name="Beta Metals", entry_date="2026-01-10")
+    return headers
+
+
+async def test_sku_strings(api, operator, database):
+    await post_rml_purchase(api, operator["headers"], [{"quantity_kg": 10, "pieces": 1, "sb_percentage": 2.5, "remarks": "Ravi"}], "2026-01-05")
+    await post_santosh_receipt(api, operator["headers"], [{"quantity_kg": 10, "pieces": 1, "sb_percentage": 1.5, "remarks": "Kanpur"}], "2026-01-06")
+    assert (await database.rml_purchases.find_one())["batches"][0]["sku"] == RML_SKU
+    assert (await database.rml_received_santosh.find_one())["batches"][0]["sku"] == SANTOSH_SKU
+
+
+async def test_summary(api, stocked):
+    summary = (await api.get("/api/summary", headers=stocked)).json()
+    assert summary["pure_lead_stock"] == 370 + 95 - 100
+    assert summary["rml_stock"] == 1000 + 300 - 400 - 100 - 50
+    assert summary["high_lead_stock"] == 15
+    assert summary["total_receivable"] == 1000 * 0.605 - 200 - 300
+    assert summary["total_dross"] == 2 * (12 + 4 + 2 + 3)
+    assert summary["antimony_recoverable"] == 400 * 2.5 / 100 + 100 * 1.5 / 100
+
+
+async def test_available_skus(api, stocked):
+    skus = {sku["sku_type"]: sku for sku in (await api.get("/api/sales/available-skus", headers=stocked)).json()}
+    assert skus["Pure Lead"]["available_kg"] == 365
+    assert skus["High Lead"]["available_kg"] == 15
+    assert skus[RML_SKU]["available_kg"] == 1000 - 400 - 50
+    assert skus[RML_SKU]["sb_percentage"] == 2.5
+    assert skus[SANTOSH_SKU]["available_kg"] == 300 - 100
+
+
+async def test_rml_skus_for_refining(api, stocked):
+    skus = {sku["sku"]: sku for sku in (await api.get("/api/rml-purchases/skus", headers=stocked)).json()}
+    # Lots are drawn down by sales as well as refining
+    assert skus[RML_SKU]["total_quantity_kg"] == 1000 - 400 - 50
+    assert skus[SANTOSH_SKU]["total_quantity_kg"] == 200
+
+
+async def test_sale_reduces_cached_stock(api, stocked):
+    before = (await api.get("/api/summary", headers=stocked)).json()
+    response = await post_sale(api, stocked, "Pure Lead", 65)
+    assert response.status_code == 200
+
+    after = (await api.get("/api/summary", headers=stocked)).json()
+    assert after["pure_lead_stock"] == before["pure_lead_stock"] - 65
+    skus = {sku["sku_type"] for sku in (await api.get("/api/sales/available-skus", headers=stocked)).json()}
+    assert "Pure Lead" in skus
+
+
+async def test_sales_list_and_admin_delete(api, admin, stocked):
+    sales = (await api.get("/api/sales", headers=stocked)).json()
+    assert len(sales) == 2
+
+    response = await api.delete(f"/api/admin/sales/{sales[0]['id']}", headers=admin["headers"])
+    assert response.status_code == 200
+    assert len((await api.get("/api/sales", headers=stocked)).json()) == 1
+
+
+async def test_clear_all_data_resets_summary(api, admin, stocked):
+    assert (await api.get("/api/summary", headers=stocked)).json()["pure_lead_stock"] > 0
+
+    response = await api.delete("/api/admin/clear-all-data", headers=admin["headers"])
+    assert response.status_code == 200
+
+    summary = (await api.get("/api/summary", headers=stocked)).json()
+    assert summary["pure_lead_stock"] == 0
+    assert summary["rml_stock"] == 0
@@ -0,0 +1,260 @@
+import pytest
+
+import server
+from tests.factories import post_dross_recycling, post_recycling, post_refining, post_rml_purchase, post_sale, refining_batch
+
+pytestmark = pytest.mark.anyio
+
+
+async def events(api, headers, **params):
+    response = await api.get("/api/admin/inventory-events", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def deltas(event):
+    return {delta["account"]: delta["kg"] for delta in event["deltas"]}
+
+
+async def summary(api, headers):
+    return (await api.get("/api/summary", headers=headers)).json()
+
+
+async def test_writes_and_deletes_append_events(api, admin, operator, database):
+    entry_id = (await post_refining(api, operator["headers"], [refining_batch()], "2026-01-05")).json()["id"]
+    sale_id = (await post_sale(api, operator["headers"], "Pure Lead", 100)).json()["id"]
+    await post_recycling(api, operator["headers"], [{"battery_type": "PP", "battery_kg": 1000, "quantity_received": 500}])
+    await api.delete(f"/api/admin/sales/{sale_id}", headers=admin["headers"])
+
+    log = await events(api, admin["headers"])
+    assert [(event["seq"], event["event"], event["entry_type"]) for event in log] == [
+        (1, "created", "refining"), (2, "created", "sale"), (3, "created", "recycling"), (4, "deleted", "sale"),
+    ]
+    assert log[0]["entry_id"] == entry_id
+    assert log[0]["effective_at"] == "2026-01-05T12:00:00"
+    assert deltas(log[0]) == {"pure_lead_produced": 470, "dross": 21, "antimony": 10, "refined:manual": 500}
+    assert deltas(log[3]) == {"sold": -100, "sold:pure_lead": -100}
+    assert log[3]["user_name"] == "TT"
+    assert (await summary(api, operator["headers"]))["pure_lead_stock"] == 470
+
+    await api.delete(f"/api/admin/entries/{entry_id}", headers=admin["headers"])
+    assert [event["event"] for event in await events(api, admin["headers"], entry_id=entry_id)] == ["created", "deleted"]
+    assert (await summary(api, operator["headers"]))["pure_lead_stock"] == 0
+    assert await database.inventory_events.count_documents({}) == 5
+
+
+async def test_balances_come_from_snapshot_and_tail(api, operator, database, monkeypatch):
+    monkeypatch.setattr(server, "INVENTORY_SNAPSHOT_INTERVAL", 2)
+    for day in range(1, 8):
+        await post_refining(api, operator["headers"], [refining_batch(pure_lead_kg=100)], f"2026-01-{day:02d}")
+    await post_dross_recycling(api, operator["headers"], [{"dross_type": "Cu", "quantity_sent": 50, "high_lead_recovered": 30}])
+
+    snapshots = await database.inventory_snapshots.find({}, {"_id": 0}).sort("seq", 1).to_list(None)
+    assert [snapshot["seq"] for snapshot in snapshots] == [2, 4, 6]
+    assert {row["account"]: row["kg"] for row in snapshots[-1]["balances"]}["pure_lead_produced"] == 600
+
+    # A snapshot that disagrees with the events shows that only the tail after it is read
+    await database.inventory_snapshots.update_one({"seq": 6}, {"$set": {"balances": []}})
+    assert await server.inventory_balances() == {"pure_lead_produced": 100, "dross": 21, "antimony": 10,
+                                                 "refined:manual": 500, "high_lead_recovered": 30}
+    assert (await server.inventory_balances(through_seq=4))["pure_lead_produced"] == 400
+
+
+async def test_reconcile_records_changes_made_outside_the_api(api, admin, operator, database):
+    await post_rml_purchase(api, operator["headers"], [{"quantity_kg": 900, "pieces": 9, "sb_percentage": 2.5, "remarks": "Ravi"}], "2026-01-05")
+    await post_recycling(api, operator["headers"], [{"battery_type": "PP", "battery_kg": 1000, "quantity_received": 500}])
+    await database.sales.insert_one({"id": "legacy-sale", "sku_type": "Ravi, 2.5%, 05/01/2026", "quantity_kg": 200,
+                                     "timestamp": "2026-01-06T12:00:00"})
+    await database.entries.update_one({"entry_type": "recycling"}, {"$set": {"batches.0.receivable_kg": 50}})
+    await database.rml_purchases.delete_many({})
+
+    receivable = deltas((await events(api, admin["headers"]))[1])["receivable"]
+
+    assert await server.reconcile_inventory_events() == {"events": 3}
+    log = await events(api, admin["headers"], after_seq=2)
+    by_type = {event["entry_type"]: event for event in log}
+    assert by_type["sale"]["event"] == "created"
+    assert deltas(by_type["sale"]) == {"sold": 200, "sold:rml": 200, "sku:Ravi, 2.5%, 05/01/2026": -200}
+    assert by_type["recycling"]["event"] == "adjusted"
+    assert deltas(by_type["recycling"]) == {"receivable": 50 - receivable}
+    assert by_type["rml_purchase"]["event"] == "deleted"
+    assert deltas(by_type["rml_purchase"]) == {"rml_purchased": -900, "sku:Ravi, 2.5%, 05/01/2026": -900}
+    assert await server.reconcile_inventory_events() == {"events": 0}
+
+    stats = await summary(api, operator["headers"])
+    assert (stats["total_receivable"], stats["total_rml_purchased"], stats["total_sold"]) == (50, 0, 200)
+
+
+async def test_repairs_racing_a_write_count_it_once(api, operator, database):
+    await post_recycling(api, operator["headers"], [{"battery_type": "PP", "battery_kg": 1000, "quantity_received": 500}])
+    expected = await summary(api, operator["headers"])
+
+    # A repair reaches an entry whose own write has stored it but not yet logged it
+    doc = {"id": "in-flight", "entry_type": "recycling", "timestamp": "2026-01-06T12:00:00",
+           "batches": [{"battery_type": "PP", "quantity_received": 0, "receivable_kg": 40}]}
+    await database.entries.insert_one(dict(doc))
+    await server.log_inventory_changes([("recycling", doc)])
+    await server.append_inventory_events([server.inventory_event("created", "recycling", doc)])
+    assert await database.inventory_events.count_documents({"entry_id": "in-flight"}) == 1
+    assert (await summary(api, operator["headers"]))["total_receivable"] == expected["total_receivable"] + 40
+
+    # Changed in place: only the difference is appended
+    doc["batches"][0]["receivable_kg"] = 55
+    await server.log_inventory_changes([("recycling", doc)])
+    log = await database.inventory_events.find({"entry_id": "in-flight"}).sort("seq", 1).to_list(None)
+    assert [(event["event"], deltas(event)) for event in log] == [("created", {"receivable": 40}), ("adjusted", {"receivable": 15})]
+
+
+async def test_clear_all_data_keeps_the_log(api, admin, operator, database):
+    await post_sale(api, operator["headers"], "Pure Lead", 100)
+    await api.delete("/api/admin/clear-all-data", headers=admin["headers"])
+    assert [event["event"] for event in await events(api, admin["headers"])] == ["created", "deleted"]
+    assert (await summary(api, operator["headers"]))["total_sold"] == 0
+
+    forbidden = await api.get("/api/admin/inventory-events", headers=operator["headers"])
+    assert forbidden.status_code == 403
+
+
+SKU = "Ravi, 2.5%, 05/01/2026"
+
+
+async def summary_as_of(api, headers, as_of):
+    response = await api.get("/api/summary", params={"as_of": as_of}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+async def available_as_of(api, headers, as_of):
+    response = await api.get("/api/sales/available-skus", params={"as_of": as_of}, headers=headers)
+    assert response.status_code == 200, response.text
+    return {sku["sku_type"]: (sku["available_kg"], sku["sb_percentage"]) for sku in response.json()}
+
+
+@pytest.fixture
+async def quarter(api, operator):
+    headers = operator["headers"]
+    await post_rml_purchase(api, headers, [{"quantity_kg": 900, "pieces": 9, "sb_percentage": 2.5, "remarks": "Ravi"}], "2026-01-05")
+    await post_refining(api, headers, [refining_batch()], "2026-01-10")
+    await post_sale(api, headers, "Pure Lead", 100, entry_date="2026-02-03")
+    await post_sale(api, headers, SKU, 200, entry_date="2026-02-04")
+    await post_refining(api, headers, [refining_batch(SKU, lead_ingot_kg=300, pure_lead_kg=280)], "2026-03-01")
+
+
+async def test_summary_as_of_month_ends(api, operator, quarter):
+    january = await summary_as_of(api, operator["headers"], "2026-01-31")
+    assert (january["pure_lead_stock"], january["rml_stock"], january["total_sold"]) == (470, 900, 0)
+    february = await summary_as_of(api, operator["headers"], "2026-02-28")
+    assert (february["pure_lead_stock"], february["rml_stock"], february["total_sold"]) == (370, 700, 300)
+    march = await summary_as_of(api, operator["headers"], "2026-03-15")
+    assert march == await summary(api, operator["headers"])
+    assert (await summary_as_of(api, operator["headers"], "2025-12-31"))["available_stock"] == 0
+
+    # An entry dated back into January changes January's balances
+    await post_sale(api, operator["headers"], "Pure Lead", 50, entry_date="2026-01-20")
+    assert (await summary_as_of(api, operator["headers"], "2026-01-31"))["pure_lead_stock"] == 420
+
+    bad = await api.get("/api/summary", params={"as_of": "31-01-2026"}, headers=operator["headers"])
+    assert bad.status_code == 400
+
+
+async def test_available_skus_as_of(api, operator, quarter):
+    assert await available_as_of(api, operator["headers"], "2026-01-31") == {"Pure Lead": (470, None), SKU: (900, 2.5)}
+    assert await available_as_of(api, operator["headers"], "2026-02-28") == {"Pure Lead": (370, None), SKU: (700, 2.5)}
+    assert await available_as_of(api, operator["headers"], "2026-03-31") == {"Pure Lead": (650, None), SKU: (400, 2.5)}
+    assert await available_as_of(api, operator["headers"], "2025-12-31") == {}
+
+
+async def test_month_end_snapshots_are_stored_and_caught_up(api, operator, database, monkeypatch):
+    monkeypatch.setattr(server, "INVENTORY_SNAPSHOT_INTERVAL", 2)
+    monkeypatch.setattr(server, "INVENTORY_SETTLE_SECONDS", 0)
+    for day in range(1, 6):
+        await post_refining(api, operator["headers"], [refining_batch(pure_lead_kg=100)], f"2026-01-{day:02d}")
+    await post_refining(api, operator["headers"], [refining_batch(pure_lead_kg=100)], "2026-02-02")
+    assert await server.inventory_balances_as_of("2026-02-10") == {"pure_lead_produced": 600, "dross": 126,
+                                                                   "antimony": 60, "refined:manual": 3000}
+    stored = await database.inventory_dated_snapshots.find_one({"date": "2026-01-31"})
+    assert stored["seq"] == 6
+    assert {row["account"]: row["kg"] for row in stored["balances"]}["pure_lead_produced"] == 500
+
+    # Late January entries: read from the tail until the snapshot is more than an interval behind
+    for _ in range(2):
+        await post_refining(api, operator["headers"], [refining_batch(pure_lead_kg=10)], "2026-01-15")
+    assert (await server.inventory_balances_as_of("2026-01-31"))["pure_lead_produced"] == 520
+    assert (await database.inventory_dated_snapshots.find_one({"date": "2026-01-31"}))["seq"] == 6
+    for _ in range(2):
+        await post_refining(api, operator["headers"], [refining_batch(pure_lead_kg=10)], "2026-01-15")
+    assert (await server.inventory_balances_as_of("2026-01-31"))["pure_lead_produced"] == 540
+    stored = await database.inventory_dated_snapshots.find_one({"date": "2026-01-31"})
+    assert stored["seq"] == 10
+    assert {row["account"]: row["kg"] for row in stored["balances"]}["pure_lead_produced"] == 540
+
+
+async def test_month_end_snapshots_need_only_settled_events(api, operator, database, monkeypatch):
+    await post_refining(api, operator["headers"], [refining_batch(pure_lead_kg=100)], "2026-01-05")
+    # Just recorded: an event numbered before it could still be in flight
+    await server.inventory_balances_as_of("2026-02-10")
+    assert await database.inventory_dated_snapshots.count_documents({}) == 0
+
+    # No seq snapshot exists yet, but the events have settled
+    monkeypatch.setattr(server, "INVENTORY_SETTLE_SECONDS", 0)
+    assert (await server.inventory_balances_as_of("2026-02-10"))["pure_lead_produced"] == 100
+    assert await database.inventory_snapshots.count_documents({}) == 0
+    assert (await database.inventory_dated_snapshots.find_one({"date": "2026-01-31"}))["seq"] == 1
+
+
+async def test_upgraded_database_is_seeded_once(api, operator, database):
+    await database.entries.insert_one({"id": "old-refining", "entry_type": "refining", "timestamp": "2025-12-01T12:00:00",
+                                       "batches": [{"input_source": "manual", "lead_ingot_kg": 500, "pure_lead_kg": 470}]})
+    await database.sales.insert_one({"id": "old-sale", "sku_type": "Pure Lead", "quantity_kg": 70, "timestamp": "2025-12-02T12:00:00"})
+    assert (await summary(api, operator["headers"]))["pure_lead_stock"] == 0
+
+    assert await server.seed_inventory_events() == 2
+    assert await server.seed_inventory_events() == 0
+    assert (await summary(api, operator["headers"]))["pure_lead_stock"] == 400
+
+
+async def test_seeding_a_document_deleted_meanwhile_nets_to_zero(database):
+    sale = {"id": "old-sale", "sku_type": "Pure Lead", "quantity_kg": 70, "timestamp": "2025-12-02T12:00:00"}
+    # The seed read the sale; a serving worker deleted it before the seed logged it
+    await server.append_inventory_events([server.inventory_event("deleted", "sale", sale)])
+    await server.log_inventory_changes([("sale", sale)])
+    assert await server.inventory_balances() == {"sold": 0, "sold:pure_lead": 0}
+    await server.log_inventory_changes([("sale", sale)])
+    assert await database.inventory_events.count_documents({}) == 2
+
+
+async def test_seed_is_claimed_by_one_process(operator, database):
+    await database.sales.insert_one({"id": "old-sale", "sku_type": "Pure Lead", "quantity_kg": 70, "timestamp": "2025-12-02T12:00:00"})
+    await database.counters.insert_one({"_id": "inventory_events_seed", "started_at": "2026-01-01T00:00:00+00:00",
+                                        "lease_until": "2999-01-01T00:00:00+00:00"})
+    assert await server.seed_inventory_events() == 0
+    assert await database.inventory_events.count_documents({}) == 0
+
+
+async def test_seed_left_incomplete_is_run_again(operator, database):
+    await database.sales.insert_one({"id": "old-sale", "sku_type": "Pure Lead", "quantity_kg": 70, "timestamp": "2025-12-02T12:00:00"})
+    # A process claimed the seed and died; its lease has lapsed
+    await database.counters.insert_one({"_id": "inventory_events_seed", "started_at": "2026-01-01T00:00:00+00:00",
+                                        "lease_until": "2026-01-01T00:05:00+00:00"})
+    assert await server.seed_inventory_events() == 1
+    assert (await database.counters.find_one({"_id": "inventory_events_seed"}))["completed_at"]
+    assert await server.seed_inventory_events() == 0
+
+
+async def test_stock_reads_wait_for_the_seed(api, operator, database):
+    started_at = await server.claim_inventory_seed()
+    assert (await api.get("/api/summary", headers=operator["headers"])).status_code == 503
+    assert (await api.get("/api/sales/available-skus", headers=operator["headers"])).status_code == 503
+
+    await server.run_inventory_seed(started_at)
+    assert (await api.get("/api/summary", headers=operator["headers"])).status_code == 200
+    assert (await api.get("/api/sales/available-skus", headers=operator["headers"])).status_code == 200
+
+
+async def test_deleting_a_document_before_the_seed_nets_to_zero(api, admin, database):
+    await database.sales.insert_one({"id": "old-sale", "sku_type": "Pure Lead", "quantity_kg": 70, "timestamp": "2025-12-02T12:00:00"})
+    assert (await api.delete("/api/admin/sales/old-sale", headers=admin["headers"])).status_code == 200
+    assert [event["event"] async for event in database.inventory_events.find({}).sort("seq", 1)] == ["created", "deleted"]
+
+    await server.seed_inventory_events()
+    assert await server.inventory_balances() == {"sold": 0, "sold:pure_lead": 0}
\ No newline at end of file
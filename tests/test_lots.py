@@ -0,0 +1,84 @@
+import pytest
+
+import server
+from tests.factories import post_refining, post_rml_purchase, post_sale, post_santosh_receipt, refining_batch
+
+pytestmark = pytest.mark.anyio
+
+SKU = "Ravi, 2.5%, 05/01/2026"
+
+
+@pytest.fixture
+async def two_lots(api, operator):
+    """Two purchases that produce the same SKU string: two lots of one SKU"""
+    headers = operator["headers"]
+    await post_rml_purchase(api, headers, [{"quantity_kg": 500, "pieces": 5, "sb_percentage": 2.5, "remarks": "Ravi"}], "2026-01-05")
+    await post_rml_purchase(api, headers, [{"quantity_kg": 300, "pieces": 3, "sb_percentage": 2.5, "remarks": "Ravi"}], "2026-01-05")
+    lots = (await api.get("/api/lots", headers=headers)).json()
+    assert [lot["remaining_kg"] for lot in lots] == [500, 300]
+    return lots
+
+
+async def lot_balances(api, headers):
+    return [lot["remaining_kg"] for lot in (await api.get("/api/lots?open_only=false", headers=headers)).json()]
+
+
+async def test_refining_consumes_oldest_lot_first(api, operator, database, two_lots):
+    response = await post_refining(api, operator["headers"], [refining_batch(SKU, lead_ingot_kg=600)])
+    assert await lot_balances(api, operator["headers"]) == [0, 200]
+
+    entry = await database.entries.find_one({"id": response.json()["id"]})
+    allocations = entry["batches"][0]["lot_allocations"]
+    assert [(a["lot_id"], a["kg"]) for a in allocations] == [(two_lots[0]["id"], 500), (two_lots[1]["id"], 100)]
+
+
+async def test_sales_consume_lots_and_overdraw_is_unallocated(api, operator, database, two_lots):
+    await post_sale(api, operator["headers"], SKU, 900)
+    assert await lot_balances(api, operator["headers"]) == [0, 0]
+    sale = await database.sales.find_one({"sku_type": SKU})
+    assert sale["unallocated_kg"] == 100
+
+    await post_sale(api, operator["headers"], "Pure Lead", 10)
+    assert "lot_allocations" not in await database.sales.find_one({"sku_type": "Pure Lead"})
+
+
+async def test_deleting_consumers_returns_kg(api, admin, operator, two_lots):
+    entry_id = (await post_refining(api, operator["headers"], [refining_batch(SKU, lead_ingot_kg=600)])).json()["id"]
+    sale_id = (await post_sale(api, operator["headers"], SKU, 150)).json()["id"]
+    assert await lot_balances(api, operator["headers"]) == [0, 50]
+
+    # Kg go back to the lots they were drawn from
+    await api.delete(f"/api/admin/entries/{entry_id}", headers=admin["headers"])
+    assert await lot_balances(api, operator["headers"]) == [500, 150]
+    await api.delete(f"/api/admin/sales/{sale_id}", headers=admin["headers"])
+    assert await lot_balances(api, operator["headers"]) == [500, 300]
+
+
+async def test_deleting_purchase_removes_its_lots(api, admin, operator, database, two_lots):
+    await api.delete(f"/api/admin/rml-purchases/{two_lots[0]['entry_id']}", headers=admin["headers"])
+    assert await lot_balances(api, operator["headers"]) == [300]
+
+
+async def test_lot_fields(api, operator):
+    await post_santosh_receipt(api, operator["headers"], [{"quantity_kg": 300, "pieces": 3, "sb_percentage": 1.5, "remarks": "Kanpur"}], "2026-01-06")
+    lot = (await api.get("/api/lots?source=rml_received_santosh", headers=operator["headers"])).json()[0]
+    assert lot["sku"] == "SANTOSH-Kanpur, 1.5%, 06/01/2026"
+    assert lot["seller"] == "Kanpur"
+    assert lot["sb_percentage"] == 1.5
+    assert lot["inward_date"] == "2026-01-06"
+    assert lot["age_days"] > 0
+
+
+async def test_rebuild_matches_incremental_allocation(api, operator, database, two_lots):
+    headers = operator["headers"]
+    await post_refining(api, headers, [refining_batch(SKU, lead_ingot_kg=200)], "2026-01-07")
+    await post_sale(api, headers, SKU, 400, entry_date="2026-01-08")
+    await post_refining(api, headers, [refining_batch(SKU, lead_ingot_kg=100), refining_batch()], "2026-01-09")
+    before = await lot_balances(api, headers)
+
+    await database.lots.delete_many({})
+    result = await server.rebuild_lots()
+    assert result["lots"] == 2
+    assert await lot_balances(api, headers) == before == [0, 100]
+    refining = await database.entries.find({"entry_type": "refining"}).sort("timestamp", 1).to_list(None)
+    assert "lot_allocations" not in refining[1]["batches"][1]
@@ -0,0 +1,21 @@
+import pytest
+
+from profiler import wants_profile
+
+
+@pytest.mark.parametrize("query_string, expected", [
+    (b"profile=1", True),
+    (b"days=7&profile=true", True),
+    (b"profile=0", False),
+    (b"profile=10", False),
+    (b"noprofile=1", False),
+    (b"q=profile=1", False),
+    (b"", False),
+])
+def test_query_flag(query_string, expected):
+    assert wants_profile({"query_string": query_string, "headers": []}) is expected
+
+
+@pytest.mark.parametrize("value, expected", [(b"1", True), (b" true", True), (b"0", False)])
+def test_header_flag(value, expected):
+    assert wants_profile({"query_string": b"", "headers": [(b"x-profile", value)]}) is expected
@@ -0,0 +1,63 @@
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+from responses import dumps
+from tests.factories import post_refining, post_sale, refining_batch
+
+pytestmark = pytest.mark.anyio
+
+
+class Row(BaseModel):
+    sku_type: str
+    sb_percentage: Optional[float] = None
+    available_kg: float
+    timestamp: datetime
+
+
+def default_encoding(value) -> bytes:
+    """What FastAPI's JSONResponse produces after jsonable_encoder"""
+    return json.dumps(
+        jsonable_encoder(value), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+VALUES = [
+    {"timestamp": datetime(2026, 1, 8, 12, 0, 0)},
+    {"timestamp": datetime(2026, 1, 8, 12, 0, 0, 120000, tzinfo=timezone.utc)},
+    {"timestamp": datetime(2026, 1, 8, 17, 30, tzinfo=timezone(timedelta(hours=5, minutes=30)))},
+    {"floats": [0.1 + 0.2, 370.0, 1 / 3, 0.0001, 123456789.125, -0.0], "ints": [0, -3, 10**15]},
+    {"text": "Ravi, 2.5%, 05/01/2026", "unicode": "सीसा", "escape": "line\nbreak \"quoted\""},
+    {"nested": [{"batches": [{"pure_lead_kg": 470, "sb_percentage": None, "ok": True}]}]},
+    [Row(sku_type="Pure Lead", available_kg=365.0, timestamp=datetime(2026, 1, 9, 12, 0))],
+    Row(sku_type="High Lead", sb_percentage=1.5, available_kg=15.25,
+        timestamp=datetime(2026, 1, 9, 6, 45, 1, 5, tzinfo=timezone.utc)),
+]
+
+
+@pytest.mark.parametrize("value", VALUES)
+def test_dumps_matches_default_encoding(value):
+    assert dumps(value) == default_encoding(value)
+
+
+def test_exponent_floats_round_trip():
+    # orjson writes 2.5e-7 where json.dumps writes 2.5e-07; both parse to the same float
+    value = {"tiny": 2.5e-7, "huge": 1.5e17}
+    assert json.loads(dumps(value)) == json.loads(default_encoding(value))
+
+
+async def test_list_routes_keep_json_shape(api, operator):
+    await post_refining(api, operator["headers"], [refining_batch()], "2026-01-08")
+    await post_sale(api, operator["headers"], "Pure Lead", 12.5, entry_date="2026-01-09")
+
+    entries = await api.get("/api/entries", headers=operator["headers"])
+    assert entries.headers["content-type"] == "application/json"
+    assert entries.json()[0]["timestamp"] == "2026-01-08T12:00:00"
+
+    sales = (await api.get("/api/sales", headers=operator["headers"])).json()
+    assert sales[0]["quantity_kg"] == 12.5
+    assert sales[0]["timestamp"] == "2026-01-09T12:00:00"
@@ -0,0 +1,64 @@
+import pytest
+
+from tests.factories import post_refining, post_rml_purchase, post_sale, refining_batch
+
+pytestmark = pytest.mark.anyio
+
+SKU = "Ravi, 2.5%, 05/01/2026"
+
+
+async def analytics(api, headers, **params):
+    response = await api.get("/api/sales/analytics", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+@pytest.fixture
+async def sales(api, admin, operator):
+    await post_rml_purchase(api, operator["headers"], [{"quantity_kg": 900, "pieces": 9, "sb_percentage": 2.5, "remarks": "Ravi"}], "2026-01-05")
+    await post_refining(api, operator["headers"], [refining_batch(lead_ingot_kg=1000, pure_lead_kg=900)], "2026-01-06")
+    for sku_type, qty, party, day in [
+        ("Pure Lead", 100, "Exide Dealer", "2026-01-09"),
+        (SKU, 50, "Amara Batteries", "2026-01-10"),
+        ("Pure Lead", 75, "Exide Dealer", "2026-02-02"),
+        (SKU, 200, "Amara Batteries", "2026-02-03"),
+        ("Pure Lead", 30, "Local Trader", "2026-02-04"),
+    ]:
+        response = await post_sale(api, operator["headers"], sku_type, qty, party_name=party, entry_date=day)
+        assert response.status_code == 200, response.text
+
+
+async def test_sale_stores_registered_sku(api, operator, sales):
+    rows = (await api.get("/api/sales", headers=operator["headers"])).json()
+    sku_sales = [row for row in rows if row["sku_type"] == SKU]
+    assert all(row["sku_id"] and row["sb_percentage"] == 2.5 for row in sku_sales)
+    assert all(row["sku_id"] == "" and row["sb_percentage"] is None for row in rows if row["sku_type"] == "Pure Lead")
+
+
+async def test_totals_by_party_sku_month_and_sb(api, operator, sales):
+    result = await analytics(api, operator["headers"])
+    assert result["total_kg"] == 455
+    assert result["sale_count"] == 5
+    assert result["by_party"] == [
+        {"party_name": "Amara Batteries", "quantity_kg": 250, "sale_count": 2},
+        {"party_name": "Exide Dealer", "quantity_kg": 175, "sale_count": 2},
+        {"party_name": "Local Trader", "quantity_kg": 30, "sale_count": 1},
+    ]
+    assert {row["sku_type"]: row["quantity_kg"] for row in result["by_sku"]} == {SKU: 250, "Pure Lead": 205}
+    assert result["by_month"] == [
+        {"month": "2026-01", "quantity_kg": 150, "sale_count": 2},
+        {"month": "2026-02", "quantity_kg": 305, "sale_count": 3},
+    ]
+    assert {row["sb_percentage"]: row["quantity_kg"] for row in result["by_sb_percentage"]} == {2.5: 250, None: 205}
+
+
+async def test_top_customers_and_date_range(api, operator, sales):
+    result = await analytics(api, operator["headers"], top=1)
+    assert [row["party_name"] for row in result["top_customers"]] == ["Amara Batteries"]
+
+    february = await analytics(api, operator["headers"], start_date="2026-02-01", end_date="2026-02-28")
+    assert february["total_kg"] == 305
+    assert [row["party_name"] for row in february["top_customers"]] == ["Amara Batteries", "Exide Dealer", "Local Trader"]
+
+    empty = await analytics(api, operator["headers"], start_date="2027-01-01")
+    assert empty == {"total_kg": 0, "sale_count": 0, "by_party": [], "by_sku": [], "by_month": [], "by_sb_percentage": [], "top_customers": []}
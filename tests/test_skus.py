@@ -0,0 +1,129 @@
+import pytest
+
+import server
+from tests.factories import post_refining, post_rml_purchase, post_santosh_receipt, refining_batch
+
+pytestmark = pytest.mark.anyio
+
+
+def purchase(remarks, sb=2.5, quantity_kg=100, **fields):
+    return {"quantity_kg": quantity_kg, "pieces": 2, "sb_percentage": sb, "remarks": remarks, **fields}
+
+
+async def search(api, headers, **params):
+    return (await api.get("/api/skus", params=params, headers=headers)).json()
+
+
+async def test_purchases_register_parsed_skus(api, operator, database):
+    headers = operator["headers"]
+    await post_rml_purchase(api, headers, [purchase("Gupta Metals")], "2026-01-05")
+    await post_santosh_receipt(api, headers, [purchase("Kanpur", sb=1.5)], "2026-01-05")
+
+    skus = {sku["source"]: sku for sku in await search(api, headers)}
+    assert skus["rml_purchase"]["label"] == "Gupta Metals, 2.5%, 05/01/2026"
+    assert skus["rml_received_santosh"]["label"] == "SANTOSH-Kanpur, 1.5%, 05/01/2026"
+    # Both sources store the inward date the same way
+    assert skus["rml_purchase"]["inward_date"] == skus["rml_received_santosh"]["inward_date"] == "2026-01-05"
+    assert skus["rml_purchase"]["seller"] == "Gupta Metals"
+
+    entry = await database.rml_purchases.find_one({})
+    assert entry["batches"][0]["sku_id"] == skus["rml_purchase"]["id"]
+    lot = await database.lots.find_one({"source": "rml_purchase"})
+    assert lot["sku_id"] == skus["rml_purchase"]["id"]
+
+
+async def test_same_attributes_reuse_the_sku(api, operator, database):
+    headers = operator["headers"]
+    await post_rml_purchase(api, headers, [purchase("Gupta Metals")], "2026-01-05")
+    await post_rml_purchase(api, headers, [purchase("gupta  metals"), purchase("Gupta Metals", sb=3.0)], "2026-01-05")
+
+    assert await database.skus.count_documents({}) == 2
+    first, second = await database.rml_purchases.find({}).sort("timestamp", 1).to_list(None)
+    assert first["batches"][0]["sku_id"] == second["batches"][0]["sku_id"]
+
+
+async def test_distinct_sellers_with_one_remark_stay_apart(api, operator, database):
+    headers = operator["headers"]
+    await post_rml_purchase(api, headers, [purchase("Jain", seller="Jain Scrap")], "2026-01-05")
+    await post_rml_purchase(api, headers, [purchase("Jain", seller="Jain Alloys")], "2026-01-05")
+
+    labels = [sku["label"] for sku in await search(api, headers, q="jain")]
+    assert labels == ["Jain, 2.5%, 05/01/2026", "Jain, 2.5%, 05/01/2026 #2"]
+    lots = (await api.get("/api/lots", headers=headers)).json()
+    assert [lot["sku"] for lot in lots] == labels
+
+
+async def test_prefix_search(api, operator):
+    headers = operator["headers"]
+    await post_rml_purchase(api, headers, [purchase("Gupta Metals"), purchase("Shree Traders")], "2026-01-05")
+    await post_santosh_receipt(api, headers, [purchase("Gupta Unit 2")], "2026-01-06")
+
+    assert [sku["seller"] for sku in await search(api, headers, q="GUP")] == ["Gupta Metals", "Gupta Unit 2"]
+    assert [sku["seller"] for sku in await search(api, headers, q="santosh-g")] == ["Gupta Unit 2"]
+    assert [sku["seller"] for sku in await search(api, headers, q="gupta", source="rml_purchase")] == ["Gupta Metals"]
+    assert await search(api, headers, q="metals") == []
+    assert await search(api, headers, q="(") == []
+    assert len(await search(api, headers, limit=1)) == 1
+
+
+async def test_backfill_links_existing_batches(database):
+    await database.rml_purchases.insert_one({
+        "id": "legacy", "timestamp": "2025-12-31T18:45:00+00:00",
+        "batches": [{"sku": "RML, 2.0%, 01/01/2026", "remarks": "", "sb_percentage": 2.0, "quantity_kg": 50, "pieces": 1}],
+    })
+    result = await server.backfill_skus()
+    assert result == {"skus": 1, "entries": 1, "sales": 0}
+
+    sku = await database.skus.find_one({}, {"_id": 0})
+    assert (sku["label"], sku["seller"], sku["inward_date"]) == ("RML, 2.0%, 01/01/2026", "RML", "2026-01-01")
+    entry = await database.rml_purchases.find_one({"id": "legacy"})
+    assert entry["batches"][0]["sku_id"] == sku["id"]
+    assert await server.backfill_skus() == {"skus": 1, "entries": 0, "sales": 0}
+
+
+async def test_backfill_reads_legacy_santosh_dates(database):
+    await database.rml_received_santosh.insert_one({
+        "id": "legacy", "timestamp": "2025-12-31T18:45:00+00:00",
+        "batches": [{"sku": "SANTOSH-Kanpur, 1.5%, 2026-01-01", "remarks": "Kanpur", "sb_percentage": 1.5, "quantity_kg": 50, "pieces": 1}],
+    })
+    await server.backfill_skus()
+
+    sku = await database.skus.find_one({}, {"_id": 0})
+    assert (sku["label"], sku["seller"], sku["inward_date"]) == ("SANTOSH-Kanpur, 1.5%, 2026-01-01", "Kanpur", "2026-01-01")
+
+
+async def test_refining_batches_store_source_kind(api, operator, database):
+    headers = operator["headers"]
+    await post_rml_purchase(api, headers, [purchase("Gupta Metals", quantity_kg=500)], "2026-01-05")
+    await post_santosh_receipt(api, headers, [purchase("Kanpur", quantity_kg=500)], "2026-01-05")
+    skus = {sku["source"]: sku for sku in await search(api, headers)}
+    sources = ["manual", "SANTOSH", skus["rml_purchase"]["label"], skus["rml_received_santosh"]["label"], "Old Seller, 2%, 01/01/2025"]
+    await post_refining(api, headers, [refining_batch(source, lead_ingot_kg=100) for source in sources])
+
+    entry = await database.entries.find_one({"entry_type": "refining"})
+    assert [(batch["source_kind"], batch["sku_id"]) for batch in entry["batches"]] == [
+        ("manual", ""),
+        ("santosh", ""),
+        ("rml_purchase", skus["rml_purchase"]["id"]),
+        ("rml_received_santosh", skus["rml_received_santosh"]["id"]),
+        ("rml_purchase", ""),
+    ]
+
+
+async def test_backfill_classifies_legacy_refining_batches(api, operator, database):
+    headers = operator["headers"]
+    await post_rml_purchase(api, headers, [purchase("Gupta Metals", quantity_kg=500)], "2026-01-05")
+    label = (await search(api, headers))[0]["label"]
+    await database.entries.insert_one({
+        "id": "legacy", "entry_type": "refining", "timestamp": "2026-01-06T12:00:00",
+        "batches": [{"input_source": label, "lead_ingot_kg": 200, "pure_lead_kg": 190},
+                    {"input_source": "SANTOSH", "lead_ingot_kg": 50, "pure_lead_kg": 45}],
+    })
+
+    assert await server.backfill_source_kinds() == 1
+    entry = await database.entries.find_one({"id": "legacy"})
+    assert [batch["source_kind"] for batch in entry["batches"]] == ["rml_purchase", "santosh"]
+    assert await server.backfill_source_kinds() == 0
+
+    summary = (await api.get("/api/summary", headers=headers)).json()
+    assert summary["rml_stock"] == 300